@@ -0,0 +1,412 @@
+#!/usr/bin/env python3
+"""
+エンドツーエンド負荷テスト
+fake_openai.py を OpenAI API の代わりに起動し、合成データを投入したサーバーに対して
+/api/* の各ルートを複数クライアントから同時に呼び出し、スループットと p50/p95/p99 を計測します
+
+使い方:
+    python bench_load.py                              # 全シナリオを10秒ずつ計測
+    python bench_load.py --scenarios data_tasks,generate --duration 30 --clients 16
+    python bench_load.py --output baseline.json       # 結果を保存
+    python bench_load.py --baseline baseline.json     # 保存した結果と比較 (悪化したら終了コード1)
+"""
+
+import argparse
+import io
+import json
+import os
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import wave
+from pathlib import Path
+
+from bench_server import SERVER_PATH, find_free_port, percentile, wait_for_server
+
+FAKE_OPENAI_PATH = Path(__file__).resolve().parent / 'fake_openai.py'
+
+CATEGORIES = ['work', 'research', 'study', 'private']
+PRIORITIES = ['high', 'medium', 'low']
+TRANSCRIPT_LINE = "えーと、それでは来週の発表資料について、担当を決めていきたいと思います。"
+
+
+# ===================================
+# 合成データ
+# ===================================
+
+def make_tasks(count):
+    return [{
+        'id': f'task_{i}',
+        'title': f'負荷テスト用タスク {i}',
+        'category': CATEGORIES[i % 4],
+        'priority': PRIORITIES[i % 3],
+        'deadline': f'2026-{(i % 12) + 1:02d}-15',
+        'completed': i % 5 == 0,
+        'createdAt': '2026-01-01T00:00:00.000Z',
+    } for i in range(count)]
+
+
+def make_projects(count, subtasks):
+    return [{
+        'id': f'proj_{i}',
+        'name': f'負荷テスト用プロジェクト {i}',
+        'icon': '📊',
+        'category': CATEGORIES[i % 4],
+        'status': 'active',
+        'deadline': f'2026-{(i % 12) + 1:02d}-28',
+        'tasks': [{
+            'id': f'subtask_{i}_{j}',
+            'title': f'サブタスク {j}',
+            'deadlineType': 'month',
+            'deadline': f'2026-{(j % 12) + 1:02d}',
+            'priority': PRIORITIES[j % 3],
+            'status': 'pending',
+            'completed': j % 4 == 0,
+        } for j in range(subtasks)],
+    } for i in range(count)]
+
+
+def make_planner(weeks):
+    return {
+        'yearlyGoals': [{'id': f'goal_{i}', 'title': f'年間目標 {i}'} for i in range(5)],
+        'weeklyTasks': {
+            f'2026-W{w + 1:02d}': [{'id': f'wt_{w}_{j}', 'title': f'週間タスク {j}', 'completed': False} for j in range(5)]
+            for w in range(weeks)
+        },
+    }
+
+
+def make_transcript(chars):
+    return (TRANSCRIPT_LINE * (chars // len(TRANSCRIPT_LINE) + 1))[:chars]
+
+
+def make_wav(seconds):
+    """無音に近いWAV (16kHz/16bit/モノラル) を作る"""
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(16000)
+        w.writeframes(struct.pack('<h', 1) * int(16000 * seconds))
+    return buffer.getvalue()
+
+
+# ===================================
+# HTTP
+# ===================================
+
+def request(base_url, method, path, body=None, headers=None, timeout=300):
+    """リクエストを送り (ステータス, 本文) を返す。HTTPエラーも例外にしない"""
+    if isinstance(body, (dict, list)):
+        body = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        headers = {'Content-Type': 'application/json', **(headers or {})}
+    req = urllib.request.Request(f'{base_url}{path}', data=body, method=method, headers=headers or {})
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as response:
+            return response.status, response.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.read()
+
+
+def multipart(field, filename, content_type, data):
+    boundary = 'benchloadboundary'
+    body = (
+        f'--{boundary}\r\nContent-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+        f'Content-Type: {content_type}\r\n\r\n'
+    ).encode() + data + f'\r\n--{boundary}--\r\n'.encode()
+    return body, {'Content-Type': f'multipart/form-data; boundary={boundary}'}
+
+
+# ===================================
+# シナリオ (1回分のリクエストを実行してステータスを返す)
+# ===================================
+
+class Scenarios:
+    def __init__(self, base_url, args):
+        self.base_url = base_url
+        self.args = args
+        self.transcript = make_transcript(args.transcript_chars)
+        self.wav = make_wav(args.audio_seconds)
+        self.counter = 0
+        self.lock = threading.Lock()
+
+    def next_id(self):
+        with self.lock:
+            self.counter += 1
+            return self.counter
+
+    def unique(self, text):
+        # AI応答キャッシュに当たらないように入力を毎回変える
+        return f'{text} #{self.next_id()}'
+
+    def call(self, method, path, body=None, headers=None):
+        return request(self.base_url, method, path, body, headers)[0]
+
+    def data_all(self):
+        return self.call('GET', '/api/data')
+
+    def data_tasks(self):
+        return self.call('GET', '/api/data/tasks')
+
+    def data_projects(self):
+        return self.call('GET', '/api/data/projects')
+
+    def record_put(self):
+        i = self.next_id() % self.args.tasks
+        return self.call('PUT', f'/api/data/tasks/task_{i}', {
+            'title': f'更新されたタスク {i}', 'category': 'work', 'priority': 'high', 'completed': False
+        })
+
+    def record_patch(self):
+        i = self.next_id() % self.args.tasks
+        return self.call('PATCH', f'/api/data/tasks/task_{i}', {'completed': True})
+
+    def record_ops(self):
+        i = self.next_id()
+        return self.call('POST', '/api/data/tasks/ops', [
+            {'op': 'put', 'record': {'id': f'bench_{i}', 'title': f'一時タスク {i}', 'category': 'work'}},
+            {'op': 'patch', 'id': f'bench_{i}', 'fields': {'completed': True}},
+            {'op': 'delete', 'id': f'bench_{i}'},
+        ])
+
+    def save_planner(self):
+        return self.call('POST', '/api/data/planner', make_planner(self.args.planner_weeks))
+
+    def metrics(self):
+        return self.call('GET', '/api/metrics')
+
+    def generate(self):
+        return self.call('POST', '/api/generate', {
+            'goal': self.unique('TOEIC 800点を取る'), 'deadline': '2026-12-31', 'level': 'beginner'
+        })
+
+    def generate_stream(self):
+        return self.call('POST', '/api/generate', {
+            'goal': self.unique('TOEIC 800点を取る'), 'deadline': '2026-12-31', 'stream': True
+        })
+
+    def summarize(self):
+        return self.call('POST', '/api/summarize', {
+            'text': self.unique(self.transcript), 'type': 'summary', 'title': '定例会議'
+        })
+
+    def summarize_all(self):
+        return self.call('POST', '/api/summarize', {
+            'text': self.unique(self.transcript), 'type': 'all', 'title': '定例会議', 'participants': 'A, B'
+        })
+
+    def format_transcript(self):
+        return self.call('POST', '/api/format-transcript', {'text': self.unique(self.transcript)})
+
+    def transcribe(self):
+        body, headers = multipart('audio', 'bench.wav', 'audio/wav', self.wav)
+        return self.call('POST', '/api/transcribe', body, headers)
+
+    def transcribe_async(self):
+        """ジョブとして投入し、完了するまでポーリングする"""
+        body, headers = multipart('audio', 'bench.wav', 'audio/wav', self.wav)
+        status, response = request(self.base_url, 'POST', '/api/transcribe', body,
+                                   {**headers, 'Prefer': 'respond-async'})
+        if status != 202:
+            return status
+        job_id = json.loads(response)['id']
+        while True:
+            status, response = request(self.base_url, 'GET', f'/api/jobs/{job_id}')
+            if status != 200:
+                return status
+            job = json.loads(response)
+            if job['status'] == 'done':
+                return 200
+            if job['status'] == 'error':
+                return 500
+            time.sleep(0.05)
+
+
+SCENARIOS = [
+    'data_all', 'data_tasks', 'data_projects', 'record_put', 'record_patch', 'record_ops', 'save_planner',
+    'metrics', 'generate', 'generate_stream', 'summarize', 'summarize_all', 'format_transcript',
+    'transcribe', 'transcribe_async',
+]
+
+
+def run_scenario(scenarios, name, clients, duration, max_requests):
+    """clients 個のスレッドから同じシナリオを繰り返し実行する"""
+    fn = getattr(scenarios, name)
+    latencies = []
+    statuses = {}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+    remaining = [max_requests]
+
+    def client():
+        while time.perf_counter() < deadline:
+            with lock:
+                if max_requests:
+                    if remaining[0] <= 0:
+                        return
+                    remaining[0] -= 1
+            start = time.perf_counter()
+            try:
+                status = fn()
+            except Exception:
+                status = 'exception'
+            elapsed = (time.perf_counter() - start) * 1000
+            with lock:
+                statuses[status] = statuses.get(status, 0) + 1
+                if isinstance(status, int) and status < 400:
+                    latencies.append(elapsed)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=client, daemon=True) for _ in range(clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - start
+    errors = sum(count for status, count in statuses.items() if not isinstance(status, int) or status >= 400)
+    return {
+        'n': len(latencies),
+        'errors': errors,
+        'statuses': {str(status): count for status, count in sorted(statuses.items(), key=str)},
+        'throughput': len(latencies) / wall if wall > 0 else 0.0,
+        'p50': percentile(latencies, 50),
+        'p95': percentile(latencies, 95),
+        'p99': percentile(latencies, 99),
+    }
+
+
+def report(name, result):
+    print(f"{name:<18} n={result['n']:<6} err={result['errors']:<4} "
+          f"{result['throughput']:8.1f} req/s "
+          f"p50={result['p50']:8.2f}ms p95={result['p95']:8.2f}ms p99={result['p99']:8.2f}ms")
+
+
+def compare(results, baseline, tolerance, min_delta):
+    """ベースラインと比べて p95 やスループットが悪化したシナリオを返す"""
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base or not result['n'] or not base['n']:
+            continue
+        if result['p95'] > base['p95'] * (1 + tolerance) and result['p95'] - base['p95'] > min_delta:
+            regressions.append(f"{name}: p95 {base['p95']:.2f}ms → {result['p95']:.2f}ms")
+        if result['throughput'] < base['throughput'] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {base['throughput']:.1f} → {result['throughput']:.1f} req/s")
+        if result['errors'] > base['errors']:
+            regressions.append(f"{name}: errors {base['errors']} → {result['errors']}")
+    return regressions
+
+
+def start_process(args, env, cwd):
+    return subprocess.Popen(args, env=env, cwd=str(cwd), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Task Command Center エンドツーエンド負荷テスト')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help='実行するシナリオ (カンマ区切り)')
+    parser.add_argument('--clients', type=int, default=8, help='同時に実行するクライアント数')
+    parser.add_argument('--duration', type=float, default=10.0, help='シナリオごとの計測秒数')
+    parser.add_argument('--requests', type=int, default=0, help='シナリオごとの最大リクエスト数 (0 = 時間のみで打ち切り)')
+    parser.add_argument('--tasks', type=int, default=2000, help='投入するタスク数')
+    parser.add_argument('--projects', type=int, default=100, help='投入するプロジェクト数')
+    parser.add_argument('--subtasks', type=int, default=20, help='プロジェクトあたりのサブタスク数')
+    parser.add_argument('--planner-weeks', type=int, default=52, help='プランナーの週数')
+    parser.add_argument('--transcript-chars', type=int, default=20000, help='要約・整形に使う書き起こしの文字数')
+    parser.add_argument('--audio-seconds', type=float, default=30.0, help='書き起こしに使う音声の長さ(秒)')
+    parser.add_argument('--workers', type=int, default=None, help='サーバーのワーカー数 (TASK_DASHBOARD_MAX_WORKERS)')
+    parser.add_argument('--storage', default=None, help='保存先 (TASK_DASHBOARD_STORAGE)')
+    parser.add_argument('--llm-cache', action='store_true', help='AI応答キャッシュを有効にしたまま計測')
+    parser.add_argument('--transcript-cache', action='store_true',
+                        help='書き起こしキャッシュを有効にしたまま計測 (同じ音声を送るため2回目以降はWhisperを呼ばない)')
+    parser.add_argument('--upstream-latency', type=float, default=0.3, help='疑似OpenAI APIの応答遅延(秒)')
+    parser.add_argument('--upstream-error-rate', type=float, default=0.0, help='疑似OpenAI APIが 500 を返す割合')
+    parser.add_argument('--upstream-rpm', type=int, default=0, help='疑似OpenAI APIのリクエスト数上限/分')
+    parser.add_argument('--upstream-tpm', type=int, default=0, help='疑似OpenAI APIのトークン数上限/分')
+    parser.add_argument('--output', help='結果をJSONで保存するパス')
+    parser.add_argument('--baseline', help='比較するベースライン (--output で保存したJSON)')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='悪化とみなす割合 (デフォルト: 20%%)')
+    parser.add_argument('--min-delta', type=float, default=5.0, help='悪化とみなす p95 の最小差(ms)')
+    args = parser.parse_args()
+
+    names = [name.strip() for name in args.scenarios.split(',') if name.strip()]
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        print(f"❌ 不明なシナリオ: {', '.join(unknown)} (利用可能: {', '.join(SCENARIOS)})")
+        return 2
+
+    upstream_port = find_free_port()
+    port = find_free_port()
+    base_url = f'http://127.0.0.1:{port}'
+    data_dir = tempfile.mkdtemp(prefix='task_dashboard_load_')
+
+    upstream = start_process([
+        sys.executable, str(FAKE_OPENAI_PATH), '--port', str(upstream_port),
+        '--latency', str(args.upstream_latency), '--error-rate', str(args.upstream_error_rate),
+        '--rpm', str(args.upstream_rpm), '--tpm', str(args.upstream_tpm),
+    ], dict(os.environ), FAKE_OPENAI_PATH.parent)
+
+    env = dict(os.environ)
+    env['TASK_DASHBOARD_PORT'] = str(port)
+    env['TASK_DASHBOARD_DATA_DIR'] = data_dir
+    env['OPENAI_BASE_URL'] = f'http://127.0.0.1:{upstream_port}/v1'
+    env['OPENAI_API_KEY'] = 'bench-load'
+    if args.workers is not None:
+        env['TASK_DASHBOARD_MAX_WORKERS'] = str(args.workers)
+    if args.storage:
+        env['TASK_DASHBOARD_STORAGE'] = args.storage
+    if not args.llm_cache:
+        env['TASK_DASHBOARD_LLM_CACHE_TTL'] = '0'
+    if not args.transcript_cache:
+        env['TASK_DASHBOARD_TRANSCRIPT_CACHE_MB'] = '0'
+    server = start_process([sys.executable, str(SERVER_PATH)], env, SERVER_PATH.parent)
+
+    try:
+        if not wait_for_server(base_url):
+            print("❌ サーバーが起動しませんでした")
+            return 1
+
+        request(base_url, 'POST', '/api/data/tasks', make_tasks(args.tasks))
+        request(base_url, 'POST', '/api/data/projects', make_projects(args.projects, args.subtasks))
+        request(base_url, 'POST', '/api/data/planner', make_planner(args.planner_weeks))
+
+        print("=" * 80)
+        print(f"📊 clients={args.clients} duration={args.duration}s tasks={args.tasks} "
+              f"projects={args.projects}x{args.subtasks} upstream_latency={args.upstream_latency}s")
+        print("=" * 80)
+
+        scenarios = Scenarios(base_url, args)
+        results = {}
+        for name in names:
+            results[name] = run_scenario(scenarios, name, args.clients, args.duration, args.requests)
+            report(name, results[name])
+
+        if args.output:
+            Path(args.output).write_text(json.dumps({
+                'config': {key: value for key, value in vars(args).items() if key not in ('output', 'baseline')},
+                'results': results,
+            }, ensure_ascii=False, indent=2), encoding='utf-8')
+            print(f"💾 結果を保存しました: {args.output}")
+
+        if args.baseline:
+            baseline = json.loads(Path(args.baseline).read_text(encoding='utf-8'))['results']
+            regressions = compare(results, baseline, args.tolerance, args.min_delta)
+            if regressions:
+                print("⚠️ ベースラインより悪化しています:")
+                for line in regressions:
+                    print(f"   - {line}")
+                return 1
+            print("✅ ベースラインからの悪化はありません")
+        return 0
+    finally:
+        for process in (server, upstream):
+            process.terminate()
+            process.wait(timeout=10)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
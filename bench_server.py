@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+サーバー並行処理ベンチマーク
+長時間かかるAPIリクエスト (書き起こし等) を実行中に、
+データAPI (/api/data/*) のレイテンシがどう変化するかを計測します
+
+使い方:
+    python bench_server.py                  # デフォルト設定で計測
+    python bench_server.py --workers 1      # 旧来の単一スレッド相当と比較
+"""
+
+import argparse
+import json
+import os
+import select
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from pathlib import Path
+
+SERVER_PATH = Path(__file__).resolve().parent / 'server.py'
+
+
+def find_free_port():
+    """空いているポート番号を取得"""
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_for_server(base_url, timeout=15):
+    """サーバーが応答するまで待機"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with urllib.request.urlopen(f'{base_url}/api/data/planner', timeout=1):
+                return True
+        except Exception:
+            time.sleep(0.1)
+    return False
+
+
+def seed_tasks(base_url, count):
+    """計測用のタスクデータを投入"""
+    tasks = [{
+        'id': f'task_{i}',
+        'title': f'ベンチマーク用タスク {i}',
+        'category': ['work', 'research', 'study', 'private'][i % 4],
+        'priority': ['high', 'medium', 'low'][i % 3],
+        'deadline': f'2026-{(i % 12) + 1:02d}-15',
+        'completed': i % 5 == 0,
+    } for i in range(count)]
+    req = urllib.request.Request(
+        f'{base_url}/api/data/tasks',
+        data=json.dumps(tasks, ensure_ascii=False).encode('utf-8'),
+        headers={'Content-Type': 'application/json'}
+    )
+    with urllib.request.urlopen(req, timeout=30) as response:
+        response.read()
+
+
+def hold_slow_upload(port, duration, stop_event, results):
+    """
+    書き起こしAPIへ音声を少しずつ送り、ハンドラを長時間占有する
+    (ffmpeg変換やWhisper待ちでワーカーが塞がる状況の再現)
+    送信中にサーバーが応答した場合 (占有できなかった場合) はそのステータスコードを results に追加する
+    """
+    boundary = 'benchboundary'
+    body_size = 10 * 1024 * 1024
+    try:
+        sock = socket.create_connection(('127.0.0.1', port), timeout=duration + 30)
+        sock.sendall((
+            'POST /api/transcribe HTTP/1.1\r\n'
+            'Host: 127.0.0.1\r\n'
+            f'Content-Type: multipart/form-data; boundary={boundary}\r\n'
+            f'Content-Length: {body_size}\r\n'
+            '\r\n'
+        ).encode())
+        deadline = time.time() + duration
+        while time.time() < deadline and not stop_event.is_set():
+            if select.select([sock], [], [], 0)[0]:
+                status_line = sock.recv(1024).split(b'\r\n', 1)[0].split()
+                results.append(int(status_line[1]) if len(status_line) > 1 else 0)
+                break
+            sock.sendall(b'\0' * 64)
+            time.sleep(0.2)
+        sock.close()
+    except OSError as e:
+        # 応答後にサーバーが接続を閉じた場合など
+        results.append(f'{type(e).__name__}')
+
+
+def measure_latencies(base_url, paths, count):
+    """データAPIを順番に叩いてレイテンシ(ms)を計測"""
+    latencies = []
+    errors = 0
+    for i in range(count):
+        path = paths[i % len(paths)]
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(f'{base_url}{path}', timeout=30) as response:
+                response.read()
+            latencies.append((time.perf_counter() - start) * 1000)
+        except Exception:
+            errors += 1
+    return latencies, errors
+
+
+def percentile(values, pct):
+    """パーセンタイル値を計算"""
+    if not values:
+        return float('nan')
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def report(label, latencies, errors):
+    """計測結果を表示"""
+    print(f"{label:<24} n={len(latencies):<5} err={errors:<3} "
+          f"p50={percentile(latencies, 50):8.2f}ms "
+          f"p95={percentile(latencies, 95):8.2f}ms "
+          f"p99={percentile(latencies, 99):8.2f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Task Command Center 並行処理ベンチマーク')
+    parser.add_argument('--workers', type=int, default=16, help='サーバーのワーカー数 (TASK_DASHBOARD_MAX_WORKERS)')
+    parser.add_argument('--heavy', type=int, default=None, help='長時間処理の同時実行上限 (TASK_DASHBOARD_MAX_HEAVY)')
+    parser.add_argument('--slow-clients', type=int, default=4, help='同時に実行する長時間リクエスト数')
+    parser.add_argument('--hold', type=float, default=10.0, help='長時間リクエストの占有秒数')
+    parser.add_argument('--requests', type=int, default=200, help='計測するデータAPIリクエスト数')
+    parser.add_argument('--tasks', type=int, default=2000, help='投入するタスク数')
+    args = parser.parse_args()
+
+    port = find_free_port()
+    base_url = f'http://127.0.0.1:{port}'
+    data_dir = tempfile.mkdtemp(prefix='task_dashboard_bench_')
+
+    env = dict(os.environ)
+    env['TASK_DASHBOARD_PORT'] = str(port)
+    env['TASK_DASHBOARD_DATA_DIR'] = data_dir
+    env['TASK_DASHBOARD_MAX_WORKERS'] = str(args.workers)
+    # 書き起こしAPIは APIキーがないと本文を読む前にエラーを返すため、ダミーのキーで占有させる
+    # (本文を送り切らないので OpenAI API は呼ばれない)
+    env['OPENAI_API_KEY'] = env.get('OPENAI_API_KEY') or 'bench-dummy'
+    if args.heavy is not None:
+        env['TASK_DASHBOARD_MAX_HEAVY'] = str(args.heavy)
+
+    server = subprocess.Popen(
+        [sys.executable, str(SERVER_PATH)],
+        env=env, cwd=str(SERVER_PATH.parent),
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        if not wait_for_server(base_url):
+            print("❌ サーバーが起動しませんでした")
+            return 1
+
+        seed_tasks(base_url, args.tasks)
+        paths = ['/api/data', '/api/data/tasks', '/api/data/projects', '/api/data/planner']
+
+        print("=" * 50)
+        print(f"📊 workers={args.workers} slow_clients={args.slow_clients} tasks={args.tasks}")
+        print("=" * 50)
+
+        latencies, errors = measure_latencies(base_url, paths, args.requests)
+        report('idle', latencies, errors)
+
+        stop_event = threading.Event()
+        rejected = []
+        holders = [
+            threading.Thread(target=hold_slow_upload, args=(port, args.hold, stop_event, rejected), daemon=True)
+            for _ in range(args.slow_clients)
+        ]
+        for t in holders:
+            t.start()
+        time.sleep(0.5)  # 長時間リクエストがワーカーを確保するまで待つ
+
+        latencies, errors = measure_latencies(base_url, paths, args.requests)
+        report('during slow requests', latencies, errors)
+
+        stop_event.set()
+        for t in holders:
+            t.join()
+
+        # 同時実行上限による 503 は想定どおり。それ以外で占有できなかった場合は計測になっていない
+        unexpected = [status for status in rejected if status != 503]
+        if rejected:
+            print(f"長時間リクエストのうち {len(rejected)} 件が占有前に応答されました: {rejected}")
+        if unexpected or len(rejected) >= len(holders) > 0:
+            print("❌ 長時間リクエストでワーカーを占有できなかったため、計測結果は無効です")
+            return 1
+        return 0
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
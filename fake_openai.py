@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+"""
+OpenAI API のローカル代替サーバー (テスト・ベンチマーク用)
+chat/completions (ストリーミング対応) と audio/transcriptions を、
+遅延・エラー・レート制限を設定可能な疑似応答で返します
+
+使い方:
+    python fake_openai.py --port 9000
+    OPENAI_BASE_URL=http://127.0.0.1:9000/v1 OPENAI_API_KEY=dummy python server.py
+
+    python fake_openai.py --latency 1.0 --jitter 0.3     # 応答を遅くする
+    python fake_openai.py --error-rate 0.1               # 10% を 500 エラーにする
+    python fake_openai.py --rpm 60 --tpm 100000          # レート制限 (429) を再現する
+
+GET /stats で受け付けたリクエスト数などを確認できます
+"""
+
+import argparse
+import http.server
+import json
+import random
+import socketserver
+import sys
+import threading
+import time
+
+# 書き起こしの疑似テキスト (5秒ごとに1文)
+TRANSCRIPT_SENTENCES = [
+    "それでは定例ミーティングを始めます。",
+    "先週のタスクの進捗を確認していきましょう。",
+    "資料の作成は金曜日までに終わらせる予定です。",
+    "次回までに見積もりを出しておいてください。",
+    "その件については来週あらためて相談しましょう。",
+]
+# WAV (16kHz/16bit/モノラル) 換算で1秒あたりのバイト数
+AUDIO_BYTES_PER_SECOND = 32000
+MP3_BYTES_PER_SECOND = 8000
+SEGMENT_SECONDS = 5
+
+
+def estimate_tokens(text):
+    """トークン数の概算 (server.py と同じ目安)"""
+    ascii_chars = sum(1 for c in text if c.isascii())
+    return ascii_chars // 4 + (len(text) - ascii_chars) + 1
+
+
+class RateLimiter:
+    """1分あたりのリクエスト数・トークン数の上限 (トークンバケット)。0 は無制限"""
+
+    def __init__(self, rpm, tpm):
+        self.limits = {'requests': rpm, 'tokens': tpm}
+        self.levels = {'requests': float(rpm), 'tokens': float(tpm)}
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        for kind, limit in self.limits.items():
+            if limit:
+                self.levels[kind] = min(limit, self.levels[kind] + (now - self.updated_at) * limit / 60)
+        self.updated_at = now
+
+    def acquire(self, tokens):
+        """
+        枠があれば消費して (True, ヘッダー) を返す。なければ (False, ヘッダー)
+        ヘッダーは OpenAI と同じ x-ratelimit-* 形式
+        """
+        with self.lock:
+            self._refill(time.monotonic())
+            need = {'requests': 1, 'tokens': tokens}
+            allowed = all(not limit or self.levels[kind] >= min(need[kind], limit)
+                          for kind, limit in self.limits.items())
+            if allowed:
+                for kind, limit in self.limits.items():
+                    if limit:
+                        self.levels[kind] -= min(need[kind], limit)
+            headers = {}
+            retry_after = 0.0
+            for kind, limit in self.limits.items():
+                if not limit:
+                    continue
+                level = max(0.0, self.levels[kind])
+                reset = (limit - level) * 60 / limit
+                headers[f'x-ratelimit-limit-{kind}'] = str(limit)
+                headers[f'x-ratelimit-remaining-{kind}'] = str(int(level))
+                headers[f'x-ratelimit-reset-{kind}'] = f'{reset:.3f}s'
+                if not allowed:
+                    retry_after = max(retry_after, (min(need[kind], limit) - level) * 60 / limit)
+            if not allowed:
+                headers['retry-after-ms'] = str(int(retry_after * 1000) + 1)
+            return allowed, headers
+
+
+class Stats:
+    """受け付けたリクエストの集計 (GET /stats)"""
+
+    def __init__(self):
+        self.counts = {}
+        self.lock = threading.Lock()
+
+    def inc(self, key):
+        with self.lock:
+            self.counts[key] = self.counts.get(key, 0) + 1
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.counts)
+
+
+def fake_chat_content(payload):
+    """リクエストに合わせた疑似応答本文を作る"""
+    messages = payload.get('messages', [])
+    user_text = next((m.get('content') or '' for m in reversed(messages) if m.get('role') == 'user'), '')
+    if (payload.get('response_format') or {}).get('type') == 'json_object':
+        # AI計画・会議要約のどちらの形式でも読めるように共通のキーを返す
+        return json.dumps({
+            "tasks": [
+                {"title": f"ステップ{i + 1}: 調査と準備", "description": "疑似応答のタスク",
+                 "priority": "medium", "estimatedHours": 2, "week": i + 1}
+                for i in range(5)
+            ],
+            "summary": "会議の要約（疑似応答）",
+            "minutes": "# 議事録（疑似応答）\n\n- 議題1\n- 議題2",
+            "actions": [
+                {"task": "資料を作成する", "assignee": "担当者A", "deadline": "来週", "priority": "high"}
+            ],
+        }, ensure_ascii=False)
+    # 書き起こしの整形などは入力とほぼ同じ長さのテキストを返す
+    marker = '\n\n'
+    body = user_text.split(marker, 1)[1] if marker in user_text else user_text
+    limit = int(payload.get('max_tokens') or 0)
+    return body[:limit * 2] if limit else body
+
+
+class FakeOpenAIHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    config = None
+    limiter = None
+    stats = None
+
+    def log_message(self, format, *args):
+        if self.config.verbose:
+            super().log_message(format, *args)
+
+    def send_json(self, code, data, headers=None):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(code)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def delay(self, extra=0.0):
+        seconds = self.config.latency + extra + random.uniform(0, self.config.jitter)
+        if seconds > 0:
+            time.sleep(seconds)
+
+    def inject_error(self, headers):
+        """設定した割合で 500 / 429 を返す。返した場合は True"""
+        roll = random.random()
+        if roll < self.config.error_rate:
+            self.stats.inc('error_500')
+            self.send_json(500, {"error": {"message": "Injected server error", "type": "server_error"}}, headers)
+            return True
+        if roll < self.config.error_rate + self.config.rate_limit_rate:
+            self.stats.inc('error_429')
+            self.send_json(429, {"error": {"message": "Injected rate limit", "type": "requests"}},
+                           {**headers, 'retry-after-ms': '500'})
+            return True
+        return False
+
+    def do_GET(self):
+        if self.path == '/stats':
+            self.send_json(200, self.stats.snapshot())
+        else:
+            self.send_json(404, {"error": {"message": "Not found"}})
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length)
+        if self.path.endswith('/chat/completions'):
+            self.chat_completions(body)
+        elif self.path.endswith('/audio/transcriptions'):
+            self.transcriptions(body)
+        else:
+            self.send_json(404, {"error": {"message": f"Unknown endpoint: {self.path}"}})
+
+    def chat_completions(self, body):
+        self.stats.inc('chat_completions')
+        try:
+            payload = json.loads(body)
+        except json.JSONDecodeError:
+            self.send_json(400, {"error": {"message": "Invalid JSON"}})
+            return
+        prompt_tokens = sum(estimate_tokens(m.get('content') or '') for m in payload.get('messages', []))
+        allowed, headers = self.limiter.acquire(prompt_tokens + int(payload.get('max_tokens') or 0))
+        if not allowed:
+            self.stats.inc('rate_limited')
+            self.send_json(429, {"error": {"message": "Rate limit reached", "type": "requests"}}, headers)
+            return
+        if self.inject_error(headers):
+            return
+
+        content = fake_chat_content(payload)
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": estimate_tokens(content),
+                 "total_tokens": prompt_tokens + estimate_tokens(content)}
+        self.delay()
+        if payload.get('stream'):
+            self.stream_chat(content, headers)
+            return
+        self.send_json(200, {
+            "id": f"chatcmpl-fake{random.getrandbits(32):08x}",
+            "object": "chat.completion",
+            "model": payload.get('model', ''),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": usage,
+        }, headers)
+
+    def stream_chat(self, content, headers):
+        """Server-Sent Events で少しずつ返す (chunked)"""
+        self.send_response(200)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+        def send_chunk(data):
+            self.wfile.write(f'{len(data):x}\r\n'.encode() + data + b'\r\n')
+
+        size = self.config.stream_chunk_chars
+        for i in range(0, len(content), size):
+            if i and self.config.token_delay:
+                time.sleep(self.config.token_delay)
+            delta = {"choices": [{"index": 0, "delta": {"content": content[i:i + size]}}]}
+            send_chunk(b'data: ' + json.dumps(delta, ensure_ascii=False).encode('utf-8') + b'\n\n')
+        send_chunk(b'data: [DONE]\n\n')
+        self.wfile.write(b'0\r\n\r\n')
+
+    def transcriptions(self, body):
+        self.stats.inc('audio_transcriptions')
+        allowed, headers = self.limiter.acquire(0)
+        if not allowed:
+            self.stats.inc('rate_limited')
+            self.send_json(429, {"error": {"message": "Rate limit reached", "type": "requests"}}, headers)
+            return
+        if self.inject_error(headers):
+            return
+        head = body[:4096]
+        # 変換済みの mp3 (64kbps) か、それ以外 (WAV相当) かで音声の長さを見積もる
+        bytes_per_second = MP3_BYTES_PER_SECOND if b'.mp3"' in head else AUDIO_BYTES_PER_SECOND
+        seconds = len(body) / bytes_per_second
+        self.delay(seconds * self.config.whisper_realtime)
+        # 5秒ごとに1文話している想定で、区間 (タイムスタンプ付き) を作る
+        segments = []
+        for i in range(max(1, int(seconds // SEGMENT_SECONDS))):
+            segments.append({
+                "id": i, "start": i * SEGMENT_SECONDS, "end": min(seconds, (i + 1) * SEGMENT_SECONDS),
+                "text": TRANSCRIPT_SENTENCES[i % len(TRANSCRIPT_SENTENCES)]
+            })
+        data = {"text": ''.join(segment['text'] for segment in segments)}
+        if b'verbose_json' in head:
+            data.update(language='japanese', duration=seconds, segments=segments)
+        self.send_json(200, data, headers)
+
+
+class FakeOpenAIServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def main():
+    parser = argparse.ArgumentParser(description='OpenAI API のローカル代替サーバー')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9000)
+    parser.add_argument('--latency', type=float, default=0.3, help='応答までの遅延(秒)')
+    parser.add_argument('--jitter', type=float, default=0.1, help='遅延に加えるばらつきの最大値(秒)')
+    parser.add_argument('--token-delay', type=float, default=0.01, help='ストリーミング応答のチャンク間隔(秒)')
+    parser.add_argument('--stream-chunk-chars', type=int, default=8, help='ストリーミング応答の1チャンクの文字数')
+    parser.add_argument('--whisper-realtime', type=float, default=0.05,
+                        help='書き起こしにかかる時間 (音声の長さに対する倍率)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='500 エラーを返す割合 (0〜1)')
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help='ランダムに 429 を返す割合 (0〜1)')
+    parser.add_argument('--rpm', type=int, default=0, help='1分あたりのリクエスト数の上限 (0 = 無制限)')
+    parser.add_argument('--tpm', type=int, default=0, help='1分あたりのトークン数の上限 (0 = 無制限)')
+    parser.add_argument('--verbose', action='store_true', help='リクエストログを表示')
+    args = parser.parse_args()
+
+    FakeOpenAIHandler.config = args
+    FakeOpenAIHandler.limiter = RateLimiter(args.rpm, args.tpm)
+    FakeOpenAIHandler.stats = Stats()
+
+    server = FakeOpenAIServer((args.host, args.port), FakeOpenAIHandler)
+    print(f"🤖 Fake OpenAI API: http://{args.host}:{args.port}/v1", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
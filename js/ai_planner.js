@@ -188,10 +188,10 @@ const AIPlanner = {
                                 ← 戻る
                             </button>
                             <div style="display: flex; gap: 12px;">
-                                <button class="btn btn-secondary" onclick="AIPlanner.generatePlan()">
+                                <button class="btn btn-secondary" onclick="AIPlanner.generatePlan(true)">
                                     🔄 再生成
                                 </button>
-                                <button class="btn btn-success" onclick="AIPlanner.importTasks()">
+                                <button class="btn btn-success" id="ai-import-btn" onclick="AIPlanner.importTasks()">
                                     ✅ ダッシュボードに追加
                                 </button>
                             </div>
@@ -250,7 +250,7 @@ const AIPlanner = {
     this.resetForm();
   },
 
-  async generatePlan() {
+  async generatePlan(regenerate = false) {
         const projectName = document.getElementById('ai-project-name').value.trim();
     const goal = document.getElementById('ai-goal').value.trim();
     const deadline = document.getElementById('ai-deadline').value;
@@ -279,7 +279,9 @@ const AIPlanner = {
       const response = await fetch('/api/generate', {
         method: 'POST',
         headers: {
-          'Content-Type': 'application/json'
+          'Content-Type': 'application/json',
+                    // 再生成ではサーバーのキャッシュを使わず新しい計画を作る
+                    ...(regenerate ? { 'X-LLM-Cache': 'bypass' } : {})
         },
         body: JSON.stringify({
           goal: goal,
@@ -288,7 +290,8 @@ const AIPlanner = {
                     goalType: goalType.promptHint,
                     category: goalType.category,
                     level: level,
-                    hoursPerWeek: hours
+                    hoursPerWeek: hours,
+                    stream: true
         })
       });
 
@@ -297,7 +300,22 @@ const AIPlanner = {
         throw new Error(err.error || `Server Error: ${response.status}`);
       }
 
-      const data = await response.json();
+            // タスクが1件確定するごとにプレビューを更新 (完了までは追加ボタンを無効化)
+            const importBtn = document.getElementById('ai-import-btn');
+            importBtn.disabled = true;
+            let data;
+            try {
+                data = await EventStream.read(response, {
+                    partial: (partialPlan) => {
+                        if (!Array.isArray(partialPlan.tasks) || partialPlan.tasks.length === 0) return;
+                        this.renderPreview(partialPlan.tasks);
+                        this.setView('result');
+                    }
+                });
+            } finally {
+                // ストリームが途中で失敗しても次の生成で追加ボタンが押せなくならないよう戻す
+                importBtn.disabled = false;
+            }
       const planContent = data.choices[0].message.content;
       const plan = JSON.parse(planContent);
 
@@ -2,6 +2,235 @@
 // データ管理モジュール - Enhanced with Server Persistence
 // ===================================
 
+// ===================================
+// レコード単位の差分同期
+// 前回サーバーと同期した状態を覚えておき、変更されたレコードだけを送信する
+// ===================================
+const RecordSync = {
+    // コレクション名 → { ids: [...], json: Map(id → JSON文字列) }
+    _snapshots: {},
+
+    // サーバーと一致している状態として記録
+    remember(collection, records) {
+        this._snapshots[collection] = this._index(records);
+    },
+
+    _index(records) {
+        const ids = [];
+        const json = new Map();
+        for (const record of records) {
+            if (!record || !record.id || json.has(record.id)) return null;
+            ids.push(record.id);
+            json.set(record.id, JSON.stringify(record));
+        }
+        return { ids, json };
+    },
+
+    // 前回の同期状態との差分を put/delete 操作のリストにする
+    // 並び順が変わった場合など差分で表せないときは null
+    _diff(previous, next, records) {
+        if (!previous || !next) return null;
+
+        const ops = [];
+        previous.ids.forEach(id => {
+            if (!next.json.has(id)) ops.push({ op: 'delete', id });
+        });
+
+        // 残ったレコードの相対的な順番が同じか確認
+        const keptPrevious = previous.ids.filter(id => next.json.has(id));
+        const keptNext = next.ids.filter(id => previous.json.has(id));
+        if (keptPrevious.some((id, i) => id !== keptNext[i])) return null;
+
+        next.ids.forEach((id, index) => {
+            const json = next.json.get(id);
+            if (!previous.json.has(id)) {
+                ops.push({ op: 'put', record: records[index], index });
+            } else if (previous.json.get(id) !== json) {
+                ops.push({ op: 'put', record: records[index] });
+            }
+        });
+        return ops;
+    },
+
+    // 差分だけを送信 (差分で表せない場合はコレクション全体を保存)
+    async save(collection, records) {
+        const next = this._index(records);
+        const ops = this._diff(this._snapshots[collection], next, records);
+        if (ops && ops.length === 0) return;
+
+        let response = null;
+        if (ops) {
+            response = await fetch(`/api/data/${collection}/ops`, {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify(ops)
+            });
+        }
+        if (!response || !response.ok) {
+            response = await fetch(`/api/data/${collection}`, {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify(records)
+            });
+        }
+        if (!response.ok) {
+            delete this._snapshots[collection];
+            throw new Error(`HTTP ${response.status}`);
+        }
+        this._snapshots[collection] = next;
+    }
+};
+
+// ===================================
+// Server-Sent Events の受信 (AI生成のストリーミング表示用)
+// fetch のレスポンスを少しずつ読み、イベントごとにハンドラを呼ぶ
+// ===================================
+const EventStream = {
+    // done イベントのデータ (通常レスポンスと同じ形) を返す
+    async read(response, handlers = {}) {
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let result = null;
+
+        const dispatch = (block) => {
+            let event = 'message';
+            const dataLines = [];
+            block.split('\n').forEach(line => {
+                if (line.startsWith('event:')) event = line.slice(6).trim();
+                else if (line.startsWith('data:')) dataLines.push(line.slice(5).trim());
+            });
+            if (dataLines.length === 0) return;
+            const data = JSON.parse(dataLines.join('\n'));
+            if (event === 'error') throw new Error(data.error || 'Stream error');
+            if (event === 'done') result = data;
+            if (handlers[event]) handlers[event](data);
+        };
+
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+            let index;
+            while ((index = buffer.indexOf('\n\n')) !== -1) {
+                dispatch(buffer.slice(0, index));
+                buffer = buffer.slice(index + 2);
+            }
+        }
+        if (buffer.trim()) dispatch(buffer);
+        if (result === null) throw new Error('ストリームが途中で終了しました');
+        return result;
+    }
+};
+
+// ===================================
+// バックグラウンドジョブ (書き起こし・整形)
+// Prefer: respond-async で投入し、進捗を /api/jobs/<id>/events で受け取る
+// 接続が切れても EventSource が自動で再接続し、サーバー側の結果を受け取れる
+// ストリームの同時接続数の上限に達していれば /api/jobs/<id> のポーリングで待つ
+// ===================================
+const JobClient = {
+    PENDING_KEY: 'task_dashboard_pending_jobs',
+    // 進捗のストリームに接続できないときのポーリング間隔
+    POLL_INTERVAL_MS: 2000,
+
+    // 投入して完了まで待ち、結果を返す
+    // name を指定すると、ページを開き直しても resume(name) で続きを待てる
+    async run(url, options, { name = null, onProgress = null } = {}) {
+        const response = await fetch(url, {
+            ...options,
+            headers: { ...(options.headers || {}), 'Prefer': 'respond-async' }
+        });
+        const data = await response.json().catch(() => ({}));
+        if (!response.ok) throw new Error(data.error || `HTTP ${response.status}`);
+        // ジョブとして受け付けられなかった場合は結果がそのまま返ってくる
+        if (response.status !== 202) return data;
+
+        if (name) this._setPending(name, data.id);
+        try {
+            return await this.wait(data.id, onProgress);
+        } finally {
+            if (name) this._setPending(name, null);
+        }
+    },
+
+    async resume(name, onProgress = null) {
+        const jobId = this.getPending(name);
+        if (!jobId) return null;
+        try {
+            return await this.wait(jobId, onProgress);
+        } finally {
+            this._setPending(name, null);
+        }
+    },
+
+    wait(jobId, onProgress = null) {
+        return new Promise((resolve, reject) => {
+            let settled = false;
+            // 完了・失敗なら true を返す
+            const update = (job) => {
+                if (settled) return true;
+                if (onProgress) onProgress(job);
+                if (job.status === 'done') {
+                    resolve(job.result);
+                } else if (job.status === 'error') {
+                    reject(new Error(job.error || 'ジョブが失敗しました'));
+                } else {
+                    return false;
+                }
+                settled = true;
+                return true;
+            };
+            const source = new EventSource(`/api/jobs/${jobId}/events`);
+            source.onmessage = (event) => {
+                if (update(JSON.parse(event.data))) source.close();
+            };
+            source.onerror = async () => {
+                // 一時的な切断なら EventSource が再接続する。ジョブ自体がなくなっていれば終了
+                const response = await fetch(`/api/jobs/${jobId}`).catch(() => null);
+                if (response && response.status === 404) {
+                    source.close();
+                    if (!settled) reject(new Error('ジョブが見つかりません'));
+                } else if (source.readyState === EventSource.CLOSED) {
+                    // 同時接続数の上限 (503) などで再接続されない場合はポーリングで待つ
+                    this._poll(jobId, update).catch((error) => {
+                        if (!settled) reject(error);
+                    });
+                }
+            };
+        });
+    },
+
+    async _poll(jobId, update) {
+        for (;;) {
+            const response = await fetch(`/api/jobs/${jobId}`);
+            if (response.status === 404) throw new Error('ジョブが見つかりません');
+            if (response.ok && update(await response.json())) return;
+            await new Promise((resolve) => setTimeout(resolve, this.POLL_INTERVAL_MS));
+        }
+    },
+
+    getPending(name) {
+        try {
+            return JSON.parse(localStorage.getItem(this.PENDING_KEY) || '{}')[name] || null;
+        } catch (e) {
+            return null;
+        }
+    },
+
+    _setPending(name, jobId) {
+        let pending = {};
+        try {
+            pending = JSON.parse(localStorage.getItem(this.PENDING_KEY) || '{}');
+        } catch (e) {
+            // 壊れていれば作り直す
+        }
+        if (jobId) pending[name] = jobId;
+        else delete pending[name];
+        localStorage.setItem(this.PENDING_KEY, JSON.stringify(pending));
+    }
+};
+
 // データ構造
 const TaskManager = {
     // ローカルストレージのキー（フォールバック用）
@@ -61,6 +290,7 @@ const TaskManager = {
             // サーバーにデータがある場合
             if (data.tasks && data.tasks.length > 0) {
                 this.tasks = data.tasks;
+                RecordSync.remember('tasks', this.tasks);
                 console.log(`✅ サーバーからタスクを読み込み: ${this.tasks.length}件`);
             } else {
                 // サーバーにデータがない場合、ローカルから移行
@@ -73,6 +303,7 @@ const TaskManager = {
             
             if (data.memos && data.memos.length > 0) {
                 this.memos = data.memos;
+                RecordSync.remember('memos', this.memos);
                 console.log(`✅ サーバーからメモを読み込み: ${this.memos.length}件`);
             } else {
                 this.loadMemosFromStorage();
@@ -97,15 +328,7 @@ const TaskManager = {
         
         this._saveDebounceTimer = setTimeout(async () => {
             try {
-                const response = await fetch('/api/data/tasks', {
-                    method: 'POST',
-                    headers: { 'Content-Type': 'application/json' },
-                    body: JSON.stringify(this.tasks)
-                });
-                
-                if (!response.ok) {
-                    throw new Error(`HTTP ${response.status}`);
-                }
+                await RecordSync.save('tasks', this.tasks);
                 console.log('💾 タスクをサーバーに保存しました');
             } catch (error) {
                 console.warn('⚠️ サーバー保存に失敗、ローカルに保存:', error.message);
@@ -126,15 +349,7 @@ const TaskManager = {
         
         this._memoSaveDebounceTimer = setTimeout(async () => {
             try {
-                const response = await fetch('/api/data/memos', {
-                    method: 'POST',
-                    headers: { 'Content-Type': 'application/json' },
-                    body: JSON.stringify(this.memos)
-                });
-                
-                if (!response.ok) {
-                    throw new Error(`HTTP ${response.status}`);
-                }
+                await RecordSync.save('memos', this.memos);
                 console.log('💾 メモをサーバーに保存しました');
             } catch (error) {
                 console.warn('⚠️ メモのサーバー保存に失敗:', error.message);
@@ -532,6 +747,7 @@ const ProjectsManager = {
             
             if (data && data.length > 0) {
                 this.projects = data;
+                RecordSync.remember('projects', this.projects);
                 console.log(`✅ サーバーからプロジェクトを読み込み: ${this.projects.length}件`);
             } else {
                 // サーバーにデータがない場合、ローカルから移行
@@ -556,15 +772,7 @@ const ProjectsManager = {
         
         this._saveDebounceTimer = setTimeout(async () => {
             try {
-                const response = await fetch('/api/data/projects', {
-                    method: 'POST',
-                    headers: { 'Content-Type': 'application/json' },
-                    body: JSON.stringify(this.projects)
-                });
-                
-                if (!response.ok) {
-                    throw new Error(`HTTP ${response.status}`);
-                }
+                await RecordSync.save('projects', this.projects);
                 console.log('💾 プロジェクトをサーバーに保存しました');
             } catch (error) {
                 console.warn('⚠️ プロジェクトのサーバー保存に失敗:', error.message);
@@ -27,6 +27,7 @@ const MeetingsManager = {
             
             if (data && data.length > 0) {
                 this.meetings = data;
+                RecordSync.remember('meetings', this.meetings);
                 console.log(`✅ サーバーから会議を読み込み: ${this.meetings.length}件`);
             } else {
                 // サーバーにデータがない場合、ローカルから移行
@@ -50,15 +51,7 @@ const MeetingsManager = {
         
         this._saveDebounceTimer = setTimeout(async () => {
             try {
-                const response = await fetch('/api/data/meetings', {
-                    method: 'POST',
-                    headers: { 'Content-Type': 'application/json' },
-                    body: JSON.stringify(this.meetings)
-                });
-                
-                if (!response.ok) {
-                    throw new Error(`HTTP ${response.status}`);
-                }
+                await RecordSync.save('meetings', this.meetings);
                 console.log('💾 会議をサーバーに保存しました');
             } catch (error) {
                 console.warn('⚠️ 会議のサーバー保存に失敗:', error.message);
@@ -277,6 +270,166 @@ const TeamsIntegration = {
     }
 };
 
+// ===================================
+// Live Transcription
+// ===================================
+
+// 録音中に音声を一定間隔で区切ってサーバーへ送り、停止を待たずに書き起こしを進める
+// 区切るたびに MediaRecorder を作り直すので、各区間はそれだけで再生できる音声ファイルになる
+const LiveTranscription = {
+    SEGMENT_MS: 30000,
+    // 途中経過のストリームに接続できないときのポーリング間隔
+    POLL_INTERVAL_MS: 5000,
+
+    sessionId: null,
+    ready: null,
+    stream: null,
+    mimeType: null,
+    recorder: null,
+    segmentTimer: null,
+    pollTimer: null,
+    seq: 0,
+    uploads: Promise.resolve(),
+    stopped: Promise.resolve(),
+    failed: false,
+    events: null,
+
+    // 録音開始時に呼ぶ。onText には途中までの書き起こしが渡される
+    start(stream, mimeType, onText = null) {
+        this.reset();
+        this.stream = stream;
+        this.mimeType = mimeType;
+        // セッションの作成を待たずに録音を始め、区間の送信だけを作成後に回す
+        this.ready = fetch('/api/live', { method: 'POST' })
+            .then(async (response) => {
+                const data = await response.json().catch(() => ({}));
+                if (!response.ok) throw new Error(data.error || `HTTP ${response.status}`);
+                this.sessionId = data.id;
+                if (onText) {
+                    this.events = new EventSource(`/api/live/${data.id}/events`);
+                    this.events.onmessage = (event) => onText(JSON.parse(event.data).text);
+                    this.events.onerror = () => {
+                        // 同時接続数の上限 (503) などで再接続されない場合はポーリングで途中経過を取得
+                        if (!this.events || this.events.readyState !== EventSource.CLOSED) return;
+                        this.events = null;
+                        const sessionId = this.sessionId;
+                        this.pollTimer = setInterval(async () => {
+                            const response = await fetch(`/api/live/${sessionId}`).catch(() => null);
+                            if (response && response.ok) onText((await response.json()).text);
+                        }, this.POLL_INTERVAL_MS);
+                    };
+                }
+            })
+            .catch((error) => {
+                console.warn('Live transcription unavailable:', error);
+                this.failed = true;
+            });
+        this._startSegment();
+        this.segmentTimer = setInterval(() => this._startSegment(), this.SEGMENT_MS);
+    },
+
+    // 次の区間の録音を始めてから前の区間を止める (区切り目で音声が途切れないように)
+    _startSegment() {
+        const previous = this.recorder;
+        const recorder = new MediaRecorder(this.stream, { mimeType: this.mimeType });
+        const parts = [];
+        recorder.ondataavailable = (event) => {
+            if (event.data.size > 0) parts.push(event.data);
+        };
+        recorder.onstop = () => this._upload(new Blob(parts, { type: recorder.mimeType || 'audio/webm' }));
+        recorder.start();
+        this.recorder = recorder;
+        if (previous) previous.stop();
+    },
+
+    _upload(blob) {
+        if (blob.size === 0) return;
+        const seq = this.seq++;
+        // 区間は順番に送る (失敗したら1回だけ再送し、それでも失敗したら録音全体の書き起こしに切り替える)
+        this.uploads = this.uploads.then(async () => {
+            await this.ready;
+            for (let attempt = 0; attempt < 2 && !this.failed; attempt++) {
+                try {
+                    const response = await fetch(`/api/live/${this.sessionId}/segments/${seq}`, {
+                        method: 'PUT',
+                        headers: { 'Content-Type': blob.type },
+                        body: blob
+                    });
+                    if (response.ok) return;
+                    if (response.status < 500) break;
+                } catch (error) {
+                    console.warn(`Live segment ${seq} upload failed:`, error);
+                }
+            }
+            this.failed = true;
+        });
+    },
+
+    isUsable() {
+        return !this.failed && this.ready !== null;
+    },
+
+    // 録音停止時に呼ぶ。録音中の区間を止めて送信する
+    stop() {
+        if (this.segmentTimer) {
+            clearInterval(this.segmentTimer);
+            this.segmentTimer = null;
+        }
+        const recorder = this.recorder;
+        this.recorder = null;
+        this.stopped = new Promise((resolve) => {
+            if (!recorder || recorder.state === 'inactive') {
+                resolve();
+                return;
+            }
+            recorder.addEventListener('stop', resolve, { once: true });
+            recorder.stop();
+        });
+    },
+
+    // 残りの区間の書き起こしを待って全文を返す
+    // サーバー側ではジョブとして待つため、ページを開き直しても JobClient.resume('transcribe') で受け取れる
+    async finish(onProgress = null) {
+        await this.stopped;
+        await this.uploads;
+        this._closeEvents();
+        if (!this.isUsable()) throw new Error('ライブ書き起こしの区間を送信できませんでした');
+        const data = await JobClient.run(`/api/live/${this.sessionId}/finish`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ segments: this.seq })
+        }, { name: 'transcribe', onProgress });
+        this.sessionId = null;
+        return data;
+    },
+
+    _closeEvents() {
+        if (this.events) {
+            this.events.close();
+            this.events = null;
+        }
+        if (this.pollTimer) {
+            clearInterval(this.pollTimer);
+            this.pollTimer = null;
+        }
+    },
+
+    // セッションを破棄して初期状態に戻す
+    reset() {
+        this._closeEvents();
+        if (this.sessionId) {
+            fetch(`/api/live/${this.sessionId}`, { method: 'DELETE' }).catch(() => {});
+        }
+        this.sessionId = null;
+        this.ready = null;
+        this.recorder = null;
+        this.seq = 0;
+        this.uploads = Promise.resolve();
+        this.stopped = Promise.resolve();
+        this.failed = false;
+    }
+};
+
 // ===================================
 // Meetings UI
 // ===================================
@@ -294,6 +447,7 @@ const MeetingsUI = {
         this.renderMeetings();
         this.updateCounts();
         this.attachEvents();
+        this.resumeTranscription();
     },
 
     attachEvents() {
@@ -556,6 +710,64 @@ const MeetingsUI = {
     // AI Features
     // ===================================
 
+    // 要約・議事録・アクションを1回のAI呼び出しでまとめて生成
+    async generateAll() {
+        const transcript = document.getElementById('meeting-transcript').value.trim();
+        const title = document.getElementById('meeting-title').value.trim();
+        const participants = document.getElementById('meeting-participants').value.trim();
+
+        if (!transcript) {
+            alert('会議メモ/書き起こしを入力してください');
+            return;
+        }
+
+        const summaryEl = document.getElementById('meeting-summary');
+        const minutesEl = document.getElementById('meeting-minutes');
+        summaryEl.textContent = '✨ 要約を生成中...';
+        minutesEl.textContent = '📋 議事録を生成中...';
+        document.getElementById('summary-section').style.display = 'block';
+        document.getElementById('minutes-section').style.display = 'block';
+
+        try {
+            const response = await fetch('http://localhost:8009/api/summarize', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({
+                    text: transcript,
+                    type: 'all',
+                    title: title,
+                    participants: participants,
+                    stream: true
+                })
+            });
+
+            if (!response.ok) throw new Error('API error');
+
+            // 確定した項目から順に表示する
+            let shown = 0;
+            const render = (result) => {
+                if (typeof result.summary === 'string' && result.summary) summaryEl.textContent = result.summary;
+                if (typeof result.minutes === 'string' && result.minutes) minutesEl.textContent = result.minutes;
+                const actions = Array.isArray(result.actions) ? result.actions : [];
+                if (shown === 0 && actions.length > 0) {
+                    document.getElementById('action-items-list').innerHTML = '';
+                }
+                actions.slice(shown).forEach(action => {
+                    this.addActionItem(action.title, action.assignee || '', '');
+                });
+                shown = Math.max(shown, actions.length);
+            };
+            const data = await EventStream.read(response, { partial: render });
+            render(data);
+            if (!data.summary) summaryEl.textContent = '要約を生成できませんでした';
+            if (!data.minutes) minutesEl.textContent = '議事録を生成できませんでした';
+        } catch (error) {
+            console.error('Generate all error:', error);
+            summaryEl.textContent = '生成に失敗しました。サーバーが起動しているか確認してください。';
+            minutesEl.textContent = '';
+        }
+    },
+
     async generateSummary() {
         const transcript = document.getElementById('meeting-transcript').value.trim();
         if (!transcript) {
@@ -571,12 +783,19 @@ const MeetingsUI = {
             const response = await fetch('http://localhost:8009/api/summarize', {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({ text: transcript, type: 'summary' })
+                body: JSON.stringify({ text: transcript, type: 'summary', stream: true })
             });
 
             if (!response.ok) throw new Error('API error');
 
-            const data = await response.json();
+            // 生成された文字から順に表示する
+            let streamed = '';
+            const data = await EventStream.read(response, {
+                delta: ({ content }) => {
+                    streamed += content;
+                    summaryEl.textContent = streamed;
+                }
+            });
             summaryEl.textContent = data.result || '要約を生成できませんでした';
         } catch (error) {
             console.error('Summary error:', error);
@@ -606,13 +825,20 @@ const MeetingsUI = {
                     text: transcript,
                     type: 'minutes',
                     title: title,
-                    participants: participants
+                    participants: participants,
+                    stream: true
                 })
             });
 
             if (!response.ok) throw new Error('API error');
 
-            const data = await response.json();
+            let streamed = '';
+            const data = await EventStream.read(response, {
+                delta: ({ content }) => {
+                    streamed += content;
+                    minutesEl.textContent = streamed;
+                }
+            });
             minutesEl.textContent = data.result || '議事録を生成できませんでした';
         } catch (error) {
             console.error('Minutes error:', error);
@@ -631,14 +857,27 @@ const MeetingsUI = {
             const response = await fetch('http://localhost:8009/api/summarize', {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({ text: transcript, type: 'actions' })
+                body: JSON.stringify({ text: transcript, type: 'actions', stream: true })
             });
 
             if (!response.ok) throw new Error('API error');
 
-            const data = await response.json();
+            // アクションが1件確定するごとに一覧へ追加する
+            let shown = 0;
+            const data = await EventStream.read(response, {
+                partial: (partialData) => {
+                    const actions = Array.isArray(partialData.actions) ? partialData.actions : [];
+                    if (shown === 0 && actions.length > 0) {
+                        document.getElementById('action-items-list').innerHTML = '';
+                    }
+                    actions.slice(shown).forEach(action => {
+                        this.addActionItem(action.title, action.assignee || '', '');
+                    });
+                    shown = Math.max(shown, actions.length);
+                }
+            });
             
-            if (data.actions && Array.isArray(data.actions)) {
+            if (shown === 0 && data.actions && Array.isArray(data.actions)) {
                 document.getElementById('action-items-list').innerHTML = '';
                 data.actions.forEach(action => {
                     this.addActionItem(action.title, action.assignee || '', '');
@@ -767,6 +1006,8 @@ const MeetingsUI = {
         };
 
         this.mediaRecorder.start(1000);
+        // 録音全体とは別に区間ごとに送り、録音中に書き起こしを進める
+        LiveTranscription.start(stream, 'audio/webm;codecs=opus', (text) => this.showLiveTranscript(text));
         this.isRecording = true;
         this.recordingStartTime = Date.now();
         
@@ -780,7 +1021,31 @@ const MeetingsUI = {
     },
     
     // 録音した音声を処理（書き起こし）
+    // 録音中のライブ書き起こしが使えれば残りの区間だけを待ち、使えなければ録音全体をアップロードする
     async processRecordedAudio(audioBlob) {
+        // Create FormData with audio file
+        const formData = new FormData();
+        const timestamp = new Date().toISOString().replace(/[:.]/g, '-');
+        formData.append('audio', audioBlob, `recording_${timestamp}.webm`);
+
+        await this._runTranscription('録音した音声を処理中...', async (onProgress) => {
+            if (LiveTranscription.isUsable()) {
+                try {
+                    const data = await LiveTranscription.finish(onProgress);
+                    if (!data.failed_segments || data.failed_segments.length === 0) return data;
+                    console.warn('Live transcription missed segments:', data.failed_segments);
+                } catch (error) {
+                    console.warn('Live transcription failed, uploading the whole recording:', error);
+                }
+            }
+            LiveTranscription.reset();
+            return JobClient.run('/api/transcribe', { method: 'POST', body: formData }, { name: 'transcribe', onProgress });
+        });
+    },
+
+    // 書き起こしを実行し、進捗と結果を書き起こしモーダルに表示する
+    // サーバー側ではジョブとして処理されるため、ページを開き直しても resumeTranscription() で結果を受け取れる
+    async _runTranscription(initialMessage, run) {
         const uploadArea = document.getElementById('upload-area');
         const progressEl = document.getElementById('transcription-progress');
         const progressBar = document.getElementById('transcription-progress-bar');
@@ -791,31 +1056,17 @@ const MeetingsUI = {
         if (uploadArea) uploadArea.style.display = 'none';
         if (progressEl) progressEl.style.display = 'block';
         if (progressBar) progressBar.style.width = '10%';
-        if (progressText) progressText.textContent = '録音した音声を処理中...';
+        if (progressText) progressText.textContent = initialMessage;
 
         try {
-            // Create FormData with audio file
-            const formData = new FormData();
-            const timestamp = new Date().toISOString().replace(/[:.]/g, '-');
-            formData.append('audio', audioBlob, `recording_${timestamp}.webm`);
-            
             if (progressBar) progressBar.style.width = '30%';
             if (progressText) progressText.textContent = 'Whisper APIで書き起こし中...';
             
-            const response = await fetch('/api/transcribe', {
-                method: 'POST',
-                body: formData
+            const data = await run((job) => {
+                if (progressBar) progressBar.style.width = `${30 + Math.round(job.progress * 60)}%`;
+                if (progressText && job.message) progressText.textContent = job.message;
             });
             
-            if (progressBar) progressBar.style.width = '80%';
-            
-            if (!response.ok) {
-                const errorData = await response.json().catch(() => ({}));
-                throw new Error(errorData.error || `HTTP ${response.status}`);
-            }
-            
-            const data = await response.json();
-            
             if (progressBar) progressBar.style.width = '100%';
             
             setTimeout(() => {
@@ -842,6 +1093,15 @@ const MeetingsUI = {
             }
         }
     },
+
+    // 前回ページを閉じたときに実行中だった書き起こしがあれば、結果を待って表示する
+    async resumeTranscription() {
+        if (!JobClient.getPending('transcribe')) return;
+        this.openTranscriptionModal();
+        await this._runTranscription('前回の書き起こしを再開中...', (onProgress) =>
+            JobClient.resume('transcribe', onProgress)
+        );
+    },
     
     // 録音した音声ファイルをダウンロード
     downloadRecording() {
@@ -892,6 +1152,12 @@ const MeetingsUI = {
         }
     },
     
+    // 録音中バナーにライブ書き起こしの末尾を表示
+    showLiveTranscript(text) {
+        const el = document.getElementById('live-transcript');
+        if (el) el.textContent = text ? `…${text.slice(-80)}` : '';
+    },
+
     updateRecordingTime() {
         if (!this.recordingStartTime) return;
         const elapsed = Math.floor((Date.now() - this.recordingStartTime) / 1000);
@@ -903,6 +1169,7 @@ const MeetingsUI = {
 
     stopRecording() {
         if (this.mediaRecorder && this.isRecording) {
+            LiveTranscription.stop();
             this.mediaRecorder.stop();
             this.mediaRecorder.stream.getTracks().forEach(track => track.stop());
             this.isRecording = false;
@@ -919,6 +1186,7 @@ const MeetingsUI = {
             const standaloneBanner = document.getElementById('standalone-banner');
             if (banner) banner.classList.remove('active');
             if (standaloneBanner) standaloneBanner.style.display = 'flex';
+            this.showLiveTranscript('');
 
             // Update buttons
             const micBtn = document.getElementById('record-btn');
@@ -948,65 +1216,13 @@ const MeetingsUI = {
     },
 
     async handleAudioFile(file) {
-        const uploadArea = document.getElementById('upload-area');
-        const progressEl = document.getElementById('transcription-progress');
-        const progressBar = document.getElementById('transcription-progress-bar');
-        const resultEl = document.getElementById('transcription-result');
-        const textEl = document.getElementById('transcription-text');
-        const progressText = document.getElementById('transcription-progress-text');
-        
-        if (uploadArea) uploadArea.style.display = 'none';
-        if (progressEl) progressEl.style.display = 'block';
-        if (progressBar) progressBar.style.width = '10%';
-        if (progressText) progressText.textContent = '音声を処理中...';
+        // Create FormData with audio file
+        const formData = new FormData();
+        formData.append('audio', file, 'recording.webm');
 
-        try {
-            // Create FormData with audio file
-            const formData = new FormData();
-            formData.append('audio', file, 'recording.webm');
-            
-            if (progressBar) progressBar.style.width = '30%';
-            if (progressText) progressText.textContent = 'Whisper APIで書き起こし中...';
-            
-            const response = await fetch('http://localhost:8009/api/transcribe', {
-                method: 'POST',
-                body: formData
-            });
-            
-            if (progressBar) progressBar.style.width = '80%';
-            
-            if (!response.ok) {
-                const errorData = await response.json().catch(() => ({}));
-                throw new Error(errorData.error || `HTTP ${response.status}`);
-            }
-            
-            const data = await response.json();
-            
-            if (progressBar) progressBar.style.width = '100%';
-            
-            setTimeout(() => {
-                if (progressEl) progressEl.style.display = 'none';
-                if (resultEl) resultEl.style.display = 'block';
-                
-                if (data.text && data.text.trim()) {
-                    textEl.value = data.text;
-                } else {
-                    textEl.value = '（音声が検出されませんでした）';
-                }
-            }, 300);
-            
-        } catch (error) {
-            console.error('Transcription error:', error);
-            
-            if (progressEl) progressEl.style.display = 'none';
-            if (resultEl) resultEl.style.display = 'block';
-            
-            if (error.message.includes('API Key')) {
-                textEl.value = '❌ エラー: OpenAI API Keyが設定されていません。\n\n.envファイルにOPENAI_API_KEYを設定してください。';
-            } else {
-                textEl.value = `❌ 書き起こしエラー: ${error.message}\n\nサーバーが起動しているか確認してください。\n(python server.py)`;
-            }
-        }
+        await this._runTranscription('音声を処理中...', (onProgress) =>
+            JobClient.run('http://localhost:8009/api/transcribe', { method: 'POST', body: formData }, { name: 'transcribe', onProgress })
+        );
     },
 
     copyTranscription() {
@@ -1041,19 +1257,16 @@ const MeetingsUI = {
         formatBtn.textContent = '✨ 整形中...';
         
         try {
-            const response = await fetch('http://localhost:8009/api/format-transcript', {
+            const data = await JobClient.run('http://localhost:8009/api/format-transcript', {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json' },
                 body: JSON.stringify({ text: originalText })
+            }, {
+                onProgress: (job) => {
+                    if (job.message) formatBtn.textContent = `✨ ${job.message}`;
+                }
             });
             
-            if (!response.ok) {
-                const errorData = await response.json().catch(() => ({}));
-                throw new Error(errorData.error || `HTTP ${response.status}`);
-            }
-            
-            const data = await response.json();
-            
             if (data.text) {
                 textEl.value = data.text;
             }
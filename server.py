@@ -1,16 +1,48 @@
+import argparse
+import base64
+import http.client
 import http.server
+import io
 import socketserver
 import os
 import json
-import urllib.request
+import mimetypes
+import sqlite3
+import ssl
+import tempfile
+import threading
+import time
+import atexit
+import signal
+import gzip
+import hashlib
+import bisect
+import heapq
+import itertools
+import random
+import zlib
+import subprocess
+import secrets
+import shutil
 import urllib.error
+import urllib.parse
+import urllib.request
+from collections import OrderedDict
+from contextlib import contextmanager, nullcontext
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime, timedelta
+from email.utils import formatdate, parsedate_to_datetime
 from pathlib import Path
 from dotenv import load_dotenv
 
-# データ保存先ディレクトリ
-DATA_DIR = Path(__file__).resolve().parent / 'data'
-DATA_DIR.mkdir(exist_ok=True)
+try:
+    import brotli  # オプション: インストールされていれば br 圧縮にも対応
+except ImportError:
+    brotli = None
+
+# データ保存先ディレクトリ (TASK_DASHBOARD_DATA_DIR で変更可能)
+DATA_DIR = Path(os.environ.get('TASK_DASHBOARD_DATA_DIR') or Path(__file__).resolve().parent / 'data')
+DATA_DIR.mkdir(parents=True, exist_ok=True)
 
 # データファイルのパス
 TASKS_FILE = DATA_DIR / 'tasks.json'
@@ -45,99 +77,3796 @@ except Exception as e:
 
 PORT = int(os.environ.get('TASK_DASHBOARD_PORT', 8009))
 
+# 同時に処理するリクエスト数の上限 (ワーカースレッド数)
+MAX_WORKERS = max(1, int(os.environ.get('TASK_DASHBOARD_MAX_WORKERS', 16)))
+# AI/ffmpeg処理など長時間かかるリクエストの同時実行数の上限
+# 残りのワーカーはデータ同期・静的ファイル用に常に空けておく
+MAX_HEAVY_REQUESTS = max(1, min(MAX_WORKERS, int(os.environ.get('TASK_DASHBOARD_MAX_HEAVY', max(1, MAX_WORKERS // 2)))))
+
+# 長時間かかるAPI (OpenAI呼び出し・ffmpeg変換)
+HEAVY_ROUTES = {'/api/generate', '/api/summarize', '/api/format-transcript', '/api/transcribe'}
+HEAVY_SLOTS = threading.BoundedSemaphore(MAX_HEAVY_REQUESTS)
+# 上限に達しているとき、空きを待つ最大秒数 (超えたら 503)。0 ですぐに 503 を返す
+HEAVY_WAIT_SECONDS = max(0.0, float(os.environ.get('TASK_DASHBOARD_HEAVY_WAIT', 10)))
+# 空きを待てるリクエスト数。待っている間もワーカーを使うため、残りのワーカーの1/4までにする
+HEAVY_WAITERS = threading.BoundedSemaphore(max(1, (MAX_WORKERS - MAX_HEAVY_REQUESTS) // 4))
+# 進捗のストリーム (Server-Sent Events) の同時接続数の上限 (デフォルト: 残りのワーカーの半分)
+# 接続中はワーカーを使い続けるため、超えた場合は 503 を返してポーリングに切り替えてもらう
+MAX_EVENT_STREAMS = max(1, min(MAX_WORKERS, int(os.environ.get(
+    'TASK_DASHBOARD_MAX_STREAMS', max(1, (MAX_WORKERS - MAX_HEAVY_REQUESTS) // 2)))))
+STREAM_SLOTS = threading.BoundedSemaphore(MAX_EVENT_STREAMS)
+
+# 保存の書き込み間隔(秒)。この間に来た同じコレクションへの保存は1回の書き込みにまとめる
+# 0 の場合はリクエストごとに即座に書き込む
+FLUSH_INTERVAL = max(0.0, float(os.environ.get('TASK_DASHBOARD_FLUSH_INTERVAL', 1.0)))
+# インデントなしのコンパクトなJSONで保存する (ファイルサイズ・書き込み時間を削減)
+COMPACT_JSON = os.environ.get('TASK_DASHBOARD_COMPACT_JSON', '').lower() in ('1', 'true', 'yes')
+
+# データの保存先: json (data/*.json, デフォルト) または sqlite
+STORAGE_BACKEND = os.environ.get('TASK_DASHBOARD_STORAGE', 'json').lower()
+SQLITE_PATH = Path(os.environ.get('TASK_DASHBOARD_SQLITE_PATH') or DATA_DIR / 'task_dashboard.db')
+
+# journal ストレージ: 変更を追記するジャーナルファイルと、スナップショット(コンパクション)の条件
+JOURNAL_PATH = DATA_DIR / 'journal.log'
+JOURNAL_COMPACT_INTERVAL = max(1.0, float(os.environ.get('TASK_DASHBOARD_JOURNAL_COMPACT_INTERVAL', 60)))
+JOURNAL_MAX_BYTES = int(float(os.environ.get('TASK_DASHBOARD_JOURNAL_MAX_MB', 8)) * 1024 * 1024)
+# 追記ごとに fsync する (無効にすると速いが、OSクラッシュ時に直近の変更を失う可能性がある)
+JOURNAL_FSYNC = os.environ.get('TASK_DASHBOARD_JOURNAL_FSYNC', '1').lower() not in ('0', 'false', 'no')
+
+# 同じファイルへの同時読み書きを防ぐためのロック
+_file_locks = {}
+_file_locks_guard = threading.Lock()
+
+def get_file_lock(filepath):
+    """ファイルごとのロックを取得する"""
+    with _file_locks_guard:
+        return _file_locks.setdefault(str(filepath), threading.RLock())
+
 def load_json_file(filepath):
     """JSONファイルを読み込む"""
-    if filepath.exists():
-        try:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except (json.JSONDecodeError, IOError) as e:
-            print(f"⚠️ Error loading {filepath}: {e}")
+    with get_file_lock(filepath):
+        if filepath.exists():
+            try:
+                with open(filepath, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            except (json.JSONDecodeError, IOError) as e:
+                print(f"⚠️ Error loading {filepath}: {e}")
     return None
 
-def save_json_file(filepath, data):
-    """JSONファイルに保存する"""
+def save_json_file(filepath, data, compact=None):
+    """
+    JSONファイルに保存する
+    一時ファイルに書き込んで fsync してから置き換えるため、途中で落ちても壊れたファイルは残らない
+    """
+    if compact is None:
+        compact = COMPACT_JSON
+    with get_file_lock(filepath):
+        tmp_path = None
+        try:
+            with tempfile.NamedTemporaryFile('w', encoding='utf-8', dir=filepath.parent,
+                                             prefix=f'.{filepath.name}.', suffix='.tmp', delete=False) as f:
+                tmp_path = f.name
+                if compact:
+                    json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+                else:
+                    json.dump(data, f, ensure_ascii=False, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            # 一時ファイルは 0600 で作られるため、元ファイルの権限を引き継ぐ
+            try:
+                mode = filepath.stat().st_mode & 0o777
+            except OSError:
+                mode = 0o644
+            os.chmod(tmp_path, mode)
+            os.replace(tmp_path, filepath)
+            tmp_path = None
+            fsync_directory(filepath.parent)
+            return True
+        except (IOError, OSError, TypeError, ValueError) as e:
+            print(f"⚠️ Error saving {filepath}: {e}")
+            return False
+        finally:
+            if tmp_path:
+                try:
+                    os.unlink(tmp_path)
+                except OSError:
+                    pass
+
+def fsync_directory(dirpath):
+    """リネーム結果をディスクに確定させる (対応OSのみ)"""
+    if not hasattr(os, 'O_DIRECTORY'):
+        return
+    try:
+        fd = os.open(dirpath, os.O_RDONLY | os.O_DIRECTORY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class WriteBehindWriter:
+    """
+    保存をまとめて遅延書き込みするライター
+    同じファイルへの連続した保存は最新のデータだけを interval ごとに1回書き込む
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+
+    def schedule(self, filepath, data, on_flushed=None):
+        """書き込みを予約する。interval が 0 の場合はその場で書き込む"""
+        if self.interval <= 0:
+            saved = save_json_file(filepath, data)
+            if on_flushed:
+                on_flushed(saved)
+            return
+        with self._lock:
+            self._pending[filepath] = (data, on_flushed)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+                self._thread.start()
+        self._wakeup.set()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait()
+            # interval の間に来た保存をまとめる
+            time.sleep(self.interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def flush(self):
+        """予約済みの書き込みをすべて実行する"""
+        # 古いデータが新しいデータを上書きしないよう、書き込みは1スレッドずつ
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            for filepath, (data, on_flushed) in pending.items():
+                saved = save_json_file(filepath, data)
+                if not saved:
+                    # 新しい保存が来ていなければ次回に再試行
+                    with self._lock:
+                        self._pending.setdefault(filepath, (data, on_flushed))
+                    self._wakeup.set()
+                if on_flushed:
+                    on_flushed(saved)
+
+
+WRITER = WriteBehindWriter(FLUSH_INTERVAL)
+atexit.register(WRITER.flush)
+
+
+# コレクション名 → (保存ファイル, データがない場合の初期値)
+COLLECTIONS = {
+    'tasks': (TASKS_FILE, list),
+    'memos': (MEMOS_FILE, list),
+    'projects': (PROJECTS_FILE, list),
+    'meetings': (MEETINGS_FILE, list),
+    'planner': (PLANNER_FILE, dict),
+}
+
+def file_signature(filepath):
+    """外部からの変更検知用に (mtime, size) を取得"""
+    try:
+        st = filepath.stat()
+        return (st.st_mtime_ns, st.st_size)
+    except OSError:
+        return None
+
+
+# レコード単位で更新できるコレクション (id を持つレコードの配列)
+RECORD_COLLECTIONS = ('tasks', 'memos', 'projects', 'meetings')
+
+
+class RecordOpError(Exception):
+    """レコード操作の失敗 (HTTPステータスコード付き)"""
+
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+
+
+def apply_record_ops(records, ops):
+    """
+    レコード単位の操作を適用した新しいリストを返す (元のリストは変更しない)
+    - {"op": "put", "record": {...}, "index": 0}  追加または置き換え (index は新規追加時の位置)
+    - {"op": "patch", "id": "...", "fields": {...}}  指定フィールドだけ更新
+    - {"op": "delete", "id": "..."}  削除 (存在しない場合は何もしない)
+    """
+    if not isinstance(ops, list):
+        raise RecordOpError(400, "ops must be a list")
+    result = list(records)
+
+    def index_of(record_id):
+        for i, record in enumerate(result):
+            if isinstance(record, dict) and record.get('id') == record_id:
+                return i
+        return None
+
+    for op in ops:
+        if not isinstance(op, dict):
+            raise RecordOpError(400, "Each op must be an object")
+        kind = op.get('op')
+        if kind == 'put':
+            record = op.get('record')
+            if not isinstance(record, dict) or not record.get('id'):
+                raise RecordOpError(400, "put requires a record with an id")
+            check_record_id(record['id'])
+            i = index_of(record['id'])
+            if i is not None:
+                result[i] = record
+            elif isinstance(op.get('index'), int):
+                result.insert(max(0, min(len(result), op['index'])), record)
+            else:
+                result.append(record)
+        elif kind == 'patch':
+            fields = op.get('fields')
+            if not isinstance(fields, dict):
+                raise RecordOpError(400, "patch requires fields")
+            i = index_of(op.get('id'))
+            if i is None:
+                raise RecordOpError(404, f"Record not found: {op.get('id')}")
+            result[i] = {**result[i], **fields, 'id': op['id']}
+        elif kind == 'delete':
+            i = index_of(op.get('id'))
+            if i is not None:
+                del result[i]
+        else:
+            raise RecordOpError(400, f"Unknown op: {kind}")
+    return result
+
+
+def parse_record_path(path):
+    """/api/data/<collection>/<id> を (collection, id) に分解する"""
+    parts = path.split('?', 1)[0].split('/')
+    if len(parts) != 5 or parts[:3] != ['', 'api', 'data'] or parts[3] not in RECORD_COLLECTIONS:
+        return None
+    record_id = urllib.parse.unquote(parts[4])
+    return (parts[3], record_id) if record_id else None
+
+
+# /api/data/<collection>/ops は一括更新のエンドポイントのため、レコードのIDには使えない
+RESERVED_RECORD_IDS = {'ops'}
+
+
+def check_record_id(record_id):
+    """レコード単位のAPIで扱えないIDなら RecordOpError (400)"""
+    if record_id in RESERVED_RECORD_IDS:
+        raise RecordOpError(400, f"Record id '{record_id}' is reserved")
+
+
+# /api/query/<collection>: 絞り込みに使えるフィールド (クエリパラメータ名 → レコードから値を取り出す関数)
+QUERY_FILTERS = {
+    'tasks': {
+        'status': lambda record: record.get('status'),
+        'priority': lambda record: record.get('priority'),
+        'category': lambda record: record.get('category'),
+        'project': lambda record: record.get('projectName'),
+        'completed': lambda record: bool(record.get('completed')),
+    },
+    'projects': {
+        'status': lambda record: record.get('status'),
+        'priority': lambda record: record.get('priority'),
+        'category': lambda record: record.get('category'),
+        'project': lambda record: record.get('name'),
+        'completed': lambda record: record.get('status') == 'completed',
+    },
+}
+# 並べ替えに使えるフィールド。priority は high → medium → low の順
+QUERY_SORT_FIELDS = ('deadline', 'priority', 'createdAt', 'updatedAt', 'completedAt', 'title', 'name')
+PRIORITY_ORDER = {'high': 0, 'medium': 1, 'low': 2}
+QUERY_DEFAULT_LIMIT = 50
+QUERY_MAX_LIMIT = 500
+
+
+def index_value(value):
+    """インデックスのキーにできる値にする (リストや辞書は None 扱い)"""
+    return value if value is None or isinstance(value, (str, int, float, bool)) else None
+
+
+class RecordIndex:
+    """
+    コレクションの二次インデックス
+    フィールドの値ごとのレコード位置、期限順に並べたレコード位置、並べ替えごとの順番を持つ (位置はリスト内の順番)
+    """
+
+    def __init__(self, records, filters, sorts=()):
+        self.records = records if isinstance(records, list) else []
+        self.valid = [pos for pos, record in enumerate(self.records) if isinstance(record, dict)]
+        self.positions = {}
+        self.values = {name: {} for name in filters}
+        self._orderings = {}
+        deadlines = []
+        for pos in self.valid:
+            record = self.records[pos]
+            if record.get('id') is not None:
+                self.positions.setdefault(index_value(record['id']), pos)
+            for name, key in filters.items():
+                self.values[name].setdefault(index_value(key(record)), []).append(pos)
+            deadline = record.get('deadline')
+            if isinstance(deadline, str) and deadline:
+                deadlines.append((deadline, pos))
+        deadlines.sort()
+        self.deadline_keys = [deadline for deadline, _ in deadlines]
+        self.deadline_positions = [pos for _, pos in deadlines]
+        for field, descending in sorts:
+            self.ordering(field, descending)
+
+    def sorts(self):
+        """これまでのクエリで使われた並べ替え (保存後のインデックスでも先に作っておく)"""
+        return list(self._orderings)
+
+    def lookup(self, name, values):
+        """いずれかの値に一致するレコードの位置の集合"""
+        index = self.values[name]
+        return set().union(*(index.get(value, ()) for value in values))
+
+    def deadline_range(self, start=None, end=None):
+        """期限が start 以上 end 以下 (文字列比較) のレコードの位置の集合"""
+        lo = bisect.bisect_left(self.deadline_keys, start) if start else 0
+        hi = bisect.bisect_right(self.deadline_keys, end) if end else len(self.deadline_keys)
+        return set(self.deadline_positions[lo:hi])
+
+    def ordering(self, field, descending):
+        """
+        並べ替えた全レコードの (キー, 位置, 各位置の順位) を返す
+        並べ替えごとに最初のクエリで1回だけ作り、以降のページでは使い回す
+        """
+        cached = self._orderings.get((field, descending))
+        if cached is None:
+            keyed = sorted(((order_key(self.records[pos], field, descending, pos), pos) for pos in self.valid),
+                           reverse=descending)
+            rank = [0] * len(self.records)
+            for i, (_, pos) in enumerate(keyed):
+                rank[pos] = i
+            cached = ([key for key, _ in keyed], [pos for _, pos in keyed], rank)
+            self._orderings[(field, descending)] = cached
+        return cached
+
+
+def parse_query_params(collection, query):
+    """
+    /api/query/<collection> のクエリ文字列を解釈する
+    同じフィルターに複数の値 (カンマ区切りまたはパラメータの繰り返し) を指定するといずれかに一致すれば対象
+    不正な値は ValueError
+    """
+    params = urllib.parse.parse_qs(query, keep_blank_values=True)
+    filters = {}
+    for name in QUERY_FILTERS[collection]:
+        if name not in params:
+            continue
+        values = [value for raw in params[name] for value in raw.split(',')]
+        if name == 'completed':
+            if any(value not in ('true', 'false') for value in values):
+                raise ValueError("completed must be true or false")
+            values = [value == 'true' for value in values]
+        filters[name] = values
+
+    sort = params.get('sort', [''])[-1]
+    if sort.lstrip('-') and sort.lstrip('-') not in QUERY_SORT_FIELDS:
+        raise ValueError(f"sort must be one of: {', '.join(QUERY_SORT_FIELDS)} (prefix with - for descending)")
     try:
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        limit = int(params.get('limit', [QUERY_DEFAULT_LIMIT])[-1])
+    except ValueError:
+        raise ValueError("limit must be an integer")
+    return {
+        'filters': filters,
+        'deadline_from': params.get('deadline_from', [''])[-1] or None,
+        'deadline_to': params.get('deadline_to', [''])[-1] or None,
+        'sort': sort,
+        'limit': max(1, min(QUERY_MAX_LIMIT, limit)),
+        'cursor': params.get('cursor', [''])[-1] or None,
+    }
+
+
+def sort_key(record, field, descending):
+    """並べ替えのキー。値のないレコードは昇順・降順とも最後に来る"""
+    if not field:
+        return []
+    value = record.get(field)
+    if field == 'priority':
+        value = PRIORITY_ORDER.get(value)
+    elif value is not None and not isinstance(value, str):
+        value = str(value)
+    if value is None or value == '':
+        return [0 if descending else 1, '']
+    return [1 if descending else 0, value]
+
+
+def order_key(record, field, descending, pos):
+    """同じ値のレコードは、降順でもリスト内の順番に並べる"""
+    return sort_key(record, field, descending) + [-pos if descending else pos]
+
+
+def first_after(keys, last, descending):
+    """並べ替え済みの keys のうち、last より後ろに来る最初の位置 (降順のリストにも使える二分探索)"""
+    lo, hi = 0, len(keys)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if (keys[mid] < last) if descending else (keys[mid] > last):
+            hi = mid
+        else:
+            lo = mid + 1
+    return lo
+
+
+def encode_cursor(data):
+    return base64.urlsafe_b64encode(json.dumps(data, separators=(',', ':')).encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        if not isinstance(data, dict):
+            raise ValueError
+        return data
+    except ValueError:
+        raise ValueError("Invalid cursor")
+
+
+def query_records(index, query):
+    """
+    インデックスを使ってレコードを絞り込み、並べ替えて1ページ分を返す
+    カーソルには前のページの最後のレコードの並べ替えキーとIDを入れるので、
+    ページをめくる間にレコードが追加・削除されても重複や抜けが起きない
+    """
+    candidates = None
+    for name, values in sorted(query['filters'].items(), key=lambda item: len(item[1])):
+        matched = index.lookup(name, [index_value(value) for value in values])
+        candidates = matched if candidates is None else candidates & matched
+        if not candidates:
+            break
+    if query['deadline_from'] or query['deadline_to']:
+        matched = index.deadline_range(query['deadline_from'], query['deadline_to'])
+        candidates = matched if candidates is None else candidates & matched
+
+    field = query['sort'].lstrip('-')
+    descending = query['sort'].startswith('-')
+    keys, ordered, rank = index.ordering(field, descending)
+
+    start_rank = 0
+    if query['cursor']:
+        cursor = decode_cursor(query['cursor'])
+        if cursor.get('sort') != query['sort'] or not isinstance(cursor.get('key'), list):
+            raise ValueError("cursor does not match sort")
+        # 前のページの最後のレコードが今どこにあるか (削除されていれば当時の位置)
+        pos = index.positions.get(index_value(cursor.get('id')), cursor.get('pos'))
+        if not isinstance(pos, int):
+            raise ValueError("Invalid cursor")
+        try:
+            start_rank = first_after(keys, cursor['key'] + [-pos if descending else pos], descending)
+        except TypeError:
+            raise ValueError("Invalid cursor")
+
+    if candidates is None:
+        # 絞り込みなし: 並べ替え済みの順番をそのまま切り出す
+        total = len(ordered)
+        start = start_rank
+        page = ordered[start:start + query['limit']]
+    else:
+        matched = sorted(candidates, key=rank.__getitem__)
+        total = len(matched)
+        start = bisect.bisect_left([rank[pos] for pos in matched], start_rank)
+        page = matched[start:start + query['limit']]
+
+    records = index.records
+    next_cursor = None
+    if page and start + len(page) < total:
+        last = records[page[-1]]
+        next_cursor = encode_cursor({
+            'sort': query['sort'],
+            'key': sort_key(last, field, descending),
+            'id': last.get('id'),
+            'pos': page[-1],
+        })
+    return {"items": [records[pos] for pos in page], "total": total, "next_cursor": next_cursor}
+
+
+# ETag をサーバー再起動後の古いバージョン番号と区別するための起動ID
+BOOT_ID = secrets.token_hex(4)
+# これより小さいレスポンスは圧縮しない
+MIN_COMPRESS_SIZE = 1024
+
+
+def compress_body(body, encoding):
+    """レスポンスボディを圧縮する"""
+    if encoding == 'br':
+        return brotli.compress(body, quality=5)
+    return gzip.compress(body, compresslevel=6, mtime=0)
+
+
+def accepted_encodings(accept_encoding):
+    """Accept-Encoding で受け入れ可能な圧縮形式の集合"""
+    accepted = {}
+    for item in (accept_encoding or '').split(','):
+        token, _, params = item.strip().partition(';')
+        quality = 1.0
+        for param in params.split(';'):
+            key, _, value = param.strip().partition('=')
+            if key == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if token:
+            accepted[token.lower()] = quality
+    return {encoding for encoding in ('br', 'gzip') if accepted.get(encoding, accepted.get('*', 0)) > 0}
+
+
+def choose_encoding(accept_encoding):
+    """Accept-Encoding からレスポンスの圧縮形式を選ぶ (br > gzip)"""
+    accepted = accepted_encodings(accept_encoding)
+    for encoding in (('br', 'gzip') if brotli else ('gzip',)):
+        if encoding in accepted:
+            return encoding
+    return None
+
+
+def etag_matches(if_none_match, etag):
+    """If-None-Match が現在の ETag に一致するか (弱い比較)"""
+    if if_none_match.strip() == '*':
         return True
-    except IOError as e:
-        print(f"⚠️ Error saving {filepath}: {e}")
-        return False
+    return any(tag.strip().removeprefix('W/') == etag for tag in if_none_match.split(','))
 
 
-class ProxyHandler(http.server.SimpleHTTPRequestHandler):
-    def do_GET(self):
-        # データ読み込みAPI
-        if self.path == '/api/data':
-            try:
-                data = {
-                    'tasks': load_json_file(TASKS_FILE) or [],
-                    'memos': load_json_file(MEMOS_FILE) or [],
-                    'projects': load_json_file(PROJECTS_FILE) or []
-                }
-                self.send_response(200)
-                self.send_header('Content-type', 'application/json')
-                self.send_header('Cache-Control', 'no-cache')
-                self.end_headers()
-                self.wfile.write(json.dumps(data, ensure_ascii=False).encode('utf-8'))
-            except Exception as e:
-                self.send_error_response(500, str(e))
-        elif self.path == '/api/data/tasks':
-            try:
-                tasks = load_json_file(TASKS_FILE) or []
-                self.send_response(200)
-                self.send_header('Content-type', 'application/json')
-                self.send_header('Cache-Control', 'no-cache')
-                self.end_headers()
-                self.wfile.write(json.dumps(tasks, ensure_ascii=False).encode('utf-8'))
-            except Exception as e:
-                self.send_error_response(500, str(e))
-        elif self.path == '/api/data/memos':
-            try:
-                memos = load_json_file(MEMOS_FILE) or []
-                self.send_response(200)
-                self.send_header('Content-type', 'application/json')
-                self.send_header('Cache-Control', 'no-cache')
-                self.end_headers()
-                self.wfile.write(json.dumps(memos, ensure_ascii=False).encode('utf-8'))
-            except Exception as e:
-                self.send_error_response(500, str(e))
-        elif self.path == '/api/data/projects':
-            try:
-                projects = load_json_file(PROJECTS_FILE) or []
-                self.send_response(200)
-                self.send_header('Content-type', 'application/json')
-                self.send_header('Cache-Control', 'no-cache')
-                self.end_headers()
-                self.wfile.write(json.dumps(projects, ensure_ascii=False).encode('utf-8'))
-            except Exception as e:
-                self.send_error_response(500, str(e))
-        elif self.path == '/api/data/meetings':
-            try:
-                meetings = load_json_file(MEETINGS_FILE) or []
-                self.send_response(200)
-                self.send_header('Content-type', 'application/json')
-                self.send_header('Cache-Control', 'no-cache')
-                self.end_headers()
-                self.wfile.write(json.dumps(meetings, ensure_ascii=False).encode('utf-8'))
-            except Exception as e:
-                self.send_error_response(500, str(e))
-        elif self.path == '/api/data/planner':
+def encoded_etag(etag, encoding):
+    """圧縮したボディ用の ETag (圧縮形式ごとに別の強い ETag にする)"""
+    return f'{etag[:-1]}-{encoding}"' if encoding else etag
+
+
+# シリアライズ後のサイズがこれを超えるコレクションは、ボディをキャッシュせず毎回ストリーミングで返す
+STREAM_THRESHOLD = int(float(os.environ.get('TASK_DASHBOARD_STREAM_THRESHOLD_MB', 2)) * 1024 * 1024)
+# ストリーミング時に1回で送るチャンクの目安サイズ
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+class CachedBody:
+    """
+    コレクションのバージョンごとのレスポンス (ETag と圧縮済みボディを保持)
+    大きいコレクションは body を持たず、data (または parts) からストリーミングで返す
+    """
+
+    def __init__(self, body, etag, data=None, parts=None):
+        self.body = body
+        self.etag = etag
+        self.data = data
+        self.parts = parts
+        self._encoded = {}
+
+    @property
+    def streaming(self):
+        return self.body is None
+
+    def iter_pieces(self):
+        """JSONを少しずつバイト列で返す (全体を一度にメモリに作らない)"""
+        if self.body is not None:
+            yield self.body
+        elif self.parts is not None:
+            yield b'{'
+            for i, (name, part) in enumerate(self.parts):
+                yield (', ' if i else '').encode('utf-8') + json.dumps(name).encode('utf-8') + b': '
+                yield from part.iter_pieces()
+            yield b'}'
+        else:
+            encoder = json.JSONEncoder(ensure_ascii=False)
+            if isinstance(self.data, list):
+                # json.dumps と同じ区切り文字で1レコードずつ出力
+                yield b'['
+                for i, record in enumerate(self.data):
+                    if i:
+                        yield b', '
+                    yield ''.join(encoder.iterencode(record)).encode('utf-8')
+                yield b']'
+            else:
+                for piece in encoder.iterencode(self.data):
+                    yield piece.encode('utf-8')
+
+    def content_encoding(self, accept_encoding):
+        """Accept-Encoding に対して返す圧縮形式 (ストリーミングは gzip のみ、小さいボディは圧縮しない)"""
+        if self.streaming:
+            return 'gzip' if 'gzip' in accepted_encodings(accept_encoding) else None
+        if len(self.body) < MIN_COMPRESS_SIZE:
+            return None
+        return choose_encoding(accept_encoding)
+
+    def matches(self, if_none_match):
+        """If-None-Match がこのバージョンのいずれかの圧縮形式の ETag に一致するか"""
+        return any(etag_matches(if_none_match, encoded_etag(self.etag, encoding))
+                   for encoding in (None, 'gzip', 'br'))
+
+    def encoded(self, encoding):
+        """圧縮済みボディ (バージョンごとに1回だけ圧縮する)"""
+        if encoding is None or len(self.body) < MIN_COMPRESS_SIZE:
+            return self.body, None
+        body = self._encoded.get(encoding)
+        if body is None:
+            body = compress_body(self.body, encoding)
+            self._encoded[encoding] = body
+        return body, encoding
+
+
+# 静的ファイル配信の設定
+# メモリにキャッシュするファイルの最大サイズと、キャッシュ全体の上限
+STATIC_CACHE_MAX_FILE = 512 * 1024
+STATIC_CACHE_MAX_TOTAL = int(float(os.environ.get('TASK_DASHBOARD_STATIC_CACHE_MB', 32)) * 1024 * 1024)
+# 画像などほとんど変わらないファイルはブラウザに1日キャッシュさせる
+# HTML/JS/CSS はファイル名にハッシュがないため、毎回 ETag で再検証させる
+STATIC_LONG_CACHE_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.gif', '.webp', '.ico', '.svg', '.woff', '.woff2'}
+STATIC_LONG_CACHE_CONTROL = 'public, max-age=86400'
+# その場で圧縮してよい形式
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'application/manifest+json', 'image/svg+xml')
+# 事前圧縮ファイル (foo.js.br / foo.js.gz) の拡張子
+PRECOMPRESSED_SUFFIXES = (('br', '.br'), ('gzip', '.gz'))
+
+
+class StaticAssetCache:
+    """小さい静的ファイル (圧縮版を含む) のメモリキャッシュ (LRU)"""
+
+    def __init__(self, max_total):
+        self.max_total = max_total
+        self._items = OrderedDict()
+        self._total = 0
+        self._lock = threading.Lock()
+
+    def get(self, key, signature):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None or item[0] != signature:
+                return None
+            self._items.move_to_end(key)
+            return item[1]
+
+    def put(self, key, signature, body):
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self._total -= len(old[1])
+            if len(body) > self.max_total:
+                return
+            self._items[key] = (signature, body)
+            self._total += len(body)
+            while self._total > self.max_total:
+                _, (_, evicted) = self._items.popitem(last=False)
+                self._total -= len(evicted)
+
+
+STATIC_CACHE = StaticAssetCache(STATIC_CACHE_MAX_TOTAL)
+
+
+class JsonStorage:
+    """data/*.json にコレクションごとに保存するバックエンド (デフォルト)"""
+    name = 'json'
+
+    def __init__(self, collections):
+        self.collections = collections
+
+    def signature(self, name):
+        return file_signature(self.collections[name][0])
+
+    def load(self, name):
+        """(変更検知用シグネチャ, データ) を返す。データがない場合は None"""
+        filepath = self.collections[name][0]
+        with get_file_lock(filepath):
+            return file_signature(filepath), load_json_file(filepath)
+
+    def save(self, name, data, on_flushed=None):
+        WRITER.schedule(self.collections[name][0], data, on_flushed)
+
+    def apply_ops(self, name, ops, data, on_flushed=None):
+        # JSONファイルは部分更新できないので、適用後のコレクション全体を書き込む
+        self.save(name, data, on_flushed)
+
+    def flush(self):
+        WRITER.flush()
+
+
+class JournalStorage(JsonStorage):
+    """
+    変更を追記専用のジャーナル (data/journal.log) に1行ずつ記録するバックエンド
+    書き込みは変更分の追記だけで済み、コレクションファイルへの書き込みは定期的なスナップショットのみ
+    起動時にはジャーナルを再生してクラッシュ前の状態を復元する
+    """
+    name = 'journal'
+
+    def __init__(self, collections, journal_path, compact_interval, max_bytes, fsync=True):
+        super().__init__(collections)
+        self.journal_path = Path(journal_path)
+        self.compact_interval = compact_interval
+        self.max_bytes = max_bytes
+        self.fsync = fsync
+        self._current = {}
+        self._versions = {}
+        self._dirty = set()
+        self._lock = threading.Lock()
+        self._compact_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._seq = 0
+
+        replayed, good_size = self._replay()
+        if good_size is not None:
+            # 途中で切れた末尾を残したまま追記すると次の行とつながって読めなくなるので、最後の完全な行まで切り詰める
+            os.truncate(self.journal_path, good_size)
+        self._file = open(self.journal_path, 'ab')
+        self._size = self._file.tell()
+        if replayed:
+            print(f"🔁 Replayed {replayed} journal entries")
+            self.compact()
+        threading.Thread(target=self._run, name='journal-compaction', daemon=True).start()
+
+    def _segments(self):
+        """再生対象のジャーナル (コンパクション途中の封印済みファイル → 現在のファイル)"""
+        sealed = sorted(self.journal_path.parent.glob(f'{self.journal_path.stem}.*{self.journal_path.suffix}'))
+        return sealed + ([self.journal_path] if self.journal_path.exists() else [])
+
+    def _replay(self):
+        """
+        ジャーナルを再生して (再生した件数, 現在のジャーナルの切り詰め位置) を返す
+        現在のジャーナルの末尾が書き込み途中で切れていれば、最後の完全な行の終わりの位置を返す (なければ None)
+        """
+        count = 0
+        good_size = None
+        for segment in self._segments():
+            offset = 0
+            with open(segment, 'rb') as f:
+                for line in f:
+                    try:
+                        if not line.endswith(b'\n'):
+                            raise ValueError("missing newline")
+                        entry = json.loads(line)
+                    except ValueError:
+                        # 書き込み途中で落ちた最後の行は無視する
+                        print(f"⚠️ Skipping torn journal entry in {segment.name}")
+                        if segment == self.journal_path:
+                            good_size = offset
+                        break
+                    offset += len(line)
+                    name = entry.get('collection')
+                    if name not in self.collections:
+                        continue
+                    if entry.get('type') == 'replace':
+                        data = entry.get('data')
+                    else:
+                        current = self._current[name] if name in self._current else super().load(name)[1]
+                        try:
+                            data = apply_record_ops(current or [], entry.get('ops'))
+                        except RecordOpError as e:
+                            print(f"⚠️ Skipping journal entry {entry.get('seq')}: {e}")
+                            continue
+                    self._current[name] = data
+                    self._dirty.add(name)
+                    self._seq = max(self._seq, entry.get('seq', 0))
+                    count += 1
+        return count, good_size
+
+    def _append(self, name, entry, data, on_flushed):
+        with self._lock:
+            self._seq += 1
+            entry = {'seq': self._seq, 'ts': time.time(), 'collection': name, **entry}
+            line = (json.dumps(entry, ensure_ascii=False, separators=(',', ':')) + '\n').encode('utf-8')
             try:
-                planner = load_json_file(PLANNER_FILE) or {}
-                self.send_response(200)
-                self.send_header('Content-type', 'application/json')
-                self.send_header('Cache-Control', 'no-cache')
-                self.end_headers()
-                self.wfile.write(json.dumps(planner, ensure_ascii=False).encode('utf-8'))
-            except Exception as e:
-                self.send_error_response(500, str(e))
+                self._file.write(line)
+                self._file.flush()
+                if self.fsync:
+                    os.fsync(self._file.fileno())
+            except (IOError, OSError) as e:
+                print(f"⚠️ Error appending to journal: {e}")
+                saved = False
+            else:
+                self._current[name] = data
+                self._versions[name] = self._versions.get(name, 0) + 1
+                self._dirty.add(name)
+                self._size += len(line)
+                saved = True
+            if self._size >= self.max_bytes:
+                self._wakeup.set()
+        if on_flushed:
+            on_flushed(saved)
+
+    def signature(self, name):
+        # ジャーナル使用中はファイルではなく追記回数で変更を検知する
+        return self._versions.get(name, 0)
+
+    def load(self, name):
+        with self._lock:
+            if name in self._current:
+                return self.signature(name), self._current[name]
+        return self.signature(name), super().load(name)[1]
+
+    def save(self, name, data, on_flushed=None):
+        self._append(name, {'type': 'replace', 'data': data}, data, on_flushed)
+
+    def apply_ops(self, name, ops, data, on_flushed=None):
+        self._append(name, {'type': 'ops', 'ops': ops}, data, on_flushed)
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.compact_interval)
+            self._wakeup.clear()
+            self.compact()
+
+    def compact(self):
+        """変更のあったコレクションをファイルに書き出し、書き出し済みのジャーナルを削除する"""
+        with self._compact_lock:
+            with self._lock:
+                if not self._dirty and self._size == 0:
+                    return
+                snapshot = {name: self._current[name] for name in self._dirty}
+                self._dirty = set()
+                # 現在のジャーナルを封印し、以降の追記は新しいファイルへ
+                self._file.close()
+                sealed = self.journal_path.with_name(
+                    f'{self.journal_path.stem}.{time.time_ns()}{self.journal_path.suffix}'
+                )
+                os.replace(self.journal_path, sealed)
+                self._file = open(self.journal_path, 'ab')
+                self._size = 0
+                fsync_directory(self.journal_path.parent)
+
+            failed = [name for name, data in snapshot.items()
+                      if not save_json_file(self.collections[name][0], data)]
+            if failed:
+                # 封印したジャーナルは残し、次回のコンパクションで再試行する
+                with self._lock:
+                    self._dirty.update(failed)
+                return
+            for segment in self._segments():
+                if segment != self.journal_path and segment.name <= sealed.name:
+                    segment.unlink()
+
+    def flush(self):
+        self.compact()
+
+
+class _RenumberNeeded(Exception):
+    """並び順の位置を振り直す必要がある"""
+
+
+class SqliteStorage:
+    """
+    SQLiteにレコード単位で保存するバックエンド
+    id を持つレコードの配列は1レコード1行で保存し、変更のあった行だけを書き込む
+    それ以外 (planner など) はドキュメントとして丸ごと保存する
+    """
+    name = 'sqlite'
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS records (
+            collection TEXT NOT NULL,
+            id TEXT NOT NULL,
+            position REAL NOT NULL,
+            data TEXT NOT NULL,
+            deadline TEXT,
+            project TEXT,
+            status TEXT,
+            category TEXT,
+            PRIMARY KEY (collection, id)
+        );
+        CREATE INDEX IF NOT EXISTS idx_records_position ON records (collection, position);
+        CREATE INDEX IF NOT EXISTS idx_records_deadline ON records (collection, deadline);
+        CREATE INDEX IF NOT EXISTS idx_records_project ON records (collection, project);
+        CREATE INDEX IF NOT EXISTS idx_records_status ON records (collection, status);
+        CREATE INDEX IF NOT EXISTS idx_records_category ON records (collection, category);
+        CREATE TABLE IF NOT EXISTS documents (
+            collection TEXT PRIMARY KEY,
+            data TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS collection_versions (
+            collection TEXT PRIMARY KEY,
+            version INTEGER NOT NULL
+        );
+    """
+
+    def __init__(self, db_path, collections):
+        self.db_path = Path(db_path)
+        self.collections = collections
+        self._local = threading.local()
+        self.created = not self.db_path.exists()
+        self._conn().executescript(self.SCHEMA)
+
+    def _conn(self):
+        # sqlite3 の接続はスレッドをまたいで使えないのでスレッドごとに作る
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.db_path), timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _record_key(record):
+        if isinstance(record, dict) and record.get('id') not in (None, ''):
+            return str(record['id'])
+        return None
+
+    @classmethod
+    def _is_record_list(cls, data):
+        """1レコード1行で保存できるか (全レコードが重複しない id を持つ配列)"""
+        if not isinstance(data, list):
+            return False
+        keys = [cls._record_key(record) for record in data]
+        return None not in keys and len(set(keys)) == len(keys)
+
+    @staticmethod
+    def _index_columns(record):
+        """インデックス用カラム (deadline, project, status, category)"""
+        def text(value):
+            return value if isinstance(value, str) and value else None
+        project = text(record.get('projectId')) or text(record.get('projectName')) or text(record.get('project'))
+        return (text(record.get('deadline')), project, text(record.get('status')), text(record.get('category')))
+
+    def _bump_version(self, conn, name):
+        conn.execute(
+            'INSERT INTO collection_versions (collection, version) VALUES (?, 1) '
+            'ON CONFLICT(collection) DO UPDATE SET version = version + 1', (name,)
+        )
+
+    def _write_record(self, conn, name, record, position, exists):
+        key = self._record_key(record)
+        text = json.dumps(record, ensure_ascii=False)
+        if exists:
+            conn.execute(
+                'UPDATE records SET position = ?, data = ?, deadline = ?, project = ?, status = ?, category = ? '
+                'WHERE collection = ? AND id = ?',
+                (position, text, *self._index_columns(record), name, key)
+            )
         else:
-            # 静的ファイルを提供
-            super().do_GET()
-    
-    def do_POST(self):
+            conn.execute(
+                'INSERT INTO records (collection, id, position, data, deadline, project, status, category) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (name, key, position, text, *self._index_columns(record))
+            )
+
+    def signature(self, name):
+        row = self._conn().execute(
+            'SELECT version FROM collection_versions WHERE collection = ?', (name,)
+        ).fetchone()
+        return row[0] if row else 0
+
+    def load(self, name):
+        """(変更検知用シグネチャ, データ) を返す。データがない場合は None"""
+        conn = self._conn()
+        with conn:
+            # シグネチャとデータを同じスナップショットから読む
+            conn.execute('BEGIN')
+            signature = self.signature(name)
+            row = conn.execute('SELECT data FROM documents WHERE collection = ?', (name,)).fetchone()
+            if row:
+                return signature, json.loads(row[0])
+            rows = conn.execute(
+                'SELECT data FROM records WHERE collection = ? ORDER BY position', (name,)
+            ).fetchall()
+        if not rows:
+            return signature, None
+        return signature, json.loads('[' + ','.join(r[0] for r in rows) + ']')
+
+    def save(self, name, data, on_flushed=None):
+        """コレクション全体を保存する (変更のあった行だけを書き込む)"""
+        conn = self._conn()
+        try:
+            with conn:
+                if self._is_record_list(data):
+                    existing = {
+                        key: (position, text) for key, position, text in conn.execute(
+                            'SELECT id, position, data FROM records WHERE collection = ?', (name,)
+                        )
+                    }
+                    for position, record in enumerate(data):
+                        key = self._record_key(record)
+                        current = existing.pop(key, None)
+                        if current is None or current[0] != position or \
+                                current[1] != json.dumps(record, ensure_ascii=False):
+                            self._write_record(conn, name, record, float(position), current is not None)
+                    conn.executemany(
+                        'DELETE FROM records WHERE collection = ? AND id = ?',
+                        [(name, key) for key in existing]
+                    )
+                    conn.execute('DELETE FROM documents WHERE collection = ?', (name,))
+                else:
+                    conn.execute('DELETE FROM records WHERE collection = ?', (name,))
+                    conn.execute(
+                        'INSERT OR REPLACE INTO documents (collection, data) VALUES (?, ?)',
+                        (name, json.dumps(data, ensure_ascii=False))
+                    )
+                self._bump_version(conn, name)
+            saved = True
+        except sqlite3.Error as e:
+            print(f"⚠️ Error saving {name} to SQLite: {e}")
+            saved = False
+        if on_flushed:
+            on_flushed(saved)
+
+    def _position_for(self, conn, name, data, index):
+        """data[index] を挿入する位置 (前後のレコードの中間値)"""
+        def position_of(record):
+            row = conn.execute(
+                'SELECT position FROM records WHERE collection = ? AND id = ?', (name, self._record_key(record))
+            ).fetchone()
+            return row[0] if row else None
+
+        before = next((p for p in (position_of(r) for r in reversed(data[:index])) if p is not None), None)
+        after = next((p for p in (position_of(r) for r in data[index + 1:]) if p is not None), None)
+        if before is None and after is None:
+            return 0.0
+        if before is None:
+            return after - 1.0
+        if after is None:
+            return before + 1.0
+        middle = (before + after) / 2
+        return middle if before < middle < after else None
+
+    def apply_ops(self, name, ops, data, on_flushed=None):
+        """put/patch/delete 操作を該当する行だけに反映する"""
+        conn = self._conn()
+        if not self._is_record_list(data) or \
+                conn.execute('SELECT 1 FROM documents WHERE collection = ?', (name,)).fetchone():
+            self.save(name, data, on_flushed)
+            return
+        positions = {self._record_key(record): i for i, record in enumerate(data)}
+        try:
+            with conn:
+                for op in ops:
+                    key = str(op['record']['id']) if op.get('op') == 'put' else str(op.get('id'))
+                    if key not in positions:
+                        conn.execute('DELETE FROM records WHERE collection = ? AND id = ?', (name, key))
+                        continue
+                    index = positions[key]
+                    row = conn.execute(
+                        'SELECT position FROM records WHERE collection = ? AND id = ?', (name, key)
+                    ).fetchone()
+                    if row:
+                        position = row[0]
+                    else:
+                        position = self._position_for(conn, name, data, index)
+                        if position is None:
+                            # 間に入る値がなくなったら全体を振り直す
+                            raise _RenumberNeeded()
+                    self._write_record(conn, name, data[index], position, row is not None)
+                self._bump_version(conn, name)
+        except _RenumberNeeded:
+            self.save(name, data, on_flushed)
+            return
+        except sqlite3.Error as e:
+            print(f"⚠️ Error saving {name} to SQLite: {e}")
+            if on_flushed:
+                on_flushed(False)
+            return
+        if on_flushed:
+            on_flushed(True)
+
+    def flush(self):
+        pass
+
+
+def migrate_json_to_sqlite(storage, collections):
+    """data/*.json の内容をSQLiteに取り込む"""
+    for name, (filepath, _) in collections.items():
+        data = load_json_file(filepath)
+        if data is not None:
+            storage.save(name, data)
+            count = len(data) if isinstance(data, list) else 1
+            print(f"📥 {filepath.name} → SQLite ({count}件)")
+
+
+def export_sqlite_to_json(storage, collections):
+    """SQLiteの内容を data/*.json に書き出す"""
+    for name, (filepath, _) in collections.items():
+        _, data = storage.load(name)
+        if data is not None and save_json_file(filepath, data):
+            count = len(data) if isinstance(data, list) else 1
+            print(f"📤 SQLite → {filepath.name} ({count}件)")
+
+
+def create_storage(kind):
+    """設定に応じてストレージバックエンドを作成する"""
+    if kind == 'sqlite':
+        storage = SqliteStorage(SQLITE_PATH, COLLECTIONS)
+        if storage.created:
+            # 初回起動時は既存のJSONファイルから移行する
+            migrate_json_to_sqlite(storage, COLLECTIONS)
+        return storage
+    if kind == 'journal':
+        return JournalStorage(COLLECTIONS, JOURNAL_PATH, JOURNAL_COMPACT_INTERVAL, JOURNAL_MAX_BYTES, JOURNAL_FSYNC)
+    return JsonStorage(COLLECTIONS)
+
+
+class CollectionCache:
+    """
+    パース済みコレクションとレスポンス用JSONバイト列のプロセス内キャッシュ
+    保存時に更新し、読み込み時はストレージのシグネチャ (ファイルの mtime/size など) で外部編集を検知する
+    """
+
+    def __init__(self, collections, storage):
+        self.collections = collections
+        self.storage = storage
+        self._entries = {}
+        self._combined = {}
+        self._lock = threading.Lock()
+        # 読み込み→変更→保存 を同じコレクションで直列化するためのロック
+        self._update_locks = {name: threading.RLock() for name in collections}
+        # ストリーミングで返す大きいコレクション
+        self._large = set()
+        self._version = 0
+
+    def _next_version(self):
+        self._version += 1
+        return self._version
+
+    def _entry(self, name):
+        signature = self.storage.signature(name)
+        with self._lock:
+            entry = self._entries.get(name)
+            # 書き込み待ちのデータはファイルより新しいので常にキャッシュを優先
+            if entry is not None and (entry['dirty'] or entry['signature'] == signature):
+                return entry
+        # 初回読み込み、またはストレージが外部で変更された
+        signature, data = self.storage.load(name)
+        if not data:
+            data = self.collections[name][1]()
+        with self._lock:
+            entry = self._new_entry(data, signature)
+            self._entries[name] = entry
+        return entry
+
+    def _new_entry(self, data, signature, dirty=False, index=None):
+        return {'data': data, 'response': None, 'signature': signature,
+                'version': self._next_version(), 'dirty': dirty, 'index': index}
+
+    def _response(self, name, entry):
+        response = entry['response']
+        if response is None:
+            etag = f'"{BOOT_ID}-{entry["version"]}"'
+            if name in self._large:
+                response = CachedBody(None, etag, data=entry['data'])
+            else:
+                body = json.dumps(entry['data'], ensure_ascii=False).encode('utf-8')
+                if len(body) > STREAM_THRESHOLD:
+                    # 次のバージョンからはボディを保持せずストリーミングする
+                    self._large.add(name)
+                response = CachedBody(body, etag)
+            entry['response'] = response
+        return response
+
+    def get(self, name):
+        """パース済みのデータを返す"""
+        return self._entry(name)['data']
+
+    def get_response(self, name):
+        """コレクションのレスポンス (CachedBody) を返す"""
+        return self._response(name, self._entry(name))
+
+    def get_index(self, name):
+        """
+        /api/query 用の二次インデックスと、そのデータのバージョンを返す
+        一度クエリされたコレクションは保存のたびにインデックスを作り直す
+        """
+        entry = self._entry(name)
+        index = entry['index']
+        if index is None:
+            index = RecordIndex(entry['data'], QUERY_FILTERS[name])
+            with self._lock:
+                entry['index'] = index
+        return index, entry['version']
+
+    def get_combined_response(self, names):
+        """/api/data 用に複数コレクションをまとめたレスポンスを返す"""
+        entries = [self._entry(name) for name in names]
+        key = tuple(names)
+        versions = tuple(entry['version'] for entry in entries)
+        with self._lock:
+            cached = self._combined.get(key)
+            if cached is not None and cached[0] == versions:
+                return cached[1]
+        parts = [(name, self._response(name, entry)) for name, entry in zip(names, entries)]
+        etag = f'"{BOOT_ID}-' + '.'.join(str(v) for v in versions) + '"'
+        if any(part.streaming for _, part in parts):
+            response = CachedBody(None, etag, parts=parts)
+        else:
+            # 各コレクションのバイト列を連結するだけで再シリアライズはしない
+            response = CachedBody(b''.join(CachedBody(None, etag, parts=parts).iter_pieces()), etag)
+        with self._lock:
+            self._combined[key] = (versions, response)
+        return response
+
+    def _store(self, name, data, write):
+        """キャッシュを更新し、write(on_flushed) でストレージへ書き込む"""
+        with self._lock:
+            previous = self._entries.get(name)
+        index = None
+        if previous is not None and previous['index'] is not None:
+            # クエリで使われているコレクションは、次のクエリを待たずにインデックスと並べ替えを作り直しておく
+            index = RecordIndex(data, QUERY_FILTERS[name], previous['index'].sorts())
+        with self._lock:
+            entry = self._new_entry(data, None, dirty=True, index=index)
+            self._entries[name] = entry
+        version = entry['version']
+
+        def on_flushed(saved):
+            with self._lock:
+                current = self._entries.get(name)
+                if saved and current is not None and current['version'] == version:
+                    current['signature'] = self.storage.signature(name)
+                    current['dirty'] = False
+
+        write(on_flushed)
+
+    def update(self, name, ops):
+        """レコード操作を適用した結果を保存して返す"""
+        with self._update_locks[name]:
+            new_data = apply_record_ops(self.get(name), ops)
+            self._store(name, new_data, lambda on_flushed: self.storage.apply_ops(name, ops, new_data, on_flushed))
+            return new_data
+
+    def save(self, name, data):
+        """キャッシュを更新し、ストレージへの書き込みを予約する"""
+        with self._update_locks[name]:
+            self._store(name, data, lambda on_flushed: self.storage.save(name, data, on_flushed))
+        return True
+
+
+STORAGE = create_storage(STORAGE_BACKEND)
+atexit.register(STORAGE.flush)
+COLLECTION_CACHE = CollectionCache(COLLECTIONS, STORAGE)
+
+class Metrics:
+    """Prometheus のテキスト形式で出力する簡易メトリクス (カウンター・ゲージ・ヒストグラム)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._meta = {}
+        self._values = {}
+
+    def describe(self, name, kind, help_text, buckets=None):
+        self._meta[name] = (kind, help_text, buckets)
+
+    def inc(self, name, value=1, **labels):
+        """カウンター・ゲージに加算する"""
+        key = (name, tuple(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        """ヒストグラムに値を記録する"""
+        buckets = self._meta[name][2]
+        key = (name, tuple(labels.items()))
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                counts = self._values[key] = [[0] * len(buckets), 0.0, 0]
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    counts[0][i] += 1
+            counts[1] += value
+            counts[2] += 1
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """処理時間をヒストグラムに記録する (例外時は outcome="error")"""
+        start = time.perf_counter()
+        outcome = 'ok'
+        try:
+            yield
+        except BaseException:
+            outcome = 'error'
+            raise
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels, outcome=outcome)
+
+    @staticmethod
+    def _labels(labels, extra=()):
+        pairs = list(labels) + list(extra)
+        if not pairs:
+            return ''
+        escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+        return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+    def render(self):
+        """Prometheus テキスト形式で出力"""
+        with self._lock:
+            values = {key: (value if not isinstance(value, list) else [list(value[0]), value[1], value[2]])
+                      for key, value in self._values.items()}
+        lines = []
+        for name, (kind, help_text, buckets) in self._meta.items():
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            for (metric, labels), value in sorted(values.items(), key=lambda item: str(item[0])):
+                if metric != name:
+                    continue
+                if kind != 'histogram':
+                    lines.append(f'{name}{self._labels(labels)} {value}')
+                    continue
+                counts, total, count = value
+                for bound, bucket_count in zip(buckets, counts):
+                    lines.append(f'{name}_bucket{self._labels(labels, [("le", bound)])} {bucket_count}')
+                lines.append(f'{name}_bucket{self._labels(labels, [("le", "+Inf")])} {count}')
+                lines.append(f'{name}_sum{self._labels(labels)} {total}')
+                lines.append(f'{name}_count{self._labels(labels)} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+METRICS = Metrics()
+METRICS.describe('task_dashboard_http_requests_total', 'counter', 'HTTP requests by route, method and status')
+METRICS.describe('task_dashboard_http_request_duration_seconds', 'histogram', 'HTTP request latency', LATENCY_BUCKETS)
+METRICS.describe('task_dashboard_http_request_bytes_total', 'counter', 'Request body bytes received')
+METRICS.describe('task_dashboard_http_response_bytes_total', 'counter', 'Response bytes sent (headers included)')
+METRICS.describe('task_dashboard_http_requests_in_flight', 'gauge', 'Requests currently being handled')
+METRICS.describe('task_dashboard_upstream_request_duration_seconds', 'histogram', 'OpenAI API call latency', LATENCY_BUCKETS)
+METRICS.describe('task_dashboard_upstream_first_token_seconds', 'histogram', 'Time to first streamed token from the OpenAI API', LATENCY_BUCKETS)
+METRICS.describe('task_dashboard_upstream_connections_total', 'counter', 'OpenAI API requests by whether a pooled keep-alive connection was reused')
+METRICS.describe('task_dashboard_upstream_queue_wait_seconds', 'histogram', 'Time OpenAI API calls waited for rate-limit budget, by priority', LATENCY_BUCKETS)
+METRICS.describe('task_dashboard_upstream_retries_total', 'counter', 'OpenAI API calls retried after a rate limit or transient error, by status')
+METRICS.describe('task_dashboard_llm_cache_requests_total', 'counter', 'LLM response cache lookups by result (hit/miss/bypass/shared) and tier')
+METRICS.describe('task_dashboard_transcript_cache_requests_total', 'counter', 'Transcript cache lookups by result (hit/miss)')
+METRICS.describe('task_dashboard_subprocess_duration_seconds', 'histogram', 'ffmpeg/ffprobe subprocess duration', LATENCY_BUCKETS)
+METRICS.describe('task_dashboard_live_segments_total', 'counter', 'Live transcription segments by result (ok/failed)')
+METRICS.describe('task_dashboard_transcribe_stage_seconds', 'histogram', 'Transcription time by stage (probe/copy/encode/whisper)', LATENCY_BUCKETS)
+
+
+def metrics_route(path):
+    """メトリクスのラベル用にパスをまとめる (レコードIDなどで種類が増えないようにする)"""
+    path = urllib.parse.urlsplit(path).path
+    if not path.startswith('/api/'):
+        return 'static'
+    record = parse_record_path(path)
+    if record:
+        return f'/api/data/{record[0]}/ops' if record[1] == 'ops' else f'/api/data/{record[0]}/:id'
+    if path == '/api/data' or path.startswith('/api/data/') and path[len('/api/data/'):] in COLLECTIONS:
+        return path
+    if path in HEAVY_ROUTES or path == '/api/metrics':
+        return path
+    if path.startswith('/api/jobs/'):
+        return '/api/jobs/:id/events' if path.endswith('/events') else '/api/jobs/:id'
+    if path.startswith('/api/query/') and path[len('/api/query/'):] in QUERY_FILTERS:
+        return path
+    if path == '/api/live':
+        return path
+    live = parse_live_path(path)
+    if live:
+        return f'/api/live/:id/{live[1]}' if live[1] else '/api/live/:id'
+    return '/api/other'
+
+
+# /api/format-transcript: チャンクの並列整形数 (全リクエスト共通の上限)
+FORMAT_PARALLELISM = max(1, int(os.environ.get('TASK_DASHBOARD_FORMAT_PARALLELISM', 4)))
+FORMAT_EXECUTOR = ThreadPoolExecutor(max_workers=FORMAT_PARALLELISM, thread_name_prefix='format')
+
+
+def is_retryable_error(error):
+    """リトライで回復する可能性のあるエラーか (レート制限・サーバーエラー・通信エラー)"""
+    if isinstance(error, urllib.error.HTTPError):
+        return error.code == 429 or error.code >= 500
+    return isinstance(error, (urllib.error.URLError, TimeoutError, ConnectionError))
+
+
+# OpenAI API の接続先 (ローカルのテスト用サーバーなどに差し替え可能) と接続プール設定
+OPENAI_BASE_URL = os.environ.get('OPENAI_BASE_URL') or 'https://api.openai.com/v1'
+UPSTREAM_POOL_SIZE = max(1, int(os.environ.get('TASK_DASHBOARD_UPSTREAM_POOL_SIZE', MAX_HEAVY_REQUESTS)))
+UPSTREAM_CONNECT_TIMEOUT = float(os.environ.get('TASK_DASHBOARD_UPSTREAM_CONNECT_TIMEOUT', 10))
+UPSTREAM_IDLE_TIMEOUT = 30  # これより長く使っていない接続は相手側で閉じられている可能性が高いので捨てる
+UPLOAD_CHUNK_SIZE = 256 * 1024
+
+
+class UpstreamResponse:
+    """
+    OpenAI API のレスポンス
+    最後まで読み終えて閉じると、接続をプールへ戻して次のリクエストで再利用する
+    """
+
+    def __init__(self, client, conn, response):
+        self.client = client
+        self.conn = conn
+        self.response = response
+        self.status = response.status
+        self.headers = response.headers
+
+    def read(self, amt=None):
+        return self.response.read(amt)
+
+    def __iter__(self):
+        return iter(self.response)
+
+    def close(self):
+        if self.conn is None:
+            return
+        conn, self.conn = self.conn, None
+        if self.response.isclosed() and not self.response.will_close:
+            self.client.release(conn)
+        else:
+            # 途中で読むのをやめた接続は再利用できない
+            self.response.close()
+            conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class OpenAIClient:
+    """
+    OpenAI API 用の共有HTTPクライアント
+    keep-alive 接続をプールして再利用し、リクエストごとのTLSハンドシェイクを省く
+    エラーは urllib と同じ例外 (HTTPError / URLError) で通知する
+    urllib と同じく HTTPS_PROXY / HTTP_PROXY (NO_PROXY) のプロキシを経由する
+    """
+
+    def __init__(self, base_url, pool_size, connect_timeout):
+        parts = urllib.parse.urlsplit(base_url)
+        self.base_url = base_url.rstrip('/')
+        self.scheme = parts.scheme
+        self.host = parts.hostname
+        self.port = parts.port
+        self.prefix = parts.path.rstrip('/')
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self.ssl_context = ssl.create_default_context() if self.scheme == 'https' else None
+        self.proxy, self.proxy_headers = self._find_proxy()
+        # HTTP のプロキシには絶対URLでリクエストする (HTTPS は CONNECT でトンネルを張る)
+        self.target_prefix = self.prefix
+        if self.proxy and self.scheme != 'https':
+            self.target_prefix = f'{self.scheme}://{parts.netloc.rpartition("@")[2]}{self.prefix}'
+        self._idle = []  # (最終利用時刻, 接続)
+        self._lock = threading.Lock()
+
+    def _find_proxy(self):
+        """環境変数のプロキシ設定から (プロキシの (ホスト, ポート), 認証ヘッダー) を返す。使わなければ (None, {})"""
+        proxy_url = urllib.request.getproxies().get(self.scheme)
+        if not proxy_url or urllib.request.proxy_bypass(self.host):
+            return None, {}
+        if '://' not in proxy_url:
+            proxy_url = f'http://{proxy_url}'
+        proxy = urllib.parse.urlsplit(proxy_url)
+        headers = {}
+        if proxy.username:
+            credentials = f'{urllib.parse.unquote(proxy.username)}:{urllib.parse.unquote(proxy.password or "")}'
+            headers['Proxy-Authorization'] = 'Basic ' + base64.b64encode(credentials.encode('utf-8')).decode('ascii')
+        return (proxy.hostname, proxy.port or 8080), headers
+
+    def _connect(self):
+        if self.proxy is None:
+            if self.scheme == 'https':
+                return http.client.HTTPSConnection(self.host, self.port, timeout=self.connect_timeout,
+                                                   context=self.ssl_context)
+            return http.client.HTTPConnection(self.host, self.port, timeout=self.connect_timeout)
+        proxy_host, proxy_port = self.proxy
+        if self.scheme == 'https':
+            conn = http.client.HTTPSConnection(proxy_host, proxy_port, timeout=self.connect_timeout,
+                                               context=self.ssl_context)
+            conn.set_tunnel(self.host, self.port, headers=self.proxy_headers)
+            return conn
+        return http.client.HTTPConnection(proxy_host, proxy_port, timeout=self.connect_timeout)
+
+    def acquire(self):
+        """プールから接続を取り出す (なければ新規作成)。戻り値は (接続, 再利用したか)"""
+        now = time.monotonic()
+        with self._lock:
+            while self._idle:
+                last_used, conn = self._idle.pop()
+                if now - last_used < UPSTREAM_IDLE_TIMEOUT:
+                    return conn, True
+                conn.close()
+        return self._connect(), False
+
+    def release(self, conn):
+        with self._lock:
+            if len(self._idle) < self.pool_size:
+                self._idle.append((time.monotonic(), conn))
+                return
+        conn.close()
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for _, conn in idle:
+            conn.close()
+
+    def request(self, method, path, body=None, headers=None, timeout=60):
+        """
+        リクエストを送信して UpstreamResponse を返す
+        body は bytes か、bytes を返す関数 (イテレータを作り直せるように。ストリーミング送信用)
+        再利用した接続が相手側で閉じられていた場合は、新しい接続で1回だけやり直す
+        """
+        url = self.base_url + path
+        headers = dict(headers or {})
+        api_key = os.environ.get('OPENAI_API_KEY')
+        if api_key:
+            headers['Authorization'] = f'Bearer {api_key}'
+        if self.proxy and self.scheme != 'https':
+            headers.update(self.proxy_headers)
+
+        while True:
+            conn, reused = self.acquire()
+            try:
+                if conn.sock is None:
+                    conn.connect()
+                # 接続確立後は応答待ちのタイムアウトに切り替える
+                conn.sock.settimeout(timeout)
+                conn.request(method, self.target_prefix + path, body=body() if callable(body) else body, headers=headers)
+                response = conn.getresponse()
+            except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError) as e:
+                conn.close()
+                if reused:
+                    continue
+                raise urllib.error.URLError(e)
+            except (OSError, http.client.HTTPException) as e:
+                conn.close()
+                if isinstance(e, (TimeoutError, urllib.error.URLError)):
+                    raise
+                raise urllib.error.URLError(e)
+            break
+
+        METRICS.inc('task_dashboard_upstream_connections_total', reused='true' if reused else 'false')
+        result = UpstreamResponse(self, conn, response)
+        if response.status >= 400:
+            error_body = response.read()
+            result.close()
+            raise urllib.error.HTTPError(url, response.status, response.reason, response.headers, io.BytesIO(error_body))
+        return result
+
+    def post_json(self, path, payload, timeout=60):
+        """JSONをPOSTする (chat/completions など)"""
+        return self.request('POST', path, json.dumps(payload).encode('utf-8'), {
+            'Content-Type': 'application/json'
+        }, timeout=timeout)
+
+    def post_file(self, path, fields, file_field, file_path, timeout=300):
+        """
+        ファイルを multipart/form-data でアップロードする (Whisper など)
+        ファイルは少しずつ読みながら送信し、全体をメモリに載せない
+        """
+        boundary = f'----TaskDashboard{secrets.token_hex(16)}'
+        file_path = Path(file_path)
+        content_type = mimetypes.guess_type(file_path.name)[0] or 'application/octet-stream'
+        head = b''.join(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode('utf-8')
+            for name, value in fields.items()
+        ) + (
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{file_field}"; filename="{file_path.name}"\r\n'
+            f'Content-Type: {content_type}\r\n\r\n'
+        ).encode('utf-8')
+        tail = f'\r\n--{boundary}--\r\n'.encode('utf-8')
+
+        def body():
+            yield head
+            with open(file_path, 'rb') as f:
+                while True:
+                    block = f.read(UPLOAD_CHUNK_SIZE)
+                    if not block:
+                        break
+                    yield block
+            yield tail
+
+        return self.request('POST', path, body, {
+            'Content-Type': f'multipart/form-data; boundary={boundary}',
+            'Content-Length': str(len(head) + file_path.stat().st_size + len(tail))
+        }, timeout=timeout)
+
+
+UPSTREAM = OpenAIClient(OPENAI_BASE_URL, UPSTREAM_POOL_SIZE, UPSTREAM_CONNECT_TIMEOUT)
+atexit.register(UPSTREAM.close)
+
+
+# OpenAI API のレート制限に合わせた送信スケジューラの設定
+# リトライ回数
+UPSTREAM_RETRIES = max(0, int(os.environ.get('TASK_DASHBOARD_UPSTREAM_RETRIES', 3)))
+UPSTREAM_RETRY_BACKOFF = 1.0
+UPSTREAM_MAX_BACKOFF = 30.0
+# レスポンスヘッダーで判明するまでの1分あたりの上限 (0 = ヘッダーで判明するまで制限しない)
+UPSTREAM_RPM = int(os.environ.get('TASK_DASHBOARD_UPSTREAM_RPM', 0))
+UPSTREAM_TPM = int(os.environ.get('TASK_DASHBOARD_UPSTREAM_TPM', 0))
+# 生成トークン数の上限 (max_tokens) を指定しないリクエストで見込んでおく出力トークン数
+DEFAULT_COMPLETION_TOKENS = 1024
+
+# 優先度 (小さいほど先に送信)。ユーザーが画面で待っている処理を一括処理より先に通す
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 1
+UPSTREAM_PRIORITIES = {
+    '/api/generate': PRIORITY_INTERACTIVE,
+    '/api/summarize': PRIORITY_INTERACTIVE,
+    '/api/format-transcript': PRIORITY_BULK,
+    '/api/transcribe': PRIORITY_BULK,
+    '/api/live': PRIORITY_INTERACTIVE,
+}
+
+
+def estimate_tokens(text):
+    """トークン数の概算 (英数字はおよそ4文字で1トークン、日本語などはおよそ1文字1トークン)"""
+    ascii_chars = sum(1 for c in text if c.isascii())
+    return ascii_chars // 4 + (len(text) - ascii_chars) + 1
+
+
+def estimate_chat_tokens(payload):
+    """chat/completions のリクエストが消費するトークン数の見込み (入力 + 出力の上限)"""
+    prompt = sum(estimate_tokens(m.get('content') or '') + 4 for m in payload.get('messages', []))
+    return prompt + int(payload.get('max_tokens') or DEFAULT_COMPLETION_TOKENS)
+
+
+def parse_reset_duration(value):
+    """x-ratelimit-reset-* ヘッダーの値 ("1s", "6m0s", "20ms" など) を秒数に変換"""
+    seconds = 0.0
+    number = ''
+    value = (value or '').strip()
+    i = 0
+    while i < len(value):
+        c = value[i]
+        if c.isdigit() or c == '.':
+            number += c
+            i += 1
+            continue
+        unit = 'ms' if value.startswith('ms', i) else c
+        if not number or unit not in ('ms', 's', 'm', 'h'):
+            return None
+        seconds += float(number) * {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600}[unit]
+        number = ''
+        i += len(unit)
+    if number:
+        seconds += float(number)
+    return seconds
+
+
+def retry_after_seconds(headers):
+    """429/503 レスポンスの retry-after-ms / retry-after ヘッダーを秒数に変換 (なければ None)"""
+    if headers is None:
+        return None
+    try:
+        if headers.get('retry-after-ms'):
+            return float(headers['retry-after-ms']) / 1000
+        if headers.get('retry-after'):
+            return float(headers['retry-after'])
+    except ValueError:
+        pass
+    return None
+
+
+class TokenBucket:
+    """
+    トークンバケット (上限 capacity、毎秒 rate ずつ回復)
+    OpenAI のレスポンスヘッダーで残量を補正し、ほかのクライアントとの共有分も反映する
+    """
+
+    def __init__(self, capacity, rate):
+        self.capacity = capacity
+        self.rate = rate
+        self.level = capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def time_until(self, amount, now):
+        """amount 消費できるようになるまでの秒数"""
+        self._refill(now)
+        amount = min(amount, self.capacity)  # 上限を超えるリクエストは満タンになれば通す
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.rate if self.rate > 0 else UPSTREAM_MAX_BACKOFF
+
+    def take(self, amount, now):
+        self._refill(now)
+        self.level -= min(amount, self.capacity)
+
+    def sync(self, limit, remaining, reset, in_flight, now):
+        """ヘッダーの値 (上限・残量・満タンまでの秒数) で補正する。送信中でまだ反映されていない分は差し引く"""
+        self.capacity = limit
+        if reset and remaining < limit:
+            self.rate = (limit - remaining) / reset
+        else:
+            self.rate = limit / 60
+        self.level = min(limit, remaining - in_flight)
+        self.updated_at = now
+
+
+class _ModelLimits:
+    """モデルごとのレート制限の状態 (OpenAI の制限はモデル単位)"""
+
+    def __init__(self):
+        self.requests = TokenBucket(UPSTREAM_RPM, UPSTREAM_RPM / 60) if UPSTREAM_RPM else None
+        self.tokens = TokenBucket(UPSTREAM_TPM, UPSTREAM_TPM / 60) if UPSTREAM_TPM else None
+        self.waiters = []  # (優先度, 受付順) のヒープ
+        self.in_flight_requests = 0
+        self.in_flight_tokens = 0
+        self.paused_until = 0.0
+
+
+class UpstreamScheduler:
+    """
+    OpenAI API 呼び出しの共通スケジューラ
+    - レスポンスの x-ratelimit-* ヘッダーからリクエスト数・トークン数の残り枠を追跡し、枠が空くまで送信を待たせる
+    - 待っているリクエストは優先度順 (対話的な処理 → 一括処理)、同じ優先度なら到着順に送る
+    - 429 や一時的なエラーはジッター付き指数バックオフでリトライし、429 の間は同じモデルへの送信をまとめて控える
+    """
+
+    def __init__(self, retries, backoff, max_backoff):
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._models = {}
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+
+    def _limits(self, model):
+        limits = self._models.get(model)
+        if limits is None:
+            limits = self._models[model] = _ModelLimits()
+        return limits
+
+    def _admit(self, model, priority, tokens):
+        """送信枠が空き、自分が先頭になるまで待つ"""
+        ticket = (priority, next(self._seq))
+        start = time.perf_counter()
+        with self._cond:
+            limits = self._limits(model)
+            heapq.heappush(limits.waiters, ticket)
+            try:
+                while True:
+                    now = time.monotonic()
+                    wait = max(0.0, limits.paused_until - now)
+                    if limits.waiters[0] == ticket:
+                        if limits.requests:
+                            wait = max(wait, limits.requests.time_until(1, now))
+                        if limits.tokens and tokens:
+                            wait = max(wait, limits.tokens.time_until(tokens, now))
+                        if wait <= 0:
+                            break
+                    self._cond.wait(wait or None)
+            except BaseException:
+                limits.waiters.remove(ticket)
+                heapq.heapify(limits.waiters)
+                self._cond.notify_all()
+                raise
+            heapq.heappop(limits.waiters)
+            if limits.requests:
+                limits.requests.take(1, now)
+            if limits.tokens and tokens:
+                limits.tokens.take(tokens, now)
+            limits.in_flight_requests += 1
+            limits.in_flight_tokens += tokens
+            # 次の先頭に順番が回ったことを知らせる
+            self._cond.notify_all()
+        METRICS.observe('task_dashboard_upstream_queue_wait_seconds', time.perf_counter() - start,
+                        priority='interactive' if priority == PRIORITY_INTERACTIVE else 'bulk')
+        return limits
+
+    def _settle(self, limits, tokens, headers):
+        """レスポンス (エラーを含む) のヘッダーでバケットを補正する"""
+        with self._cond:
+            limits.in_flight_requests -= 1
+            limits.in_flight_tokens -= tokens
+            now = time.monotonic()
+            for kind, in_flight in (('requests', limits.in_flight_requests), ('tokens', limits.in_flight_tokens)):
+                try:
+                    limit = int(headers[f'x-ratelimit-limit-{kind}'])
+                    remaining = int(headers[f'x-ratelimit-remaining-{kind}'])
+                except (TypeError, ValueError, KeyError):
+                    continue
+                reset = parse_reset_duration(headers.get(f'x-ratelimit-reset-{kind}'))
+                bucket = getattr(limits, kind)
+                if bucket is None:
+                    bucket = TokenBucket(limit, limit / 60)
+                    setattr(limits, kind, bucket)
+                bucket.sync(limit, remaining, reset, in_flight, now)
+            self._cond.notify_all()
+
+    def _pause(self, limits, seconds):
+        with self._cond:
+            limits.paused_until = max(limits.paused_until, time.monotonic() + seconds)
+
+    def request(self, route, model, tokens, send, label='Request'):
+        """
+        send() (UpstreamResponse を返す関数) を送信枠に合わせて呼び出す
+        レート制限・一時的なエラーはリトライし、最後のエラーはそのまま送出する
+        """
+        priority = UPSTREAM_PRIORITIES.get(route, PRIORITY_BULK)
+        for attempt in range(self.retries + 1):
+            limits = self._admit(model, priority, tokens)
+            try:
+                response = send()
+            except Exception as e:
+                headers = e.headers if isinstance(e, urllib.error.HTTPError) else None
+                self._settle(limits, tokens, headers)
+                if attempt >= self.retries or not is_retryable_error(e):
+                    raise
+                # フルジッター: 同時に失敗したリクエストが一斉にリトライしないようにばらつかせる
+                wait = random.uniform(0, min(self.max_backoff, self.backoff * (2 ** (attempt + 1))))
+                retry_after = retry_after_seconds(headers)
+                if retry_after is not None:
+                    wait = retry_after + random.uniform(0, self.backoff)
+                status = str(e.code) if isinstance(e, urllib.error.HTTPError) else 'network'
+                if status == '429':
+                    self._pause(limits, wait)
+                METRICS.inc('task_dashboard_upstream_retries_total', route=route, status=status)
+                print(f"⚠️ {label} failed ({e}), retrying in {wait:.1f}s...")
+                time.sleep(wait)
+                continue
+            self._settle(limits, tokens, response.headers)
+            return response
+
+
+SCHEDULER = UpstreamScheduler(UPSTREAM_RETRIES, UPSTREAM_RETRY_BACKOFF, UPSTREAM_MAX_BACKOFF)
+
+
+# LLM応答キャッシュの設定 (TTL を 0 にするとキャッシュしない)
+LLM_CACHE_TTL = float(os.environ.get('TASK_DASHBOARD_LLM_CACHE_TTL', 24 * 60 * 60))
+LLM_CACHE_MAX_TOTAL = int(float(os.environ.get('TASK_DASHBOARD_LLM_CACHE_MB', 16)) * 1024 * 1024)
+LLM_CACHE_DISK_MAX_TOTAL = int(float(os.environ.get('TASK_DASHBOARD_LLM_CACHE_DISK_MB', 0)) * 1024 * 1024)
+LLM_CACHE_DIR = DATA_DIR / 'llm_cache'
+# このヘッダーに bypass を指定するとキャッシュを使わずに生成し直す (結果はキャッシュに入る)
+LLM_CACHE_HEADER = 'X-LLM-Cache'
+
+
+def llm_cache_key(route, payload):
+    """エンドポイント・モデル・プロンプト・生成パラメータから決まるキャッシュキー"""
+    messages = payload.get('messages', [])
+    key = json.dumps([
+        route,
+        payload.get('model'),
+        [m['content'] for m in messages if m.get('role') == 'system'],
+        [m['content'] for m in messages if m.get('role') != 'system'],
+        payload.get('temperature'),
+        payload.get('response_format'),
+    ], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+
+class LLMCache:
+    """
+    OpenAI の応答本文 (choices[0].message.content) のキャッシュ
+    メモリ (LRU) とディスク (data/llm_cache/、任意) の2段構成で、同じキーの同時リクエストは1回の呼び出しにまとめる
+    """
+
+    def __init__(self, ttl, max_total, disk_dir=None, disk_max_total=0):
+        self.ttl = ttl
+        self.max_total = max_total
+        self.disk_dir = disk_dir if disk_max_total > 0 else None
+        self.disk_max_total = disk_max_total
+        self._items = OrderedDict()  # キー → (期限, 本文, バイト数)
+        self._total = 0
+        self._inflight = {}  # キー → Future
+        self._lock = threading.Lock()
+        self._disk_lock = threading.Lock()
+        self._disk_total = 0
+        if self.disk_dir:
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+            self._disk_total = sum(p.stat().st_size for p in self.disk_dir.glob('*.json'))
+
+    @property
+    def enabled(self):
+        return self.ttl > 0
+
+    def _disk_path(self, key):
+        return self.disk_dir / f'{key}.json'
+
+    def _get_memory(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            if item[0] < time.time():
+                self._drop(key)
+                return None
+            self._items.move_to_end(key)
+            return item[1]
+
+    def _put_memory(self, key, expires, content):
+        size = len(content.encode('utf-8'))
+        with self._lock:
+            self._drop(key)
+            if size > self.max_total:
+                return
+            self._items[key] = (expires, content, size)
+            self._total += size
+            while self._total > self.max_total:
+                _, (_, _, evicted) = self._items.popitem(last=False)
+                self._total -= evicted
+
+    def _drop(self, key):
+        old = self._items.pop(key, None)
+        if old is not None:
+            self._total -= old[2]
+
+    def _get_disk(self, key):
+        if not self.disk_dir:
+            return None
+        try:
+            with open(self._disk_path(key), encoding='utf-8') as f:
+                item = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if item.get('expires', 0) < time.time():
+            return None
+        try:
+            os.utime(self._disk_path(key))  # LRU: 使われたものを新しくする
+        except OSError:
+            pass
+        self._put_memory(key, item['expires'], item['content'])
+        return item['content']
+
+    def _put_disk(self, key, expires, content):
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        body = json.dumps({"expires": expires, "content": content}, ensure_ascii=False).encode('utf-8')
+        with self._disk_lock:
+            try:
+                old_size = path.stat().st_size
+            except OSError:
+                old_size = 0
+            tmp_path = path.with_suffix('.tmp')
+            with open(tmp_path, 'wb') as f:
+                f.write(body)
+            os.replace(tmp_path, path)
+            self._disk_total += len(body) - old_size
+            if self._disk_total > self.disk_max_total:
+                self._prune_disk()
+
+    def _prune_disk(self):
+        """ディスク上限を超えたら最後に使われたのが古いものから削除 (TTL の間使われていないもの=期限切れを優先)"""
+        now = time.time()
+        entries = []
+        for path in self.disk_dir.glob('*.json'):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        for mtime, size, path in entries:
+            if total <= self.disk_max_total * 0.9 and mtime + self.ttl > now:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+        self._disk_total = total
+
+    def get(self, key):
+        """キャッシュ済みの本文を返す (なければ None)。戻り値は (本文, 取得元)"""
+        content = self._get_memory(key)
+        if content is not None:
+            return content, 'memory'
+        content = self._get_disk(key)
+        if content is not None:
+            return content, 'disk'
+        return None, None
+
+    def put(self, key, content):
+        expires = time.time() + self.ttl
+        self._put_memory(key, expires, content)
+        try:
+            self._put_disk(key, expires, content)
+        except OSError as e:
+            print(f"⚠️ Could not write LLM cache entry: {e}")
+
+    def get_or_compute(self, key, compute, bypass=False):
+        """
+        キャッシュがあれば返し、なければ compute() を呼んで結果を保存する
+        戻り値は (本文, 結果) で、結果は hit / miss / bypass / shared (同時リクエストの結果を共有)
+        """
+        if not self.enabled:
+            return compute(), 'miss'
+        if not bypass:
+            content, tier = self.get(key)
+            if content is not None:
+                METRICS.inc('task_dashboard_llm_cache_requests_total', result='hit', tier=tier)
+                return content, 'hit'
+
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+        if not leader:
+            # 同じ内容を生成中のリクエストがあれば、その結果を待つ
+            METRICS.inc('task_dashboard_llm_cache_requests_total', result='shared', tier='inflight')
+            return future.result(), 'shared'
+
+        result = 'bypass' if bypass else 'miss'
+        METRICS.inc('task_dashboard_llm_cache_requests_total', result=result, tier='none')
+        try:
+            content = compute()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            self.put(key, content)
+            future.set_result(content)
+            return content, result
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+
+LLM_CACHE = LLMCache(LLM_CACHE_TTL, LLM_CACHE_MAX_TOTAL, LLM_CACHE_DIR, LLM_CACHE_DISK_MAX_TOTAL)
+
+
+def chat_completion(route, payload, timeout=60, bypass=False, label='Request'):
+    """
+    chat/completions を呼び出して本文を返す (キャッシュ経由)
+    レート制限・一時的なエラーはスケジューラがリトライする
+    戻り値は (本文, キャッシュ結果)
+    """
+    def compute():
+        with METRICS.timer('task_dashboard_upstream_request_duration_seconds', endpoint='chat/completions', route=route), \
+                send_chat_completion(route, payload, timeout, label) as response:
+            response_body = json.loads(response.read())
+        choice = response_body['choices'][0]
+        if choice.get('finish_reason') == 'length':
+            print(f"⚠️ {label}: output truncated at max_tokens={payload.get('max_tokens')}")
+        return choice['message']['content']
+
+    return LLM_CACHE.get_or_compute(llm_cache_key(route, payload), compute, bypass)
+
+
+def send_chat_completion(route, payload, timeout=60, label='Request'):
+    """chat/completions をスケジューラ経由で送信し、UpstreamResponse を返す (ストリーミングでも使う)"""
+    return SCHEDULER.request(
+        route, payload.get('model', ''), estimate_chat_tokens(payload),
+        lambda: UPSTREAM.post_json('/chat/completions', payload, timeout=timeout), label
+    )
+
+
+def token_weights(text):
+    """先頭からの推定トークン数の累積 (estimate_tokens と同じ見積もり)。長さは len(text) + 1"""
+    return [0.0, *itertools.accumulate(0.25 if c.isascii() else 1.0 for c in text)]
+
+
+def split_text_by_tokens(text, max_tokens):
+    """
+    長いテキストを文の区切りで、推定トークン数が max_tokens 以下のチャンクに分割
+    同じチャンク数で済む範囲で大きさをそろえる (最後だけ小さいチャンクにしない)
+    """
+    prefix = token_weights(text)
+    total = prefix[-1]
+    if total <= max_tokens:
+        return [text]
+    target = total / -(-total // max_tokens)
+    chunks = []
+    current_pos = 0
+    while current_pos < len(text):
+        remaining = total - prefix[current_pos]
+        if remaining <= min(max_tokens, target * 1.25):
+            chunks.append(text[current_pos:])
+            break
+        end_pos = max(current_pos + 1, bisect.bisect_right(prefix, prefix[current_pos] + target) - 1)
+        # Try to find a good break point
+        for sep in ['。', '．', '. ', '\n\n', '\n', ' ']:
+            last_sep = text.rfind(sep, current_pos, end_pos)
+            if last_sep >= 0 and prefix[last_sep + len(sep)] - prefix[current_pos] > target / 2:
+                end_pos = last_sep + len(sep)
+                break
+        chunks.append(text[current_pos:end_pos])
+        current_pos = end_pos
+    return chunks
+
+
+def text_tail(text, max_tokens):
+    """テキスト末尾の推定 max_tokens トークン分 (できれば文の頭から)"""
+    prefix = token_weights(text)
+    start = bisect.bisect_left(prefix, prefix[-1] - max_tokens)
+    tail = text[start:]
+    for sep in ['。', '．', '. ', '\n']:
+        pos = tail.find(sep)
+        if 0 <= pos < len(tail) // 2:
+            return tail[pos + len(sep):].lstrip()
+    return tail
+
+
+def split_text(text, max_size):
+    """長いテキストを文の区切りでおよそ max_size 文字ずつに分割"""
+    if len(text) <= max_size:
+        return [text]
+    chunks = []
+    current_pos = 0
+    while current_pos < len(text):
+        end_pos = min(current_pos + max_size, len(text))
+        # Try to find a good break point
+        if end_pos < len(text):
+            # Look for sentence endings
+            for sep in ['。', '．', '. ', '\n\n', '\n', ' ']:
+                last_sep = text.rfind(sep, current_pos, end_pos)
+                if last_sep > current_pos + max_size // 2:
+                    end_pos = last_sep + len(sep)
+                    break
+        chunks.append(text[current_pos:end_pos])
+        current_pos = end_pos
+    return chunks
+
+
+# /api/summarize: type に "all" またはリストを指定すると、これらをまとめて1回で生成する
+SUMMARY_TYPES = ('summary', 'minutes', 'actions')
+# これより長い書き起こしは、チャンクごとに要点メモを作ってからまとめる (map-reduce)
+SUMMARIZE_CHUNK_CHARS = max(1000, int(os.environ.get('TASK_DASHBOARD_SUMMARIZE_CHUNK_CHARS', 12000)))
+
+
+def minutes_template(title, participants):
+    """議事録のフォーマット"""
+    return f"""────────────────────────
+【議事録】{title}
+
+■ 会議概要
+・日時: [会議日時]
+・参加者: {participants or '[参加者]'}
+・目的: [会議の目的]
+
+■ 議題と討議内容
+1. [議題1]
+   - 討議内容
+   - 決定事項
+
+2. [議題2]
+   - 討議内容
+   - 決定事項
+
+■ 決定事項まとめ
+・[決定事項1]
+・[決定事項2]
+
+■ 次回までのアクション
+・[担当者]: [アクション内容] (期限: [日付])
+
+■ 次回会議予定
+[次回予定があれば記載]
+────────────────────────"""
+
+
+def combined_summary_prompt(types, title, participants):
+    """要約・議事録・アクションをまとめて1つのJSONで出力させるプロンプト"""
+    sections = []
+    if 'summary' in types:
+        sections.append("""### "summary" (文字列): 会議の要約
+- 重要なポイントを箇条書きで5-10個にまとめる
+- 重要な決定事項は明確に記載
+- 今後の課題やTODOがあれば明記""")
+    if 'minutes' in types:
+        sections.append(f"""### "minutes" (文字列): 正式な議事録
+- 会議名: {title}
+- 参加者: {participants}
+- 以下のフォーマットに従う
+
+{minutes_template(title, participants)}""")
+    if 'actions' in types:
+        sections.append("""### "actions" (配列): アクションアイテム
+- 各要素は {"title": "アクション内容", "assignee": "担当者名（わかる場合）"}
+- 具体的で実行可能なアクションに分解
+- 担当者が明確でない場合は空文字
+- 5-10個程度抽出""")
+    keys = ', '.join(f'"{t}"' for t in types)
+    return f"""あなたは会議の内容を整理するアシスタントです。
+以下の会議メモ・書き起こしから次の成果物をすべて作成し、キー {keys} を持つ1つのJSONオブジェクトで出力してください。
+
+""" + '\n\n'.join(sections) + """
+
+日本語で出力してください。"""
+
+
+def parse_combined_summary(content, types):
+    """まとめて生成した結果を {"summary": ..., "minutes": ..., "actions": [...]} の形に揃える"""
+    data = json.loads(content)
+    result = {}
+    for summary_type in types:
+        value = data.get(summary_type)
+        if summary_type == 'actions':
+            result[summary_type] = value if isinstance(value, list) else []
+        elif isinstance(value, str):
+            result[summary_type] = value
+        else:
+            result[summary_type] = json.dumps(value, ensure_ascii=False, indent=2) if value else ''
+    return result
+
+
+def condense_transcript(text, bypass=False):
+    """
+    長い書き起こしをチャンクごとの要点メモに圧縮する (map-reduce の map)
+    チャンクは書き起こし整形と同じスレッドプールで並列に処理する
+    """
+    chunks = split_text(text, SUMMARIZE_CHUNK_CHARS)
+    print(f"📝 Condensing transcript: {len(text)} chars in {len(chunks)} chunks")
+
+    def condense(i, chunk):
+        payload = {
+            "model": "gpt-4o-mini",
+            "messages": [
+                {"role": "system", "content": f"""あなたは会議の書き起こしを整理するアシスタントです。
+以下は長い会議の書き起こしの一部（パート{i+1}/{len(chunks)}）です。
+後で要約・議事録・アクション抽出に使うため、このパートの内容を漏れなく簡潔なメモにしてください。
+
+## メモに含める内容
+- 議題と討議内容
+- 決定事項
+- アクションアイテム（担当者・期限がわかれば併記）
+- 日時・参加者・次回予定などの会議情報
+
+箇条書きで、日本語で出力してください。"""},
+                {"role": "user", "content": chunk}
+            ],
+            "temperature": 0.3
+        }
+        content, _ = chat_completion('/api/summarize', payload, timeout=120, bypass=bypass,
+                                     label=f"Summary chunk {i+1}")
+        return content
+
+    futures = [FORMAT_EXECUTOR.submit(condense, i, chunk) for i, chunk in enumerate(chunks)]
+    try:
+        notes = [future.result() for future in futures]
+    except Exception:
+        for future in futures:
+            future.cancel()
+        raise
+    return '\n\n'.join(f"【パート{i+1}/{len(notes)}】\n{note}" for i, note in enumerate(notes))
+
+
+def iter_chat_stream(response):
+    """OpenAI の stream: true レスポンス (SSE) から本文の差分を順に取り出す"""
+    for raw in response:
+        line = raw.decode('utf-8').strip()
+        if not line.startswith('data:'):
+            continue
+        data = line[len('data:'):].strip()
+        if data == '[DONE]':
+            # 残りを読み切って接続を再利用できるようにする
+            response.read()
+            return
+        choices = json.loads(data).get('choices') or []
+        delta = choices[0].get('delta', {}).get('content') if choices else None
+        if delta:
+            yield delta
+
+
+class PartialJSON:
+    """
+    ストリーミング中のJSONを少しずつ組み立てる
+    浅い階層のオブジェクト・配列が閉じるたびに、未完了の括弧を補って途中結果をパースする
+    (例: {"tasks": [...]} ならタスクが1件確定するごとに途中結果が得られる)
+    """
+
+    def __init__(self, max_depth=2):
+        self.max_depth = max_depth
+        self.buffer = ''
+        self.stack = []
+        self.in_string = False
+        self.escaped = False
+
+    def feed(self, delta):
+        """差分を追加し、新しく確定した途中結果を返す (なければ None)"""
+        start = len(self.buffer)
+        self.buffer += delta
+        snapshot = None
+        for i in range(start, len(self.buffer)):
+            ch = self.buffer[i]
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif ch == '\\':
+                    self.escaped = True
+                elif ch == '"':
+                    self.in_string = False
+            elif ch == '"':
+                self.in_string = True
+            elif ch == '{':
+                self.stack.append('}')
+            elif ch == '[':
+                self.stack.append(']')
+            elif ch in '}]' and self.stack:
+                self.stack.pop()
+                if len(self.stack) <= self.max_depth:
+                    snapshot = (i + 1, ''.join(reversed(self.stack)))
+        if snapshot is None:
+            return None
+        end, closers = snapshot
+        try:
+            return json.loads(self.buffer[:end] + closers)
+        except ValueError:
+            return None
+
+
+# ffmpeg の同時実行数の上限 (CPUを使い切らないように)
+MAX_FFMPEG = max(1, int(os.environ.get('TASK_DASHBOARD_MAX_FFMPEG', 2)))
+FFMPEG_SLOTS = threading.BoundedSemaphore(MAX_FFMPEG)
+
+
+def run_tool(cmd, **kwargs):
+    """外部コマンド (ffmpeg など) を実行し、所要時間をメトリクスに記録する"""
+    with FFMPEG_SLOTS if os.path.basename(cmd[0]) == 'ffmpeg' else nullcontext(), \
+            METRICS.timer('task_dashboard_subprocess_duration_seconds', command=os.path.basename(cmd[0])):
+        return subprocess.run(cmd, **kwargs)
+
+
+# 書き起こし整形のプロンプトとチャンク分割の設定
+FORMAT_SYSTEM_PROMPT = """あなたは書き起こしテキストを整形する専門家です。
+以下の音声書き起こしテキストを読みやすく整形してください。
+
+## 整形ルール
+1. **段落分け**: 話題の変わり目や話者の変更で適切に改行・段落を分ける
+2. **句読点**: 適切な位置に句点（。）と読点（、）を追加
+3. **話者の識別**: 明らかに話者が変わった場合は、空行を入れて区切る
+4. **見出し**: 大きなトピックの変わり目には見出し（■ や ### など）を追加
+5. **フィラー除去**: 「えーと」「あのー」などの不要なフィラーは削除
+6. **重複削除**: 言い直しや繰り返しは整理
+7. **漢字変換**: ひらがなで書かれた一般的な単語は適切に漢字に変換
+
+## 注意
+- 内容の意味は変えない
+- 専門用語はそのまま維持
+- 質疑応答がある場合は Q: A: 形式にする
+
+整形したテキストのみを出力してください。説明は不要です。"""
+FORMAT_MODEL = 'gpt-4o-mini'
+# モデルの出力トークン数の上限と、整形後の出力が入力の何倍になるかの見込み (句読点・見出しが増える分)
+FORMAT_MAX_OUTPUT_TOKENS = 16384
+FORMAT_OUTPUT_RATIO = 1.3
+FORMAT_OUTPUT_MARGIN = 256
+# 1チャンクの入力の推定トークン数。整形後の出力が上限に収まる大きさまでにする
+FORMAT_CHUNK_TOKENS = min(
+    int((FORMAT_MAX_OUTPUT_TOKENS - FORMAT_OUTPUT_MARGIN) / FORMAT_OUTPUT_RATIO),
+    max(500, int(os.environ.get('TASK_DASHBOARD_FORMAT_CHUNK_TOKENS', 6000))))
+# 2つ目以降のチャンクには、前のチャンクの末尾をこのトークン数ほど文脈として渡す (出力はさせない)
+FORMAT_CONTEXT_TOKENS = 150
+
+
+def format_output_tokens(chunk):
+    """チャンクを整形した出力に必要な max_tokens の見込み"""
+    return min(FORMAT_MAX_OUTPUT_TOKENS,
+               int(estimate_tokens(chunk) * FORMAT_OUTPUT_RATIO) + FORMAT_OUTPUT_MARGIN)
+
+
+def format_transcript(text, bypass=False, progress=None):
+    """
+    書き起こしテキストを整形する
+    長いテキストはチャンクに分けて並列に整形し、元の順番で結合する
+    戻り値は (整形後のテキスト, キャッシュ結果)
+    """
+    print(f"📝 Formatting text: {len(text)} chars")
+
+    # Split into chunks at sentence boundaries
+    chunks = split_text_by_tokens(text, FORMAT_CHUNK_TOKENS)
+    if len(chunks) > 1:
+        print(f"   Split into {len(chunks)} chunks")
+    completed = []
+
+    def format_chunk(i, chunk):
+        chunk_prompt = FORMAT_SYSTEM_PROMPT
+        user_content = f"以下の書き起こしテキストを整形してください:\n\n{chunk}"
+        if len(chunks) > 1:
+            chunk_prompt += f"\n\nこれはパート{i+1}/{len(chunks)}です。"
+        if i > 0:
+            # 区切り目で文や話題が途切れないよう、前のパートの末尾を参考として渡す
+            chunk_prompt += "前のパートの末尾は文脈の把握にのみ使い、出力には含めないでください。"
+            user_content = (f"前のパートの末尾（参考・出力しない）:\n{text_tail(chunks[i - 1], FORMAT_CONTEXT_TOKENS)}\n\n"
+                            f"以下の書き起こしテキストを整形してください:\n\n{chunk}")
+
+        max_tokens = format_output_tokens(chunk)
+        payload = {
+            "model": FORMAT_MODEL,
+            "messages": [
+                {"role": "system", "content": chunk_prompt},
+                {"role": "user", "content": user_content}
+            ],
+            "temperature": 0.3,
+            "max_tokens": max_tokens
+        }
+
+        print(f"   Processing chunk {i+1}/{len(chunks)} ({len(chunk)} chars, max_tokens={max_tokens})...")
+        result = chat_completion('/api/format-transcript', payload, timeout=180, bypass=bypass,
+                                 label=f"Chunk {i+1}")
+        if progress:
+            completed.append(i)
+            progress(len(completed) / len(chunks), f"整形中 ({len(completed)}/{len(chunks)})")
+        return result
+
+    # チャンクを並列に整形し、元の順番で結合する
+    futures = [FORMAT_EXECUTOR.submit(format_chunk, i, chunk) for i, chunk in enumerate(chunks)]
+    try:
+        results = [future.result() for future in futures]
+    except Exception:
+        for future in futures:
+            future.cancel()
+        raise
+
+    # Combine all parts
+    formatted_text = '\n\n'.join(content for content, _ in results)
+    print(f"✅ Formatting complete: {len(formatted_text)} chars")
+    # 全チャンクがキャッシュから返せた場合のみ hit
+    if bypass:
+        cache_result = 'bypass'
+    else:
+        cache_result = 'hit' if all(r == 'hit' for _, r in results) else 'miss'
+    return formatted_text, cache_result
+
+
+# /api/transcribe のアップロード設定
+# 上限を超えるアップロードは本文を読む前に 413 で断る
+MAX_UPLOAD_SIZE = int(float(os.environ.get('TASK_DASHBOARD_MAX_UPLOAD_MB', 2048)) * 1024 * 1024)
+MULTIPART_CHUNK_SIZE = 256 * 1024
+MULTIPART_MAX_HEADER_SIZE = 16 * 1024
+MULTIPART_MAX_FIELD_SIZE = 64 * 1024
+
+
+class MultipartError(Exception):
+    """アップロードを受け付けられない (HTTPステータス付き)"""
+
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+
+
+class HashingWriter:
+    """書き込みながら SHA-256 を計算するファイルラッパー (アップロードを読み直さずにハッシュを得る)"""
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.sha256 = hashlib.sha256()
+
+    def write(self, data):
+        self.sha256.update(data)
+        return self.raw.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self.raw, name)
+
+
+def parse_content_disposition(value):
+    """Content-Disposition ヘッダーから name / filename などのパラメーターを取り出す"""
+    params = {}
+    for item in value.split(';')[1:]:
+        key, _, val = item.strip().partition('=')
+        if key:
+            params[key.lower()] = val.strip().strip('"')
+    return params
+
+
+def stream_multipart(rfile, content_length, boundary, open_file, chunk_size=MULTIPART_CHUNK_SIZE):
+    """
+    multipart/form-data の本文を固定サイズずつ読みながら解析する
+    ファイルのパート (filename 付き) は open_file(name, filename, content_type) が返すファイルへそのまま書き込み、
+    本文全体をメモリに載せない。open_file が None を返したパートは読み捨てる
+    戻り値はファイル以外のフィールドの dict
+    """
+    remaining = content_length
+
+    def read_more():
+        nonlocal remaining
+        if remaining <= 0:
+            raise MultipartError(400, "Unexpected end of multipart body")
+        data = rfile.read(min(chunk_size, remaining))
+        if not data:
+            raise MultipartError(400, "Unexpected end of multipart body")
+        remaining -= len(data)
+        return data
+
+    # 最初の区切りも "\r\n--boundary" として扱えるように改行を補う
+    delimiter = b'\r\n--' + boundary
+    buffer = b'\r\n'
+    fields = {}
+
+    # 先頭の区切りまで読み飛ばす
+    while True:
+        index = buffer.find(delimiter)
+        if index >= 0:
+            buffer = buffer[index + len(delimiter):]
+            break
+        buffer = buffer[-(len(delimiter) - 1):] + read_more()
+
+    while True:
+        while len(buffer) < 2:
+            buffer += read_more()
+        if buffer.startswith(b'--'):
+            # 終端の区切り (残りのエピローグは読み捨てる)
+            while remaining > 0:
+                read_more()
+            return fields
+
+        # パートのヘッダー
+        while b'\r\n\r\n' not in buffer:
+            if len(buffer) > MULTIPART_MAX_HEADER_SIZE:
+                raise MultipartError(400, "Multipart part headers too large")
+            buffer += read_more()
+        raw_headers, buffer = buffer.split(b'\r\n\r\n', 1)
+        headers = {}
+        for line in raw_headers.decode('utf-8', errors='replace').split('\r\n'):
+            key, _, value = line.partition(':')
+            if key.strip():
+                headers[key.strip().lower()] = value.strip()
+        disposition = parse_content_disposition(headers.get('content-disposition', ''))
+        name = disposition.get('name', '')
+
+        if 'filename' in disposition:
+            target = open_file(name, disposition['filename'], headers.get('content-type', ''))
+            field = None
+        else:
+            target = None
+            field = bytearray()
+
+        # 次の区切りまでの本文 (区切りが途中で切れている可能性がある末尾だけバッファに残す)
+        while True:
+            index = buffer.find(delimiter)
+            if index >= 0:
+                body, buffer = buffer[:index], buffer[index + len(delimiter):]
+            else:
+                keep = len(delimiter) - 1
+                body, buffer = buffer[:-keep], buffer[-keep:]
+            if target is not None:
+                target.write(body)
+            elif field is not None:
+                field += body
+                if len(field) > MULTIPART_MAX_FIELD_SIZE:
+                    raise MultipartError(400, f"Form field too large: {name}")
+            if index >= 0:
+                break
+            buffer += read_more()
+        if field is not None:
+            fields[name] = field.decode('utf-8', errors='replace')
+
+
+# Whisper API supported formats: flac, m4a, mp3, mp4, mpeg, mpga, oga, ogg, wav, webm
+AUDIO_EXTENSIONS = ['.webm', '.mp3', '.mp4', '.wav', '.m4a', '.ogg', '.flac', '.oga', '.mpga']
+CONVERT_EXTENSIONS = ['.mov', '.avi', '.mkv']
+
+
+def audio_upload_extension(content_type, filename):
+    """
+    アップロードされた音声の拡張子と、Whisper 用に変換が必要かを決める
+    Content-Type を優先し、わからなければファイル名の拡張子を使う
+    音声・動画以外のファイルは None を返す
+    """
+    content_type = (content_type or '').lower()
+    # Content-Type takes priority over filename
+    if 'quicktime' in content_type or 'mov' in content_type:
+        return '.mov', True  # MOV not supported by Whisper
+    for keyword, ext in (('mp3', '.mp3'), ('mp4', '.mp4'), ('mpeg', '.mp3'), ('wav', '.wav'), ('m4a', '.m4a'),
+                         ('ogg', '.ogg'), ('flac', '.flac'), ('webm', '.webm')):
+        if keyword in content_type:
+            return ext, False
+    # Fallback to filename extension
+    file_ext = '.' + filename.rsplit('.', 1)[-1].lower() if filename and '.' in filename else ''
+    if file_ext in AUDIO_EXTENSIONS:
+        return file_ext, False
+    if file_ext in CONVERT_EXTENSIONS:
+        return file_ext, True
+    if content_type.split(';', 1)[0].strip() in ('', 'application/octet-stream') or content_type.startswith(('audio/', 'video/')):
+        return '.webm', False
+    return None, False
+
+
+# Whisper API limit is 25MB - compress if needed
+WHISPER_MAX_SIZE = 25 * 1024 * 1024  # 25MB
+# 変換時のビットレート (音声認識に十分な品質。長い音声は下げずに分割する)
+SPEECH_BITRATE = 64000
+# 長い音声を分割して並列に書き起こす設定
+# 1区間の長さ(秒) は、変換後のファイルが Whisper の上限に収まる範囲に抑える
+WHISPER_SEGMENT_SECONDS = max(60.0, min(WHISPER_MAX_SIZE * 8 * 0.9 / SPEECH_BITRATE,
+                                        float(os.environ.get('TASK_DASHBOARD_WHISPER_SEGMENT_SECONDS', 600))))
+WHISPER_SEGMENT_OVERLAP = 2.0  # 区間の境目の言葉が切れないように前後に重ねる秒数
+WHISPER_SILENCE_WINDOW = 30.0  # 区切りの目安からこの秒数以内の無音で区切る
+WHISPER_PARALLELISM = max(1, int(os.environ.get('TASK_DASHBOARD_WHISPER_PARALLELISM', 4)))
+WHISPER_EXECUTOR = ThreadPoolExecutor(max_workers=WHISPER_PARALLELISM, thread_name_prefix='whisper')
+WHISPER_MODEL = 'whisper-1'
+WHISPER_LANGUAGE = 'ja'
+# 書き起こし結果のキャッシュ (同じ音声の再アップロードは Whisper を呼ばずに返す)。0 で無効
+TRANSCRIPT_CACHE_MAX_TOTAL = int(float(os.environ.get('TASK_DASHBOARD_TRANSCRIPT_CACHE_MB', 64)) * 1024 * 1024)
+TRANSCRIPT_CACHE_DIR = DATA_DIR / 'transcript_cache'
+
+
+def transcript_cache_key(audio_sha256):
+    """アップロードされた音声のハッシュと書き起こしの設定 (モデル・言語) から決まるキャッシュキー"""
+    return hashlib.sha256(f'{audio_sha256}:{WHISPER_MODEL}:{WHISPER_LANGUAGE}'.encode('utf-8')).hexdigest()
+
+
+class TranscriptCache:
+    """
+    書き起こし結果のディスクキャッシュ (data/transcript_cache/)
+    上限を超えたら最後に使われた時刻 (mtime) が古いものから削除する
+    """
+
+    def __init__(self, cache_dir, max_total):
+        self.cache_dir = cache_dir
+        self.max_total = max_total
+        self._lock = threading.Lock()
+        self._total = 0
+        if self.enabled:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            self._total = sum(p.stat().st_size for p in self.cache_dir.glob('*.json'))
+
+    @property
+    def enabled(self):
+        return self.max_total > 0
+
+    def _path(self, key):
+        return self.cache_dir / f'{key}.json'
+
+    def get(self, key):
+        """キャッシュ済みの書き起こしを返す (なければ None)"""
+        if not self.enabled:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, encoding='utf-8') as f:
+                text = json.load(f)['text']
+            os.utime(path)  # LRU: 使われたものを新しくする
+        except (OSError, ValueError, KeyError):
+            METRICS.inc('task_dashboard_transcript_cache_requests_total', result='miss')
+            return None
+        METRICS.inc('task_dashboard_transcript_cache_requests_total', result='hit')
+        return text
+
+    def put(self, key, text):
+        if not self.enabled or not text:
+            return
+        path = self._path(key)
+        body = json.dumps({"text": text, "model": WHISPER_MODEL, "language": WHISPER_LANGUAGE,
+                           "created_at": datetime.now().isoformat()}, ensure_ascii=False).encode('utf-8')
+        try:
+            with self._lock:
+                try:
+                    old_size = path.stat().st_size
+                except OSError:
+                    old_size = 0
+                tmp_path = path.with_suffix('.tmp')
+                with open(tmp_path, 'wb') as f:
+                    f.write(body)
+                os.replace(tmp_path, path)
+                self._total += len(body) - old_size
+                if self._total > self.max_total:
+                    self._prune()
+        except OSError as e:
+            print(f"⚠️ Could not write transcript cache entry: {e}")
+
+    def _prune(self):
+        entries = []
+        for path in self.cache_dir.glob('*.json'):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_total * 0.9:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+        self._total = total
+
+
+TRANSCRIPT_CACHE = TranscriptCache(TRANSCRIPT_CACHE_DIR, TRANSCRIPT_CACHE_MAX_TOTAL)
+
+
+def parse_ffmpeg_duration(stderr):
+    """ffmpeg のログ (Duration: 01:02:03.45) から入力の長さ(秒)を取り出す"""
+    for line in stderr.splitlines():
+        line = line.strip()
+        if line.startswith('Duration:'):
+            value = line[len('Duration:'):].split(',', 1)[0].strip()
+            try:
+                hours, minutes, seconds = value.split(':')
+                return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+            except ValueError:
+                return None
+    return None
+
+
+def parse_silences(stderr):
+    """silencedetect フィルタのログから無音区間 [(開始, 終了), ...] を取り出す"""
+    silences = []
+    start = None
+    for line in stderr.splitlines():
+        if 'silence_start:' in line:
+            try:
+                start = float(line.split('silence_start:', 1)[1].split()[0])
+            except (IndexError, ValueError):
+                start = None
+        elif 'silence_end:' in line and start is not None:
+            try:
+                end = float(line.split('silence_end:', 1)[1].split()[0])
+            except (IndexError, ValueError):
+                continue
+            silences.append((start, end))
+            start = None
+    return silences
+
+
+def plan_segments(duration, silences, target=WHISPER_SEGMENT_SECONDS, window=WHISPER_SILENCE_WINDOW):
+    """
+    音声を約 target 秒ごとに区切る位置 [0, 区切り1, ..., duration] を決める
+    目安の位置の前後 window 秒以内に無音があれば、その中央で区切る
+    """
+    cuts = [0.0]
+    while duration - cuts[-1] > target + window:
+        ideal = cuts[-1] + target
+        candidates = [(s + e) / 2 for s, e in silences if abs((s + e) / 2 - ideal) <= window]
+        cut = min(candidates, key=lambda t: abs(t - ideal)) if candidates else ideal
+        cuts.append(cut)
+    cuts.append(duration)
+    return cuts
+
+
+def merge_overlap(previous, text, window=200, min_overlap=8):
+    """
+    重ねて書き起こした区間の先頭で、前の区間の末尾と重複している部分を取り除く
+    (タイムスタンプが使えない場合の予備。重複が見つからなければそのまま返す)
+    """
+    head = text.lstrip()
+    tail = previous[-window:]
+    for k in range(min(len(tail), len(head)), min_overlap - 1, -1):
+        if tail.endswith(head[:k]):
+            return head[k:].lstrip()
+    return head
+
+
+def whisper_request(upload_path, response_format='json', prompt=None, route='/api/transcribe'):
+    """
+    Whisper API でファイルを書き起こし、レスポンスのJSONを返す (ファイルを少しずつ読みながらアップロード)
+    prompt には直前の書き起こしを渡すと、つながりのある文として書き起こされる
+    """
+    fields = {
+        'model': WHISPER_MODEL,
+        'language': WHISPER_LANGUAGE,
+        'response_format': response_format
+    }
+    if prompt:
+        fields['prompt'] = prompt
+    try:
+        with METRICS.timer('task_dashboard_upstream_request_duration_seconds', endpoint='audio/transcriptions', route=route), \
+                SCHEDULER.request(route, WHISPER_MODEL, 0, lambda: UPSTREAM.post_file(
+                    '/audio/transcriptions', fields, 'file', upload_path, timeout=300), 'Whisper request') as response:
+            response_body = response.read().decode('utf-8')
+    except urllib.error.HTTPError as e:
+        # エラー内容はJSONで返ってくるので下でまとめて扱う
+        response_body = e.read().decode('utf-8', errors='replace')
+        if not response_body.lstrip().startswith('{'):
+            raise Exception(f"Whisper API call failed: HTTP {e.code} {response_body[:300]}")
+
+    print(f"🔊 Whisper API response: {response_body[:200]}")
+
+    response_data = json.loads(response_body)
+
+    # Check for API errors
+    if 'error' in response_data:
+        raise Exception(f"Whisper API error: {response_data['error'].get('message', response_data['error'])}")
+    return response_data
+
+
+def transcribe_segments(audio_path, cuts, report):
+    """
+    変換済みの音声を cuts の位置で区切り (前後を少し重ねる)、並列に書き起こして順番に結合する
+    区切りはストリームコピーで切り出すので再エンコードしない
+    """
+    segments = list(zip(cuts[:-1], cuts[1:]))
+    print(f"✂️ Splitting {cuts[-1]:.1f}s of audio into {len(segments)} segments")
+    completed = []
+
+    def transcribe_segment(i, start, end):
+        clip_start = max(0.0, start - WHISPER_SEGMENT_OVERLAP)
+        clip_end = min(cuts[-1], end + WHISPER_SEGMENT_OVERLAP)
+        segment_path = audio_path.rsplit('.', 1)[0] + f'_part{i}.mp3'
+        try:
+            result = run_tool([
+                'ffmpeg', '-y', '-v', 'error',
+                '-ss', f'{clip_start:.3f}', '-t', f'{clip_end - clip_start:.3f}',
+                '-i', audio_path, '-c', 'copy', segment_path
+            ], capture_output=True, text=True, timeout=300)
+            if result.returncode != 0:
+                raise Exception(f"音声の分割に失敗しました: {result.stderr[-300:]}")
+            data = whisper_request(segment_path, response_format='verbose_json')
+        finally:
+            if Path(segment_path).exists():
+                Path(segment_path).unlink()
+        completed.append(i)
+        report(0.4 + 0.55 * len(completed) / len(segments), f"Whisper APIで書き起こし中 ({len(completed)}/{len(segments)})")
+
+        if data.get('segments') is None:
+            return None, data.get('text', '')
+        # 重ねた部分は、発話の中央がこの区間に入るものだけ残す
+        last = i == len(segments) - 1
+        texts = []
+        for segment in data['segments']:
+            middle = clip_start + (segment.get('start', 0) + segment.get('end', 0)) / 2
+            if start <= middle and (middle < end or last):
+                texts.append(segment.get('text', '').strip())
+        return texts, data.get('text', '')
+
+    futures = [WHISPER_EXECUTOR.submit(transcribe_segment, i, start, end) for i, (start, end) in enumerate(segments)]
+    try:
+        results = [future.result() for future in futures]
+    except Exception:
+        for future in futures:
+            future.cancel()
+        raise
+
+    text = ''
+    for texts, full_text in results:
+        if texts is not None:
+            piece = ''.join(texts)
+        else:
+            piece = merge_overlap(text, full_text) if text else full_text.strip()
+        text += piece
+    return text
+
+
+# 再エンコードせずに (ストリームコピーで) Whisper に渡せる音声コーデックと、その出力形式
+WHISPER_COPY_FORMATS = {
+    'aac': ('.m4a', 'ipod'),
+    'mp3': ('.mp3', 'mp3'),
+    'opus': ('.ogg', 'ogg'),
+    'vorbis': ('.ogg', 'ogg'),
+    'flac': ('.flac', 'flac'),
+}
+
+
+def probe_audio(filepath):
+    """
+    ffprobe を1回だけ実行し、音声ストリームの有無・コーデック・長さ・ビットレートを調べる
+    ffprobe がない・解析できない場合は None
+    """
+    try:
+        result = run_tool([
+            'ffprobe', '-v', 'error',
+            '-show_entries', 'format=duration,format_name:stream=codec_type,codec_name,bit_rate,duration',
+            '-of', 'json',
+            filepath
+        ], capture_output=True, text=True, timeout=60)
+        info = json.loads(result.stdout) if result.returncode == 0 else None
+    except (OSError, subprocess.SubprocessError, ValueError):
+        info = None
+    if not info:
+        return None
+
+    def number(*values):
+        for value in values:
+            try:
+                return float(value)
+            except (TypeError, ValueError):
+                continue
+        return None
+
+    streams = info.get('streams', [])
+    audio = next((s for s in streams if s.get('codec_type') == 'audio'), {})
+    fmt = info.get('format', {})
+    return {
+        'has_audio': bool(audio),
+        'has_video': any(s.get('codec_type') == 'video' for s in streams),
+        'codec': audio.get('codec_name'),
+        'duration': number(audio.get('duration'), fmt.get('duration')),
+        'bit_rate': number(audio.get('bit_rate')),  # 音声ストリームのみのビットレート
+        'format_name': fmt.get('format_name', ''),
+    }
+
+
+def plan_audio_preparation(needs_conversion, size, probe):
+    """
+    Whisper に渡すまでの処理を決める
+    - direct: 対応形式で上限以下なのでそのまま送る
+    - copy: 動画や非対応コンテナから音声トラックを再エンコードせずに取り出す (1区間で書き起こせる長さのみ)
+    - encode: 音声認識向けの mp3 に1回だけ変換する (長い音声は分割用の無音検出も同じパスで行う)
+    """
+    if not needs_conversion and size <= WHISPER_MAX_SIZE:
+        return 'direct'
+    # 長い音声は変換時の無音検出で区切って並列に書き起こすほうが速いので、取り出しは短いものに限る
+    short = probe and probe['duration'] and probe['duration'] <= WHISPER_SEGMENT_SECONDS + WHISPER_SILENCE_WINDOW
+    if short and probe['codec'] in WHISPER_COPY_FORMATS and (probe['has_video'] or needs_conversion):
+        # ビットレートから取り出した後のサイズがわかり、上限を超えるなら最初から変換する
+        if not (probe['bit_rate'] and probe['duration']) or probe['bit_rate'] * probe['duration'] / 8 <= WHISPER_MAX_SIZE:
+            return 'copy'
+    return 'encode'
+
+
+def copy_audio_track(src_path, codec):
+    """音声トラックを再エンコードせずに取り出す。失敗した場合は None"""
+    ext, muxer = WHISPER_COPY_FORMATS[codec]
+    output_path = src_path.rsplit('.', 1)[0] + f'_audio{ext}'
+    result = run_tool([
+        'ffmpeg', '-y', '-v', 'error', '-i', src_path,
+        '-map', '0:a:0', '-vn', '-c:a', 'copy', '-f', muxer,
+        output_path
+    ], capture_output=True, text=True, timeout=600)
+    if result.returncode != 0:
+        print(f"⚠️ Stream copy failed, falling back to encoding: {result.stderr[-300:]}")
+        if Path(output_path).exists():
+            Path(output_path).unlink()
+        return None
+    return output_path
+
+
+def encode_for_whisper(src_path):
+    """
+    音声認識向けの mp3 (16kHz/モノラル/64kbps) に変換し、同じパスで無音区間も検出する
+    戻り値は (変換後のパス, 長さ(秒), 無音区間)
+    """
+    output_path = src_path.rsplit('.', 1)[0] + '_converted.mp3'
+    result = run_tool([
+        'ffmpeg', '-y', '-hide_banner', '-nostats', '-i', src_path,
+        '-vn',  # No video
+        '-af', 'silencedetect=noise=-35dB:d=0.4',
+        '-ar', '16000',  # 16kHz sample rate (good for speech)
+        '-ac', '1',  # Mono
+        '-b:a', f'{SPEECH_BITRATE // 1000}k',
+        '-f', 'mp3',
+        output_path
+    ], capture_output=True, text=True, timeout=3600)
+
+    if result.returncode != 0:
+        print(f"❌ ffmpeg conversion failed: {result.stderr[-2000:]}")
+        if Path(output_path).exists():
+            Path(output_path).unlink()
+        # Check if it's because no audio stream
+        if 'does not contain any stream' in result.stderr or 'Output file #0 does not contain' in result.stderr:
+            raise Exception("このファイルには音声トラックが含まれていません。音声付きで録画するか、音声ファイルをアップロードしてください。")
+        raise Exception(f"音声変換に失敗しました: {result.stderr[-300:]}")
+    return output_path, parse_ffmpeg_duration(result.stderr), parse_silences(result.stderr)
+
+
+@contextmanager
+def transcribe_stage(timings, stage):
+    """書き起こしの各段階の所要時間を記録する (ログとメトリクス)"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[stage] = time.perf_counter() - start
+        METRICS.observe('task_dashboard_transcribe_stage_seconds', timings[stage], stage=stage)
+
+
+def transcribe_audio(tmp_path, ext, needs_conversion, progress=None):
+    """
+    保存済みの音声ファイルを Whisper API で書き起こす
+    ffprobe で1回だけ調べ、そのまま送る・音声トラックだけ取り出す・1回だけ変換する のいずれかを選ぶ
+    長い音声は区間に分けて並列に書き起こす
+    一時ファイルは成功・失敗に関わらず削除する
+    """
+    report = progress or (lambda fraction, message: None)
+    audio_size = Path(tmp_path).stat().st_size
+    prepared_path = None
+    timings = {}
+
+    try:
+        report(0.05, "音声を確認中...")
+        with transcribe_stage(timings, 'probe'):
+            probe = probe_audio(tmp_path) if shutil.which('ffprobe') else None
+        if probe and not probe['has_audio']:
+            raise Exception("このファイルには音声トラックが含まれていません。音声付きで録画するか、音声ファイルをアップロードしてください。")
+        if probe:
+            print(f"🔎 Probe: codec={probe['codec']} duration={probe['duration']} bit_rate={probe['bit_rate']} "
+                  f"format={probe['format_name']} video={probe['has_video']}")
+
+        mode = plan_audio_preparation(needs_conversion, audio_size, probe)
+        upload_path = tmp_path
+        cuts = None
+        if mode != 'direct':
+            reason = "非対応形式のため" if needs_conversion else f"サイズが大きいため({audio_size // 1024 // 1024}MB > 25MB)"
+            # Check if ffmpeg is available
+            if not shutil.which('ffmpeg'):
+                if needs_conversion:
+                    raise Exception(f"この形式（{ext}）はWhisper APIに対応していません。ffmpegをインストールするか、対応形式（mp3, mp4, wav, webm等）に変換してください。")
+                else:
+                    raise Exception(f"ファイルサイズが大きすぎます（{audio_size // 1024 // 1024}MB > 25MB）。ffmpegをインストールするか、より短い音声ファイルを使用してください。")
+
+            if mode == 'copy':
+                print(f"⚠️ {reason}、音声トラックを取り出し中 (再エンコードなし)...")
+                report(0.1, "音声トラックを取り出し中...")
+                with transcribe_stage(timings, 'copy'):
+                    prepared_path = copy_audio_track(tmp_path, probe['codec'])
+                if prepared_path and Path(prepared_path).stat().st_size <= WHISPER_MAX_SIZE:
+                    upload_path = prepared_path
+                else:
+                    if prepared_path:
+                        Path(prepared_path).unlink()
+                        prepared_path = None
+                    mode = 'encode'
+
+            if mode == 'encode':
+                print(f"⚠️ {reason}、ffmpegで変換中...")
+                report(0.1, "ffmpegで音声を変換中...")
+                with transcribe_stage(timings, 'encode'):
+                    prepared_path, duration, silences = encode_for_whisper(tmp_path)
+                upload_path = prepared_path
+                converted_size = Path(prepared_path).stat().st_size
+                if duration is None:
+                    # 長さがわからない場合はビットレートから見積もる
+                    duration = converted_size * 8 / SPEECH_BITRATE
+                print(f"✅ Converted: {audio_size} bytes → {converted_size} bytes ({duration:.1f}s)")
+                if converted_size > WHISPER_MAX_SIZE or duration > WHISPER_SEGMENT_SECONDS + WHISPER_SILENCE_WINDOW:
+                    cuts = plan_segments(duration, silences)
+            else:
+                print(f"✅ Extracted audio: {audio_size} bytes → {Path(upload_path).stat().st_size} bytes")
+
+        report(0.4, "Whisper APIで書き起こし中...")
+        with transcribe_stage(timings, 'whisper'):
+            if cuts and len(cuts) > 2:
+                return transcribe_segments(upload_path, cuts, report)
+            return whisper_request(upload_path).get('text', '')
+
+    finally:
+        print("⏱️ Transcription stages: " + ', '.join(f"{stage}={seconds:.2f}s" for stage, seconds in timings.items()))
+        # Clean up temp files
+        for path in [tmp_path, prepared_path]:
+            if path and Path(path).exists():
+                Path(path).unlink()
+
+
+# バックグラウンドジョブの設定
+JOB_WORKERS = max(1, int(os.environ.get('TASK_DASHBOARD_JOB_WORKERS', 2)))
+JOB_RETENTION = float(os.environ.get('TASK_DASHBOARD_JOB_RETENTION_HOURS', 24)) * 60 * 60
+JOBS_DIR = DATA_DIR / 'jobs'
+
+
+class JobQueue:
+    """
+    長時間かかる処理 (書き起こし・整形) をバックグラウンドで実行するジョブキュー
+    ジョブの状態は data/jobs/<id>.json に保存するため、接続が切れたクライアントやサーバー再起動後も結果を取得できる
+    """
+    TERMINAL = ('done', 'error')
+
+    def __init__(self, jobs_dir, workers, retention):
+        self.jobs_dir = jobs_dir
+        self.jobs_dir.mkdir(parents=True, exist_ok=True)
+        self.retention = retention
+        self._jobs = {}
+        self._cond = threading.Condition()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='job')
+        self._recover()
+
+    def _path(self, job_id):
+        return self.jobs_dir / f'{job_id}.json'
+
+    def _recover(self):
+        """前回終了時に実行中だったジョブを失敗扱いにする (入力の一時ファイルは残っていないため)"""
+        for path in self.jobs_dir.glob('*.json'):
+            job = load_json_file(path)
+            if job and job.get('status') not in self.TERMINAL:
+                job.update(status='error', error="サーバーの再起動により中断されました。もう一度実行してください。",
+                           updated_at=time.time())
+                save_json_file(path, job, compact=True)
+        self._prune()
+
+    def _prune(self):
+        """保存期間を過ぎたジョブを削除"""
+        cutoff = time.time() - self.retention
+        for path in self.jobs_dir.glob('*.json'):
+            try:
+                if path.stat().st_mtime >= cutoff:
+                    continue
+                path.unlink()
+            except OSError:
+                continue
+            with self._cond:
+                if self._jobs.pop(path.stem, None) is not None:
+                    self._cond.notify_all()
+
+    def submit(self, kind, fn, executor=None):
+        """
+        ジョブを登録して、登録直後の状態を返す
+        fn(progress) は結果 (JSONにできる dict) を返す。progress(割合, メッセージ) で進捗を通知できる
+        executor を指定すると共有のワーカーではなくそちらで実行する (他の処理を待つだけのジョブなど)
+        """
+        self._prune()
+        now = time.time()
+        job = {
+            "id": secrets.token_hex(12),
+            "kind": kind,
+            "status": "queued",
+            "progress": 0.0,
+            "message": "順番待ち...",
+            "result": None,
+            "error": None,
+            "created_at": now,
+            "updated_at": now,
+            "version": 1
+        }
+        with self._cond:
+            self._jobs[job['id']] = job
+        save_json_file(self._path(job['id']), job, compact=True)
+        (executor or self._executor).submit(self._run, job['id'], fn)
+        return job
+
+    def _run(self, job_id, fn):
+        self.update(job_id, status='running', message="処理中...")
+        try:
+            result = fn(lambda fraction, message=None: self.update(
+                job_id, progress=round(min(1.0, max(0.0, fraction)), 3), **({"message": message} if message else {})
+            ))
+        except Exception as e:
+            print(f"❌ Job {job_id} failed: {e}")
+            self.update(job_id, status='error', error=str(e), message="失敗しました")
+        else:
+            self.update(job_id, status='done', progress=1.0, result=result, message="完了")
+
+    def update(self, job_id, **changes):
+        with self._cond:
+            job = dict(self._jobs[job_id])
+            job.update(changes)
+            job['version'] += 1
+            job['updated_at'] = time.time()
+            self._jobs[job_id] = job
+            self._cond.notify_all()
+        save_json_file(self._path(job_id), job, compact=True)
+        return job
+
+    def get(self, job_id):
+        """ジョブの状態を返す (メモリになければ data/jobs/ から読み込む)"""
+        if not job_id or not all(c in '0123456789abcdef' for c in job_id):
+            return None
+        with self._cond:
+            job = self._jobs.get(job_id)
+        if job is None:
+            job = load_json_file(self._path(job_id))
+            if job is not None:
+                with self._cond:
+                    job = self._jobs.setdefault(job_id, job)
+        return job
+
+    def wait(self, job_id, version, timeout):
+        """状態が version より新しくなるまで最大 timeout 秒待って、現在の状態を返す (削除されていれば None)"""
+        with self._cond:
+            self._cond.wait_for(lambda: job_id not in self._jobs
+                                or self._jobs[job_id]['version'] > version, timeout)
+            return self._jobs.get(job_id)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+JOBS = JobQueue(JOBS_DIR, JOB_WORKERS, JOB_RETENTION)
+atexit.register(JOBS.shutdown)
+
+
+# ライブ書き起こし: 録音中に区切って送られてくる音声を順に書き起こし、途中までの書き起こしを返す
+LIVE_SESSION_TTL = 60 * 60  # 最後の更新からこの秒数が過ぎたセッションは破棄する
+LIVE_FINISH_TIMEOUT = 600  # 録音停止後、残りの区間の書き起こしを待つ最大秒数
+LIVE_GAP_TIMEOUT = 30  # 次の区間を受信中のまま、この秒数進まなければ届かないものとして失敗させる
+LIVE_PROMPT_CHARS = 200  # 前の区間の書き起こしの末尾をこの文字数だけ Whisper の prompt に渡す
+LIVE_MIN_SEGMENT_SIZE = 100  # これより小さい区間は音声なしとして扱う
+LIVE_EXECUTOR = ThreadPoolExecutor(max_workers=WHISPER_PARALLELISM, thread_name_prefix='live')
+# 録音停止後の完了待ち (ジョブ) は共有のジョブワーカーを塞がないよう専用のスレッドで待つ
+LIVE_FINISH_EXECUTOR = ThreadPoolExecutor(max_workers=WHISPER_PARALLELISM, thread_name_prefix='live-finish')
+
+
+class LiveSessionError(Exception):
+    """ライブ書き起こしの操作の失敗 (HTTPステータスコード付き)"""
+
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+
+
+def parse_live_path(path):
+    """/api/live/<id>[/<action>[/<seq>]] を (id, action, seq) に分解する (該当しなければ None)"""
+    path = urllib.parse.urlsplit(path).path
+    if not path.startswith('/api/live/'):
+        return None
+    parts = path[len('/api/live/'):].split('/')
+    if not parts[0] or len(parts) > 3:
+        return None
+    return tuple(parts + [''] * (3 - len(parts)))
+
+
+def transcribe_live_segment(path, ext, needs_conversion, prompt):
+    """
+    ライブ書き起こしの1区間を書き起こす
+    Whisper がそのまま扱える形式なら変換せずに送る。音声ファイルは成功・失敗に関わらず削除する
+    """
+    if needs_conversion:
+        return transcribe_audio(path, ext, needs_conversion)
+    try:
+        if Path(path).stat().st_size < LIVE_MIN_SEGMENT_SIZE:
+            return ''
+        return whisper_request(path, prompt=prompt, route='/api/live').get('text', '')
+    finally:
+        if Path(path).exists():
+            Path(path).unlink()
+
+
+class LiveTranscriber:
+    """
+    ライブ書き起こしのセッションを管理する
+    区間 (seq = 0, 1, 2, ...) は届いた順に関係なく seq の順に1つずつ書き起こす
+    (前の区間の書き起こしを次の区間の prompt に使うため)。セッションはメモリ上にだけ持つ
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._sessions = {}
+        self._cond = threading.Condition()
+
+    def create(self):
+        """セッションを作成して、作成直後の状態を返す"""
+        self._prune()
+        now = time.time()
+        session = {
+            "id": secrets.token_hex(12),
+            "status": "recording",
+            "texts": [],
+            "pending": {},
+            "next_seq": 0,
+            "received": 0,
+            "uploading": 0,
+            "total": None,
+            "failed": [],
+            "running": False,
+            "created_at": now,
+            "updated_at": now,
+            "version": 1
+        }
+        with self._cond:
+            self._sessions[session['id']] = session
+            return self._snapshot(session)
+
+    def _prune(self):
+        """更新が止まってから ttl 秒を過ぎたセッションを破棄"""
+        cutoff = time.time() - self.ttl
+        with self._cond:
+            expired = [session for session in self._sessions.values()
+                       if session['updated_at'] < cutoff and not session['running']]
+            for session in expired:
+                del self._sessions[session['id']]
+        for session in expired:
+            self._remove_files(session['pending'].values())
+
+    @staticmethod
+    def _remove_files(segments):
+        for path, _, _ in segments:
+            if Path(path).exists():
+                Path(path).unlink()
+
+    @staticmethod
+    def _snapshot(session):
+        """クライアントに返すセッションの状態 (呼び出し側でロックを持つ)"""
+        return {
+            "id": session['id'],
+            "status": session['status'],
+            "text": ''.join(session['texts']),
+            "transcribed": session['next_seq'],
+            "received": session['received'],
+            "total": session['total'],
+            "failed_segments": list(session['failed']),
+            "created_at": session['created_at'],
+            "updated_at": session['updated_at'],
+            "version": session['version']
+        }
+
+    def _session(self, session_id):
+        session = self._sessions.get(session_id)
+        if session is None:
+            raise LiveSessionError(404, "Live session not found")
+        return session
+
+    def _touch(self, session):
+        if session['total'] is not None and session['next_seq'] >= session['total']:
+            session['status'] = 'done'
+        session['version'] += 1
+        session['updated_at'] = time.time()
+        self._cond.notify_all()
+
+    def get(self, session_id):
+        with self._cond:
+            session = self._sessions.get(session_id)
+            return self._snapshot(session) if session else None
+
+    @contextmanager
+    def uploading(self, session_id):
+        """区間の受信中であることを記録する (受信中の区間がなければ完了待ちはすぐに失敗させる)"""
+        with self._cond:
+            self._session(session_id)['uploading'] += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                session = self._sessions.get(session_id)
+                if session is not None:
+                    session['uploading'] -= 1
+                    self._touch(session)
+
+    @staticmethod
+    def _stalled(session):
+        """録音終了後、次に書き起こす区間が届いておらず書き起こし中でもない"""
+        return (session['total'] is not None and session['next_seq'] < session['total']
+                and session['next_seq'] not in session['pending'] and not session['running'])
+
+    def add_segment(self, session_id, seq, path, ext, needs_conversion):
+        """
+        区間の音声を登録し、書き起こしを始める
+        同じ seq の再送は無視する (アップロードのリトライで二重に書き起こさない)
+        """
+        start = False
+        try:
+            with self._cond:
+                session = self._session(session_id)
+                if session['total'] is not None and seq >= session['total']:
+                    raise LiveSessionError(409, "Live session is already finished")
+                if seq >= session['next_seq'] and seq not in session['pending']:
+                    session['pending'][seq] = (path, ext, needs_conversion)
+                    session['received'] += 1
+                    path = None
+                    start = not session['running']
+                    session['running'] = True
+                    self._touch(session)
+                state = self._snapshot(session)
+        finally:
+            if path and Path(path).exists():
+                Path(path).unlink()
+        if start:
+            LIVE_EXECUTOR.submit(self._drain, session_id)
+        return state
+
+    def _drain(self, session_id):
+        """届いている区間を seq の順に書き起こす (1つのセッションにつき同時に1スレッドだけが実行する)"""
+        while True:
+            with self._cond:
+                session = self._sessions.get(session_id)
+                if session is None:
+                    return
+                seq = session['next_seq']
+                segment = session['pending'].pop(seq, None)
+                if segment is None:
+                    session['running'] = False
+                    return
+                prompt = ''.join(session['texts'])[-LIVE_PROMPT_CHARS:]
+
+            try:
+                text = transcribe_live_segment(*segment, prompt)
+                METRICS.inc('task_dashboard_live_segments_total', result='ok')
+            except Exception as e:
+                print(f"❌ Live segment {session_id}/{seq} failed: {e}")
+                METRICS.inc('task_dashboard_live_segments_total', result='failed')
+                text = None
+
+            with self._cond:
+                session = self._sessions.get(session_id)
+                if session is None:
+                    return
+                session['next_seq'] = seq + 1
+                if text is None:
+                    session['failed'].append(seq)
+                else:
+                    session['texts'].append(text.strip())
+                self._touch(session)
+
+    def finish(self, session_id, total):
+        """録音の終了を登録する。total は送った区間の数"""
+        with self._cond:
+            session = self._session(session_id)
+            if total < session['next_seq']:
+                raise LiveSessionError(400, "segments is smaller than the number of transcribed segments")
+            dropped = [session['pending'].pop(seq) for seq in list(session['pending']) if seq >= total]
+            session['total'] = total
+            session['status'] = 'finishing'
+            self._touch(session)
+        self._remove_files(dropped)
+
+    def wait(self, session_id, version, timeout):
+        """状態が version より新しくなるまで最大 timeout 秒待って、現在の状態を返す (破棄されていれば None)"""
+        with self._cond:
+            self._cond.wait_for(lambda: session_id not in self._sessions
+                                or self._sessions[session_id]['version'] > version, timeout)
+            session = self._sessions.get(session_id)
+            return self._snapshot(session) if session else None
+
+    def wait_finished(self, session_id, progress=None):
+        """
+        残りの区間の書き起こしが終わるまで待って、最終的な状態を返す
+        次の区間が届いておらず受信中でもなければすぐに、受信中のまま LIVE_GAP_TIMEOUT 秒進まなければ失敗させる
+        """
+        deadline = time.monotonic() + LIVE_FINISH_TIMEOUT
+        state = self.get(session_id)
+        while state is not None and state['status'] != 'done':
+            if progress and state['total']:
+                progress(state['transcribed'] / state['total'],
+                         f"残りを書き起こし中 ({state['transcribed']}/{state['total']})")
+            with self._cond:
+                session = self._sessions.get(session_id)
+                stalled = session is not None and self._stalled(session)
+                if stalled and not session['uploading']:
+                    raise Exception(f"ライブ書き起こしの区間 {session['next_seq']} が届いていません")
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise Exception("ライブ書き起こしの完了待ちがタイムアウトしました")
+            version = state['version']
+            state = self.wait(session_id, version, min(remaining, LIVE_GAP_TIMEOUT))
+            if stalled and state is not None and state['version'] == version:
+                raise Exception(f"ライブ書き起こしの区間 {state['transcribed']} の受信が進みません")
+        if state is None:
+            raise Exception("ライブ書き起こしのセッションが見つかりません")
+        return state
+
+    def discard(self, session_id):
+        with self._cond:
+            session = self._session(session_id)
+            del self._sessions[session_id]
+            self._cond.notify_all()
+        self._remove_files(session['pending'].values())
+
+    def shutdown(self):
+        LIVE_EXECUTOR.shutdown(wait=False, cancel_futures=True)
+        LIVE_FINISH_EXECUTOR.shutdown(wait=False, cancel_futures=True)
+        with self._cond:
+            sessions = list(self._sessions.values())
+            self._sessions.clear()
+        for session in sessions:
+            self._remove_files(session['pending'].values())
+
+
+LIVE = LiveTranscriber(LIVE_SESSION_TTL)
+atexit.register(LIVE.shutdown)
+
+
+class CountingWriter:
+    """送信バイト数を数える wfile のラッパー"""
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.count = 0
+
+    def write(self, data):
+        self.count += len(data)
+        return self.raw.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self.raw, name)
+
+
+class PooledHTTPServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    """上限付きスレッドプールでリクエストを並行処理するサーバー"""
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 128
+
+    def __init__(self, server_address, handler_class, max_workers=MAX_WORKERS):
+        super().__init__(server_address, handler_class)
+        self.max_workers = max_workers
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='worker')
+
+    def process_request(self, request, client_address):
+        # スレッドを毎回生成せず、プールのワーカーに処理を渡す
+        self.executor.submit(self.process_request_thread, request, client_address)
+
+    def server_close(self):
+        super().server_close()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+class ProxyHandler(http.server.SimpleHTTPRequestHandler):
+    def setup(self):
+        super().setup()
+        self.wfile = CountingWriter(self.wfile)
+
+    def handle_one_request(self):
+        self._request_start = None
+        self._status = None
+        self._headers_sent = False
+        try:
+            super().handle_one_request()
+        finally:
+            if self._request_start is not None:
+                self.record_request_metrics()
+
+    def parse_request(self):
+        ok = super().parse_request()
+        if ok:
+            self._request_start = time.perf_counter()
+            self._bytes_before = self.wfile.count
+            METRICS.inc('task_dashboard_http_requests_in_flight', 1)
+        return ok
+
+    def send_response_only(self, code, message=None):
+        self._status = code
+        super().send_response_only(code, message)
+
+    def end_headers(self):
+        super().end_headers()
+        # 100 Continue などの中間応答のあとは、まだ本来のレスポンスを送れる
+        if self._status is not None and self._status >= 200:
+            self._headers_sent = True
+
+    def record_request_metrics(self):
+        """リクエストの件数・レイテンシ・送受信バイト数を記録する"""
+        route = metrics_route(self.path)
+        method = self.command or ''
+        METRICS.inc('task_dashboard_http_requests_in_flight', -1)
+        METRICS.inc('task_dashboard_http_requests_total', route=route, method=method, status=str(self._status or 0))
+        METRICS.observe('task_dashboard_http_request_duration_seconds',
+                        time.perf_counter() - self._request_start, route=route, method=method)
+        try:
+            received = int(self.headers.get('Content-Length') or 0)
+        except ValueError:
+            received = 0
+        METRICS.inc('task_dashboard_http_request_bytes_total', received, route=route)
+        METRICS.inc('task_dashboard_http_response_bytes_total', self.wfile.count - self._bytes_before, route=route)
+
+    def do_GET(self):
+        # データ読み込みAPI
+        if self.path == '/api/metrics':
+            body = METRICS.render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.send_header('Cache-Control', 'no-cache')
+            self.end_headers()
+            self.wfile.write(body)
+        elif self.path == '/api/data':
+            try:
+                self.send_cached_json(COLLECTION_CACHE.get_combined_response(('tasks', 'memos', 'projects')))
+            except Exception as e:
+                self.send_error_response(500, str(e))
+        elif self.path.startswith('/api/data/') and self.path[len('/api/data/'):] in COLLECTIONS:
+            try:
+                self.send_cached_json(COLLECTION_CACHE.get_response(self.path[len('/api/data/'):]))
+            except Exception as e:
+                self.send_error_response(500, str(e))
+        # 絞り込み・並べ替え・ページ分割したレコード (/api/query/<collection>?status=...&sort=...&cursor=...)
+        elif self.path.startswith('/api/query/'):
+            url = urllib.parse.urlsplit(self.path)
+            collection = url.path[len('/api/query/'):]
+            if collection not in QUERY_FILTERS:
+                self.send_error(404, "Endpoint not found")
+                return
+            try:
+                query = parse_query_params(collection, url.query)
+                index, version = COLLECTION_CACHE.get_index(collection)
+                self.send_json({**query_records(index, query), "version": version})
+            except ValueError as e:
+                self.send_error_response(400, str(e))
+            except Exception as e:
+                self.send_error_response(500, str(e))
+        # ジョブの状態 (/api/jobs/<id>) と進捗のストリーム (/api/jobs/<id>/events)
+        elif self.path.startswith('/api/jobs/'):
+            job_id, _, action = self.path[len('/api/jobs/'):].partition('/')
+            job = JOBS.get(job_id)
+            if job is None:
+                self.send_error_response(404, "Job not found")
+            elif action == 'events':
+                self.stream_job(job)
+            elif not action:
+                self.send_json(job)
+            else:
+                self.send_error(404, "Endpoint not found")
+        # ライブ書き起こしの状態 (/api/live/<id>) と途中経過のストリーム (/api/live/<id>/events)
+        elif parse_live_path(self.path):
+            session_id, action, _ = parse_live_path(self.path)
+            state = LIVE.get(session_id)
+            if state is None:
+                self.send_error_response(404, "Live session not found")
+            elif action == 'events':
+                self.stream_updates(state, lambda state: LIVE.wait(session_id, state['version'], timeout=15),
+                                    lambda state: state['status'] == 'done')
+            elif not action:
+                self.send_json(state)
+            else:
+                self.send_error(404, "Endpoint not found")
+        else:
+            # 静的ファイルを提供
+            self.serve_static()
+
+    def do_HEAD(self):
+        self.serve_static(head_only=True)
+
+    def serve_static(self, head_only=False):
+        """
+        静的ファイルを配信する
+        ETag/Last-Modified による 304、事前圧縮ファイル (.br/.gz) の配信、
+        小さいファイルのメモリキャッシュ、大きいファイルの sendfile 転送を行う
+        """
+        url_path = urllib.parse.urlsplit(self.path).path
+        # .env などの隠しファイルは配信しない
+        if any(part.startswith('.') for part in url_path.split('/')):
+            self.send_error(404, "File not found")
+            return
+        path = self.translate_path(self.path)
+        if os.path.isdir(path) and url_path.endswith('/'):
+            path = os.path.join(path, 'index.html')
+        if not os.path.isfile(path):
+            # ディレクトリのリダイレクト・一覧表示などは標準の処理に任せる
+            if head_only:
+                super().do_HEAD()
+            else:
+                super().do_GET()
+            return
+
+        try:
+            st = os.stat(path)
+        except OSError:
+            self.send_error(404, "File not found")
+            return
+        ctype = self.guess_type(path)
+
+        # 事前圧縮ファイルがあれば優先する (元ファイルより古いものは使わない)
+        source_path, source_st, encoding = path, st, None
+        accepted = accepted_encodings(self.headers.get('Accept-Encoding'))
+        for candidate, suffix in PRECOMPRESSED_SUFFIXES:
+            if candidate not in accepted:
+                continue
+            try:
+                sibling_st = os.stat(path + suffix)
+            except OSError:
+                continue
+            if sibling_st.st_mtime_ns >= st.st_mtime_ns:
+                source_path, source_st, encoding = path + suffix, sibling_st, candidate
+                break
+
+        # 事前圧縮ファイルがなければ、小さいテキスト系ファイルはその場で圧縮してキャッシュ
+        if encoding is None and ctype.startswith(COMPRESSIBLE_TYPES) and \
+                MIN_COMPRESS_SIZE <= st.st_size <= STATIC_CACHE_MAX_FILE:
+            encoding = choose_encoding(self.headers.get('Accept-Encoding'))
+
+        signature = (source_st.st_mtime_ns, source_st.st_size)
+        etag = f'"{st.st_mtime_ns:x}-{st.st_size:x}' + (f'-{encoding}"' if encoding else '"')
+        last_modified = formatdate(st.st_mtime, usegmt=True)
+        ext = os.path.splitext(path)[1].lower()
+        cache_control = STATIC_LONG_CACHE_CONTROL if ext in STATIC_LONG_CACHE_EXTENSIONS else 'no-cache'
+
+        if self.is_not_modified(etag, st.st_mtime):
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', cache_control)
+            self.send_header('Vary', 'Accept-Encoding')
+            self.end_headers()
+            return
+
+        body = None
+        if source_st.st_size <= STATIC_CACHE_MAX_FILE:
+            cache_key = (path, encoding)
+            body = STATIC_CACHE.get(cache_key, signature)
+            if body is None:
+                try:
+                    with open(source_path, 'rb') as f:
+                        body = f.read()
+                except OSError:
+                    self.send_error(404, "File not found")
+                    return
+                if encoding and source_path == path:
+                    body = compress_body(body, encoding)
+                STATIC_CACHE.put(cache_key, signature, body)
+
+        self.send_response(200)
+        self.send_header('Content-type', ctype)
+        self.send_header('Content-Length', str(len(body) if body is not None else source_st.st_size))
+        self.send_header('ETag', etag)
+        self.send_header('Last-Modified', last_modified)
+        self.send_header('Cache-Control', cache_control)
+        self.send_header('Vary', 'Accept-Encoding')
+        if encoding:
+            self.send_header('Content-Encoding', encoding)
+        self.end_headers()
+        if head_only:
+            return
+
+        if body is not None:
+            self.wfile.write(body)
+            return
+        # 大きいファイルはカーネル内でソケットへ直接転送する (os.sendfile)
+        try:
+            with open(source_path, 'rb') as f:
+                self.wfile.count += self.connection.sendfile(f, 0, source_st.st_size)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def is_not_modified(self, etag, mtime):
+        """If-None-Match / If-Modified-Since による条件付きGETの判定"""
+        if_none_match = self.headers.get('If-None-Match')
+        if if_none_match:
+            return etag_matches(if_none_match, etag)
+        if_modified_since = self.headers.get('If-Modified-Since')
+        if if_modified_since:
+            try:
+                since = parsedate_to_datetime(if_modified_since)
+            except (TypeError, ValueError, IndexError):
+                return False
+            if since is None:
+                return False
+            return int(mtime) <= since.timestamp()
+        return False
+    
+    def do_PUT(self):
+        # ライブ書き起こしの区間の音声: PUT /api/live/<id>/segments/<seq>
+        live = parse_live_path(self.path)
+        if live and live[1] == 'segments':
+            self.receive_live_segment(live[0], live[2])
+            return
+        # レコードの追加・置き換え: PUT /api/data/<collection>/<id>
+        target = parse_record_path(self.path)
+        if not target:
+            self.send_error(404, "Endpoint not found")
+            return
+        collection, record_id = target
+        try:
+            check_record_id(record_id)
+            record = self.read_json_body()
+            if not isinstance(record, dict):
+                raise RecordOpError(400, "Record must be an object")
+            record = {**record, 'id': record_id}
+            COLLECTION_CACHE.update(collection, [{'op': 'put', 'record': record}])
+            self.send_json({"success": True, "record": record})
+        except RecordOpError as e:
+            self.send_error_response(e.code, str(e))
+        except json.JSONDecodeError as e:
+            self.send_error_response(400, f"Invalid JSON: {str(e)}")
+        except Exception as e:
+            self.send_error_response(500, str(e))
+
+    def do_PATCH(self):
+        # レコードの部分更新: PATCH /api/data/<collection>/<id>
+        target = parse_record_path(self.path)
+        if not target:
+            self.send_error(404, "Endpoint not found")
+            return
+        collection, record_id = target
+        try:
+            check_record_id(record_id)
+            fields = self.read_json_body()
+            records = COLLECTION_CACHE.update(collection, [{'op': 'patch', 'id': record_id, 'fields': fields}])
+            record = next(r for r in records if isinstance(r, dict) and r.get('id') == record_id)
+            self.send_json({"success": True, "record": record})
+        except RecordOpError as e:
+            self.send_error_response(e.code, str(e))
+        except json.JSONDecodeError as e:
+            self.send_error_response(400, f"Invalid JSON: {str(e)}")
+        except Exception as e:
+            self.send_error_response(500, str(e))
+
+    def do_DELETE(self):
+        # ライブ書き起こしのセッションの破棄: DELETE /api/live/<id>
+        live = parse_live_path(self.path)
+        if live and not live[1]:
+            try:
+                LIVE.discard(live[0])
+                self.send_json({"success": True})
+            except LiveSessionError as e:
+                self.send_error_response(e.code, str(e))
+            return
+        # レコードの削除: DELETE /api/data/<collection>/<id>
+        target = parse_record_path(self.path)
+        if not target:
+            self.send_error(404, "Endpoint not found")
+            return
+        collection, record_id = target
+        try:
+            check_record_id(record_id)
+            records = COLLECTION_CACHE.get(collection)
+            if not any(isinstance(r, dict) and r.get('id') == record_id for r in records):
+                raise RecordOpError(404, f"Record not found: {record_id}")
+            COLLECTION_CACHE.update(collection, [{'op': 'delete', 'id': record_id}])
+            self.send_json({"success": True})
+        except RecordOpError as e:
+            self.send_error_response(e.code, str(e))
+        except Exception as e:
+            self.send_error_response(500, str(e))
+
+    def do_POST(self):
+        if self.path not in HEAVY_ROUTES:
+            self.route_post()
+            return
+
+        # 長時間処理の同時実行数を制限し、データAPI用のワーカーを確保する
+        if not self.acquire_heavy_slot():
+            self.send_busy_response("Server is busy with other AI requests. Please retry shortly.")
+            return
+        try:
+            self.route_post()
+        finally:
+            HEAVY_SLOTS.release()
+
+    def acquire_heavy_slot(self):
+        """長時間処理の枠を取得する。空いていなければ HEAVY_WAIT_SECONDS 秒まで空きを待つ"""
+        if HEAVY_SLOTS.acquire(blocking=False):
+            return True
+        if not HEAVY_WAIT_SECONDS or not HEAVY_WAITERS.acquire(blocking=False):
+            return False
+        try:
+            return HEAVY_SLOTS.acquire(timeout=HEAVY_WAIT_SECONDS)
+        finally:
+            HEAVY_WAITERS.release()
+
+    def route_post(self):
         # APIエンドポイント: /api/generate
         if self.path == '/api/generate':
             content_length = int(self.headers['Content-Length'])
@@ -147,6 +3876,7 @@ class ProxyHandler(http.server.SimpleHTTPRequestHandler):
                 data = json.loads(post_data)
                 user_goal = data.get('goal')
                 user_deadline = data.get('deadline')
+                stream = bool(data.get('stream'))
                 goal_type = data.get('goalType', '一般')
                 category = data.get('category', 'private')
                 level = data.get('level', 'intermediate')
@@ -171,7 +3901,6 @@ class ProxyHandler(http.server.SimpleHTTPRequestHandler):
                 }.get(level, '中級者向け')
 
                 # OpenAI APIへのリクエスト作成
-                openai_url = "https://api.openai.com/v1/chat/completions"
                 system_prompt = f"""
 あなたは経験豊富な学習コンサルタント兼タスクプランナーです。
 ユーザーの目標を達成するための**非常に具体的で実践的な**タスク計画を作成してください。
@@ -246,22 +3975,24 @@ class ProxyHandler(http.server.SimpleHTTPRequestHandler):
                     "response_format": {"type": "json_object"},
                     "temperature": 0.7
                 }
+                if stream:
+                    payload["stream"] = True
                 
-                req = urllib.request.Request(
-                    openai_url,
-                    data=json.dumps(payload).encode('utf-8'),
-                    headers={
-                        "Content-Type": "application/json",
-                        "Authorization": f"Bearer {api_key}"
-                    }
-                )
-                
-                with urllib.request.urlopen(req, timeout=60) as response:
-                    response_body = response.read()
-                    self.send_response(200)
-                    self.send_header('Content-type', 'application/json')
-                    self.end_headers()
-                    self.wfile.write(response_body)
+                if stream:
+                    # 通常レスポンスと同じ形 (choices[0].message.content) で最終結果を返す
+                    self.relay_chat_stream(payload, '/api/generate', lambda content: {
+                        "choices": [{"message": {"role": "assistant", "content": content}}]
+                    }, parse_json=True)
+                    return
+
+                content, cache_result = chat_completion('/api/generate', payload, timeout=60, bypass=self.llm_cache_bypass())
+                self.send_response(200)
+                self.send_header('Content-type', 'application/json')
+                self.send_header(LLM_CACHE_HEADER, cache_result)
+                self.end_headers()
+                self.wfile.write(json.dumps({
+                    "choices": [{"message": {"role": "assistant", "content": content}}]
+                }).encode('utf-8'))
                     
             except urllib.error.HTTPError as e:
                 error_body = e.read().decode('utf-8') if e.fp else str(e.reason)
@@ -280,17 +4011,48 @@ class ProxyHandler(http.server.SimpleHTTPRequestHandler):
             try:
                 data = json.loads(post_data)
                 text = data.get('text', '')
-                summary_type = data.get('type', 'summary')  # summary, minutes, actions
+                summary_type = data.get('type', 'summary')  # summary, minutes, actions, all (またはリスト)
                 title = data.get('title', '会議')
                 participants = data.get('participants', '')
+                stream = bool(data.get('stream'))
                 
                 api_key = os.environ.get('OPENAI_API_KEY')
                 if not api_key or api_key == 'your-api-key-here':
                     self.send_error_response(500, "OpenAI API Key is missing")
                     return
 
-                openai_url = "https://api.openai.com/v1/chat/completions"
-                
+                # 要約・議事録・アクションを1回の生成でまとめて作る
+                if summary_type == 'all' or isinstance(summary_type, list):
+                    types = [t for t in SUMMARY_TYPES if summary_type == 'all' or t in summary_type]
+                    if not types:
+                        self.send_error_response(400, f"type must be 'all' or a list of: {', '.join(SUMMARY_TYPES)}")
+                        return
+                    bypass = self.llm_cache_bypass()
+                    user_prompt = f"会議内容:\n{text}"
+                    if len(text) > SUMMARIZE_CHUNK_CHARS:
+                        user_prompt = f"会議内容（長い書き起こしをパートごとにまとめたメモ）:\n{condense_transcript(text, bypass)}"
+                    payload = {
+                        "model": "gpt-4o-mini",
+                        "messages": [
+                            {"role": "system", "content": combined_summary_prompt(types, title, participants)},
+                            {"role": "user", "content": user_prompt}
+                        ],
+                        "response_format": {"type": "json_object"},
+                        "temperature": 0.3
+                    }
+                    if stream:
+                        payload["stream"] = True
+                        self.relay_chat_stream(payload, '/api/summarize', lambda content: parse_combined_summary(content, types), parse_json=True)
+                        return
+
+                    content, cache_result = chat_completion('/api/summarize', payload, timeout=120, bypass=bypass)
+                    self.send_response(200)
+                    self.send_header('Content-type', 'application/json')
+                    self.send_header(LLM_CACHE_HEADER, cache_result)
+                    self.end_headers()
+                    self.wfile.write(json.dumps(parse_combined_summary(content, types)).encode('utf-8'))
+                    return
+
                 if summary_type == 'summary':
                     system_prompt = """あなたは会議の内容を要約するアシスタントです。
 以下の会議メモ・書き起こしから、重要なポイントを簡潔にまとめてください。
@@ -310,33 +4072,7 @@ class ProxyHandler(http.server.SimpleHTTPRequestHandler):
 - 参加者: {participants}
 
 ## 議事録フォーマット
-────────────────────────
-【議事録】{title}
-
-■ 会議概要
-・日時: [会議日時]
-・参加者: {participants or '[参加者]'}
-・目的: [会議の目的]
-
-■ 議題と討議内容
-1. [議題1]
-   - 討議内容
-   - 決定事項
-
-2. [議題2]
-   - 討議内容
-   - 決定事項
-
-■ 決定事項まとめ
-・[決定事項1]
-・[決定事項2]
-
-■ 次回までのアクション
-・[担当者]: [アクション内容] (期限: [日付])
-
-■ 次回会議予定
-[次回予定があれば記載]
-────────────────────────
+{minutes_template(title, participants)}
 
 日本語で出力してください。"""
 
@@ -377,29 +4113,28 @@ class ProxyHandler(http.server.SimpleHTTPRequestHandler):
                         ],
                         "temperature": 0.3
                     }
+                if stream:
+                    payload["stream"] = True
                 
-                req = urllib.request.Request(
-                    openai_url,
-                    data=json.dumps(payload).encode('utf-8'),
-                    headers={
-                        "Content-Type": "application/json",
-                        "Authorization": f"Bearer {api_key}"
-                    }
-                )
-                
-                with urllib.request.urlopen(req, timeout=60) as response:
-                    response_body = json.loads(response.read())
-                    content = response_body['choices'][0]['message']['content']
-                    
+                if stream:
                     if summary_type == 'actions':
-                        result = json.loads(content)
+                        self.relay_chat_stream(payload, '/api/summarize', json.loads, parse_json=True)
                     else:
-                        result = {"result": content}
-                    
-                    self.send_response(200)
-                    self.send_header('Content-type', 'application/json')
-                    self.end_headers()
-                    self.wfile.write(json.dumps(result).encode('utf-8'))
+                        self.relay_chat_stream(payload, '/api/summarize', lambda content: {"result": content})
+                    return
+
+                content, cache_result = chat_completion('/api/summarize', payload, timeout=60, bypass=self.llm_cache_bypass())
+                
+                if summary_type == 'actions':
+                    result = json.loads(content)
+                else:
+                    result = {"result": content}
+                
+                self.send_response(200)
+                self.send_header('Content-type', 'application/json')
+                self.send_header(LLM_CACHE_HEADER, cache_result)
+                self.end_headers()
+                self.wfile.write(json.dumps(result).encode('utf-8'))
                     
             except Exception as e:
                 self.send_error_response(500, str(e))
@@ -422,92 +4157,21 @@ class ProxyHandler(http.server.SimpleHTTPRequestHandler):
                     self.send_error_response(500, "OpenAI API Key is missing")
                     return
 
-                openai_url = "https://api.openai.com/v1/chat/completions"
-                
-                system_prompt = """あなたは書き起こしテキストを整形する専門家です。
-以下の音声書き起こしテキストを読みやすく整形してください。
-
-## 整形ルール
-1. **段落分け**: 話題の変わり目や話者の変更で適切に改行・段落を分ける
-2. **句読点**: 適切な位置に句点（。）と読点（、）を追加
-3. **話者の識別**: 明らかに話者が変わった場合は、空行を入れて区切る
-4. **見出し**: 大きなトピックの変わり目には見出し（■ や ### など）を追加
-5. **フィラー除去**: 「えーと」「あのー」などの不要なフィラーは削除
-6. **重複削除**: 言い直しや繰り返しは整理
-7. **漢字変換**: ひらがなで書かれた一般的な単語は適切に漢字に変換
-
-## 注意
-- 内容の意味は変えない
-- 専門用語はそのまま維持
-- 質疑応答がある場合は Q: A: 形式にする
-
-整形したテキストのみを出力してください。説明は不要です。"""
+                bypass = self.llm_cache_bypass()
+                if self.wants_async():
+                    # ジョブとして受け付け、結果は /api/jobs/<id> で返す
+                    job = JOBS.submit('format-transcript', lambda progress: {
+                        "text": format_transcript(text, bypass, progress)[0],
+                        "success": True
+                    })
+                    self.send_job_accepted(job)
+                    return
 
-                # Split long text into chunks (max ~8000 chars per chunk)
-                MAX_CHUNK_SIZE = 8000
-                text_length = len(text)
-                
-                print(f"📝 Formatting text: {text_length} chars")
-                
-                if text_length <= MAX_CHUNK_SIZE:
-                    # Short text - process directly
-                    chunks = [text]
-                else:
-                    # Split into chunks at sentence boundaries
-                    chunks = []
-                    current_pos = 0
-                    while current_pos < text_length:
-                        end_pos = min(current_pos + MAX_CHUNK_SIZE, text_length)
-                        # Try to find a good break point
-                        if end_pos < text_length:
-                            # Look for sentence endings
-                            for sep in ['。', '．', '. ', '\n\n', '\n', ' ']:
-                                last_sep = text.rfind(sep, current_pos, end_pos)
-                                if last_sep > current_pos + MAX_CHUNK_SIZE // 2:
-                                    end_pos = last_sep + len(sep)
-                                    break
-                        chunks.append(text[current_pos:end_pos])
-                        current_pos = end_pos
-                    print(f"   Split into {len(chunks)} chunks")
-                
-                formatted_parts = []
-                for i, chunk in enumerate(chunks):
-                    print(f"   Processing chunk {i+1}/{len(chunks)} ({len(chunk)} chars)...")
-                    
-                    chunk_prompt = system_prompt
-                    if len(chunks) > 1:
-                        chunk_prompt += f"\n\nこれはパート{i+1}/{len(chunks)}です。"
-                    
-                    payload = {
-                        "model": "gpt-4o-mini",
-                        "messages": [
-                            {"role": "system", "content": chunk_prompt},
-                            {"role": "user", "content": f"以下の書き起こしテキストを整形してください:\n\n{chunk}"}
-                        ],
-                        "temperature": 0.3,
-                        "max_tokens": 8000
-                    }
-                    
-                    req = urllib.request.Request(
-                        openai_url,
-                        data=json.dumps(payload).encode('utf-8'),
-                        headers={
-                            "Content-Type": "application/json",
-                            "Authorization": f"Bearer {api_key}"
-                        }
-                    )
-                    
-                    with urllib.request.urlopen(req, timeout=180) as response:
-                        response_body = json.loads(response.read())
-                        formatted_chunk = response_body['choices'][0]['message']['content']
-                        formatted_parts.append(formatted_chunk)
-                
-                # Combine all parts
-                formatted_text = '\n\n'.join(formatted_parts)
-                print(f"✅ Formatting complete: {len(formatted_text)} chars")
+                formatted_text, cache_result = format_transcript(text, bypass)
                 
                 self.send_response(200)
                 self.send_header('Content-type', 'application/json')
+                self.send_header(LLM_CACHE_HEADER, cache_result)
                 self.end_headers()
                 self.wfile.write(json.dumps({
                     "text": formatted_text,
@@ -520,261 +4184,137 @@ class ProxyHandler(http.server.SimpleHTTPRequestHandler):
         
         # APIエンドポイント: /api/transcribe (音声書き起こし - Whisper API)
         elif self.path == '/api/transcribe':
+            tmp_path = None
             try:
-                content_type = self.headers.get('Content-Type', '')
-                
-                if 'multipart/form-data' not in content_type:
-                    self.send_error_response(400, "Content-Type must be multipart/form-data")
-                    return
-                
-                # Parse multipart form data
-                import tempfile
-                import re
-                
-                content_length = int(self.headers['Content-Length'])
-                post_data = self.rfile.read(content_length)
-                
-                print(f"📥 Received audio data: {content_length} bytes")
-                
-                # Parse boundary (handle quotes and extra params)
-                boundary_match = re.search(r'boundary=([^;\s]+)', content_type)
-                if not boundary_match:
-                    self.send_error_response(400, "Could not find boundary in Content-Type")
-                    return
-                boundary = boundary_match.group(1).strip('"').encode()
+                content_length, boundary = self.check_upload_headers()
                 
-                parts = post_data.split(b'--' + boundary)
+                print(f"📥 Receiving audio data: {content_length} bytes")
+                upload = {}
+
+                def open_file(name, filename, part_type):
+                    # 音声のパートだけを一時ファイルへ書き込む (読みながら保存するのでメモリに載せない)
+                    if name not in ('audio', 'file') or 'file' in upload:
+                        return None
+                    ext, needs_conversion = audio_upload_extension(part_type, filename)
+                    if ext is None:
+                        raise MultipartError(415, f"音声・動画ファイルではありません（{part_type or filename}）")
+                    tmp = HashingWriter(tempfile.NamedTemporaryFile(suffix=ext, delete=False))
+                    upload.update(file=tmp, filename=filename, content_type=part_type, ext=ext,
+                                  needs_conversion=needs_conversion)
+                    return tmp
+
+                try:
+                    stream_multipart(self.rfile, content_length, boundary, open_file)
+                finally:
+                    if 'file' in upload:
+                        upload['file'].close()
+                        tmp_path = upload['file'].name
                 
-                audio_data = None
-                filename = 'audio.webm'
-                content_type_audio = 'audio/webm'
+                audio_size = Path(tmp_path).stat().st_size if tmp_path else 0
+                if audio_size < 100:
+                    print(f"❌ Audio data too small or empty: {audio_size} bytes")
+                    raise MultipartError(400, "No valid audio file provided")
                 
-                for part in parts:
-                    if b'name="audio"' in part or b'name="file"' in part:
-                        # Find the actual data after headers
-                        header_end = part.find(b'\r\n\r\n')
-                        if header_end != -1:
-                            audio_data = part[header_end + 4:]
-                            # Remove trailing boundary markers more carefully
-                            # Find the last occurrence of \r\n and remove from there
-                            last_newline = audio_data.rfind(b'\r\n')
-                            if last_newline > 0:
-                                audio_data = audio_data[:last_newline]
-                        
-                        # Extract filename and content-type if present
-                        header_part = part[:header_end].decode('utf-8', errors='ignore')
-                        if 'filename="' in header_part:
-                            filename = header_part.split('filename="')[1].split('"')[0]
-                        if 'Content-Type:' in header_part:
-                            ct_match = re.search(r'Content-Type:\s*([^\r\n]+)', header_part)
-                            if ct_match:
-                                content_type_audio = ct_match.group(1).strip()
-                        break
+                ext, needs_conversion = upload['ext'], upload['needs_conversion']
+                print(f"💾 Saved temp file: {tmp_path} ({audio_size} bytes, filename={upload['filename']}, type={upload['content_type']})")
                 
-                if not audio_data or len(audio_data) < 100:
-                    print(f"❌ Audio data too small or empty: {len(audio_data) if audio_data else 0} bytes")
-                    self.send_error_response(400, "No valid audio file provided")
+                # 同じ音声を書き起こし済みならそのまま返す (X-LLM-Cache: bypass で書き起こし直す)
+                cache_key = transcript_cache_key(upload['file'].sha256.hexdigest())
+                text = None if self.llm_cache_bypass() else TRANSCRIPT_CACHE.get(cache_key)
+                if text is not None:
+                    print(f"⚡ Transcript cache hit: {cache_key[:12]}")
+                    self.send_json({"text": text, "success": True, "cached": True})
                     return
-                
-                print(f"📝 Parsed audio: {len(audio_data)} bytes, filename={filename}, type={content_type_audio}")
-                
-                api_key = os.environ.get('OPENAI_API_KEY')
-                if not api_key or api_key == 'your-api-key-here':
-                    self.send_error_response(500, "OpenAI API Key is missing")
+
+                def transcribe(progress=None):
+                    text = transcribe_audio(audio_path, ext, needs_conversion, progress)
+                    TRANSCRIPT_CACHE.put(cache_key, text)
+                    return text
+
+                # 以降の一時ファイルの削除は transcribe_audio が行う
+                audio_path, tmp_path = tmp_path, None
+                if self.wants_async():
+                    job = JOBS.submit('transcribe', lambda progress: {
+                        "text": transcribe(progress),
+                        "success": True
+                    })
+                    self.send_job_accepted(job)
                     return
+
+                text = transcribe()
                 
-                # Determine file extension from Content-Type (more reliable than filename)
-                # Whisper API supported formats: flac, m4a, mp3, mp4, mpeg, mpga, oga, ogg, wav, webm
-                ext = '.webm'
-                needs_conversion = False
-                
-                # Content-Type takes priority over filename
-                if 'quicktime' in content_type_audio or 'mov' in content_type_audio:
-                    ext = '.mov'
-                    needs_conversion = True  # MOV not supported by Whisper
-                elif 'mp3' in content_type_audio:
-                    ext = '.mp3'
-                elif 'mp4' in content_type_audio:
-                    ext = '.mp4'
-                elif 'mpeg' in content_type_audio:
-                    ext = '.mp3'
-                elif 'wav' in content_type_audio:
-                    ext = '.wav'
-                elif 'm4a' in content_type_audio:
-                    ext = '.m4a'
-                elif 'ogg' in content_type_audio:
-                    ext = '.ogg'
-                elif 'flac' in content_type_audio:
-                    ext = '.flac'
-                elif 'webm' in content_type_audio:
-                    ext = '.webm'
-                elif filename and '.' in filename:
-                    # Fallback to filename extension
-                    file_ext = '.' + filename.rsplit('.', 1)[-1].lower()
-                    if file_ext in ['.webm', '.mp3', '.mp4', '.wav', '.m4a', '.ogg', '.flac', '.oga', '.mpga']:
-                        ext = file_ext
-                    elif file_ext in ['.mov', '.avi', '.mkv']:
-                        ext = file_ext
-                        needs_conversion = True
-                
-                # Save to temp file
-                import subprocess
-                
-                with tempfile.NamedTemporaryFile(suffix=ext, delete=False) as tmp:
-                    tmp.write(audio_data)
-                    tmp_path = tmp.name
-                
-                print(f"💾 Saved temp file: {tmp_path} ({len(audio_data)} bytes)")
-                
-                # Whisper API limit is 25MB - compress if needed
-                WHISPER_MAX_SIZE = 25 * 1024 * 1024  # 25MB
-                upload_path = tmp_path
-                compressed_path = None
-                
-                # Check if file has audio stream using ffprobe
-                def has_audio_stream(filepath):
-                    try:
-                        probe_result = subprocess.run([
-                            'ffprobe', '-v', 'error',
-                            '-select_streams', 'a',
-                            '-show_entries', 'stream=codec_type',
-                            '-of', 'csv=p=0',
-                            filepath
-                        ], capture_output=True, text=True, timeout=30)
-                        return 'audio' in probe_result.stdout
-                    except Exception:
-                        return True  # Assume it has audio if we can't check
-                
-                # For video files, check if audio exists
-                if ext in ['.mov', '.mp4', '.webm', '.mkv', '.avi']:
-                    if not has_audio_stream(tmp_path):
-                        raise Exception("このファイルには音声トラックが含まれていません。音声付きで録画するか、音声ファイルをアップロードしてください。")
-                
-                # Convert if format not supported by Whisper API or file too large
-                if needs_conversion or len(audio_data) > WHISPER_MAX_SIZE:
-                    reason = "非対応形式のため" if needs_conversion else f"サイズが大きいため({len(audio_data) // 1024 // 1024}MB > 25MB)"
-                    print(f"⚠️ {reason}、ffmpegで変換中...")
-                    
-                    # Check if ffmpeg is available
-                    ffmpeg_check = subprocess.run(['which', 'ffmpeg'], capture_output=True)
-                    if ffmpeg_check.returncode != 0:
-                        if needs_conversion:
-                            raise Exception(f"この形式（{ext}）はWhisper APIに対応していません。ffmpegをインストールするか、対応形式（mp3, mp4, wav, webm等）に変換してください。")
-                        else:
-                            raise Exception(f"ファイルサイズが大きすぎます（{len(audio_data) // 1024 // 1024}MB > 25MB）。ffmpegをインストールするか、より短い音声ファイルを使用してください。")
-                    
-                    # Convert/compress to mp3
-                    compressed_path = tmp_path.rsplit('.', 1)[0] + '_converted.mp3'
-                    
-                    # Get audio duration first to calculate optimal bitrate
-                    duration_result = subprocess.run([
-                        'ffprobe', '-v', 'error', '-show_entries', 'format=duration',
-                        '-of', 'default=noprint_wrappers=1:nokey=1', tmp_path
-                    ], capture_output=True, text=True, timeout=60)
-                    
-                    # Calculate optimal bitrate based on duration
-                    # Target: 24MB to have some margin (24 * 1024 * 1024 * 8 bits)
-                    target_size_bits = 24 * 1024 * 1024 * 8
-                    bitrate = '64k'  # Default
-                    
-                    if duration_result.returncode == 0 and duration_result.stdout.strip():
-                        try:
-                            duration_seconds = float(duration_result.stdout.strip())
-                            if duration_seconds > 0:
-                                # Calculate required bitrate (with 10% safety margin)
-                                calculated_bitrate = int(target_size_bits / duration_seconds * 0.9)
-                                # Clamp between 16kbps (minimum for speech) and 64kbps
-                                calculated_bitrate = max(16000, min(64000, calculated_bitrate))
-                                bitrate = f'{calculated_bitrate // 1000}k'
-                                print(f"📊 Duration: {duration_seconds:.1f}s, Calculated bitrate: {bitrate}")
-                        except ValueError:
-                            print("⚠️ Could not parse duration, using default 64k bitrate")
-                    
-                    compress_result = subprocess.run([
-                        'ffmpeg', '-y', '-i', tmp_path,
-                        '-vn',  # No video
-                        '-ar', '16000',  # 16kHz sample rate (good for speech)
-                        '-ac', '1',  # Mono
-                        '-b:a', bitrate,  # Dynamic bitrate
-                        '-f', 'mp3',
-                        compressed_path
-                    ], capture_output=True, text=True, timeout=300)
-                    
-                    if compress_result.returncode != 0:
-                        print(f"❌ ffmpeg conversion failed: {compress_result.stderr}")
-                        # Check if it's because no audio stream
-                        if 'does not contain any stream' in compress_result.stderr or 'Output file #0 does not contain' in compress_result.stderr:
-                            raise Exception("このファイルには音声トラックが含まれていません。音声付きで録画するか、音声ファイルをアップロードしてください。")
-                        raise Exception(f"音声変換に失敗しました: {compress_result.stderr[-300:]}")
-                    
-                    # Check converted size
-                    converted_size = Path(compressed_path).stat().st_size
-                    print(f"✅ Converted: {len(audio_data)} bytes → {converted_size} bytes (bitrate: {bitrate})")
-                    
-                    # If still too large, try with minimum bitrate
-                    if converted_size > WHISPER_MAX_SIZE:
-                        print(f"⚠️ Still too large ({converted_size // 1024 // 1024}MB), retrying with minimum bitrate (16k)...")
-                        compress_result2 = subprocess.run([
-                            'ffmpeg', '-y', '-i', tmp_path,
-                            '-vn', '-ar', '16000', '-ac', '1',
-                            '-b:a', '16k',  # Minimum bitrate for speech
-                            '-f', 'mp3',
-                            compressed_path
-                        ], capture_output=True, text=True, timeout=300)
-                        
-                        if compress_result2.returncode == 0:
-                            converted_size = Path(compressed_path).stat().st_size
-                            print(f"✅ Re-converted with 16k: {converted_size} bytes")
-                    
-                    if converted_size > WHISPER_MAX_SIZE:
-                        raise Exception(f"変換後もファイルが大きすぎます（{converted_size // 1024 // 1024}MB）。音声が長すぎます（最大約3時間まで）。より短い音声ファイルを使用してください。")
-                    
-                    upload_path = compressed_path
-                
-                try:
-                    # Call OpenAI Whisper API
-                    # Use curl for multipart upload (simpler than urllib for files)
-                    result = subprocess.run([
-                        'curl', '-s',
-                        'https://api.openai.com/v1/audio/transcriptions',
-                        '-H', f'Authorization: Bearer {api_key}',
-                        '-F', f'file=@{upload_path}',
-                        '-F', 'model=whisper-1',
-                        '-F', 'language=ja',
-                        '-F', 'response_format=json'
-                    ], capture_output=True, text=True, timeout=300)
-                    
-                    print(f"🔊 Whisper API response: {result.stdout[:200] if result.stdout else result.stderr}")
-                    
-                    if result.returncode != 0:
-                        raise Exception(f"Whisper API call failed: {result.stderr}")
-                    
-                    response_data = json.loads(result.stdout)
-                    
-                    # Check for API errors
-                    if 'error' in response_data:
-                        raise Exception(f"Whisper API error: {response_data['error'].get('message', response_data['error'])}")
-                    
-                    self.send_response(200)
-                    self.send_header('Content-type', 'application/json')
-                    self.end_headers()
-                    self.wfile.write(json.dumps({
-                        "text": response_data.get('text', ''),
-                        "success": True
-                    }).encode('utf-8'))
-                    
-                finally:
-                    # Clean up temp files
-                    for path in [tmp_path, compressed_path]:
-                        if path and Path(path).exists():
-                            Path(path).unlink()
-                    
+                self.send_response(200)
+                self.send_header('Content-type', 'application/json')
+                self.end_headers()
+                self.wfile.write(json.dumps({
+                    "text": text,
+                    "success": True
+                }).encode('utf-8'))
+            
+            except MultipartError as e:
+                # 本文を読み残している可能性があるので接続は使い回さない
+                self.close_connection = True
+                self.send_error_response(e.code, str(e))
             except Exception as e:
                 print(f"❌ Transcription error: {e}")
                 import traceback
                 traceback.print_exc()
                 self.send_error_response(500, str(e))
+            finally:
+                if tmp_path and Path(tmp_path).exists():
+                    Path(tmp_path).unlink()
         
+        # APIエンドポイント: /api/live (ライブ書き起こしのセッションを作成)
+        elif self.path == '/api/live':
+            api_key = os.environ.get('OPENAI_API_KEY')
+            if not api_key or api_key == 'your-api-key-here':
+                self.send_error_response(500, "OpenAI API Key is missing")
+                return
+            self.send_json(LIVE.create(), 201)
+
+        # APIエンドポイント: /api/live/<id>/finish (録音終了。残りの区間を書き起こして全文を返すジョブを登録)
+        elif parse_live_path(self.path) and parse_live_path(self.path)[1:] == ('finish', ''):
+            session_id = parse_live_path(self.path)[0]
+            try:
+                body = self.read_json_body()
+                total = body.get('segments') if isinstance(body, dict) else None
+                if not isinstance(total, int) or isinstance(total, bool) or total < 0:
+                    raise LiveSessionError(400, "segments must be a non-negative integer")
+                LIVE.finish(session_id, total)
+
+                def finish(progress=None):
+                    state = LIVE.wait_finished(session_id, progress)
+                    LIVE.discard(session_id)
+                    return {
+                        "text": state['text'],
+                        "success": True,
+                        "failed_segments": state['failed_segments']
+                    }
+
+                # 残りの書き起こしを待つ間ワーカーを塞がないよう、常にジョブとして受け付ける
+                self.send_job_accepted(JOBS.submit('transcribe', finish, executor=LIVE_FINISH_EXECUTOR))
+            except LiveSessionError as e:
+                self.send_error_response(e.code, str(e))
+            except json.JSONDecodeError as e:
+                self.send_error_response(400, f"Invalid JSON: {str(e)}")
+            except Exception as e:
+                self.send_error_response(500, str(e))
+
+        # APIエンドポイント: /api/data/<collection>/ops (レコード単位の一括更新)
+        elif parse_record_path(self.path) and parse_record_path(self.path)[1] == 'ops':
+            collection, _ = parse_record_path(self.path)
+            try:
+                body = self.read_json_body()
+                ops = body.get('ops') if isinstance(body, dict) else body
+                COLLECTION_CACHE.update(collection, ops)
+                self.send_json({"success": True, "applied": len(ops)})
+            except RecordOpError as e:
+                self.send_error_response(e.code, str(e))
+            except json.JSONDecodeError as e:
+                self.send_error_response(400, f"Invalid JSON: {str(e)}")
+            except Exception as e:
+                self.send_error_response(500, str(e))
+
         # APIエンドポイント: /api/data (データ保存)
         elif self.path == '/api/data':
             content_length = int(self.headers['Content-Length'])
@@ -785,11 +4325,11 @@ class ProxyHandler(http.server.SimpleHTTPRequestHandler):
                 
                 # 各データタイプを保存
                 if 'tasks' in data:
-                    save_json_file(TASKS_FILE, data['tasks'])
+                    COLLECTION_CACHE.save('tasks', data['tasks'])
                 if 'memos' in data:
-                    save_json_file(MEMOS_FILE, data['memos'])
+                    COLLECTION_CACHE.save('memos', data['memos'])
                 if 'projects' in data:
-                    save_json_file(PROJECTS_FILE, data['projects'])
+                    COLLECTION_CACHE.save('projects', data['projects'])
                 
                 self.send_response(200)
                 self.send_header('Content-type', 'application/json')
@@ -808,7 +4348,7 @@ class ProxyHandler(http.server.SimpleHTTPRequestHandler):
             
             try:
                 tasks = json.loads(post_data)
-                save_json_file(TASKS_FILE, tasks)
+                COLLECTION_CACHE.save('tasks', tasks)
                 
                 self.send_response(200)
                 self.send_header('Content-type', 'application/json')
@@ -825,7 +4365,7 @@ class ProxyHandler(http.server.SimpleHTTPRequestHandler):
             
             try:
                 memos = json.loads(post_data)
-                save_json_file(MEMOS_FILE, memos)
+                COLLECTION_CACHE.save('memos', memos)
                 
                 self.send_response(200)
                 self.send_header('Content-type', 'application/json')
@@ -842,7 +4382,7 @@ class ProxyHandler(http.server.SimpleHTTPRequestHandler):
             
             try:
                 projects = json.loads(post_data)
-                save_json_file(PROJECTS_FILE, projects)
+                COLLECTION_CACHE.save('projects', projects)
                 
                 self.send_response(200)
                 self.send_header('Content-type', 'application/json')
@@ -859,7 +4399,7 @@ class ProxyHandler(http.server.SimpleHTTPRequestHandler):
             
             try:
                 meetings = json.loads(post_data)
-                save_json_file(MEETINGS_FILE, meetings)
+                COLLECTION_CACHE.save('meetings', meetings)
                 
                 self.send_response(200)
                 self.send_header('Content-type', 'application/json')
@@ -876,7 +4416,7 @@ class ProxyHandler(http.server.SimpleHTTPRequestHandler):
             
             try:
                 planner = json.loads(post_data)
-                save_json_file(PLANNER_FILE, planner)
+                COLLECTION_CACHE.save('planner', planner)
                 
                 self.send_response(200)
                 self.send_header('Content-type', 'application/json')
@@ -889,7 +4429,324 @@ class ProxyHandler(http.server.SimpleHTTPRequestHandler):
         else:
             self.send_error(404, "Endpoint not found")
 
+    def read_json_body(self):
+        """リクエストボディをJSONとして読み込む"""
+        content_length = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(content_length) or b'null')
+
+    def send_json(self, data, code=200):
+        """データをJSONとして返す"""
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_cached_json(self, cached):
+        """
+        キャッシュ済みのJSONを返す
+        If-None-Match が一致すれば 304、Accept-Encoding に応じて圧縮済みボディを返す
+        ETag は圧縮形式ごとに変える (serve_static と同じく -gzip などを付ける) が、304 はどの形式の ETag でも返す
+        """
+        encoding = cached.content_encoding(self.headers.get('Accept-Encoding'))
+        etag = encoded_etag(cached.etag, encoding)
+        if_none_match = self.headers.get('If-None-Match')
+        if if_none_match and cached.matches(if_none_match):
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', 'no-cache')
+            self.send_header('Vary', 'Accept-Encoding')
+            self.end_headers()
+            return
+        if cached.streaming:
+            self.stream_json(cached, etag, encoding == 'gzip')
+            return
+
+        body, encoding = cached.encoded(encoding)
+        self.send_response(200)
+        self.send_header('Content-type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Vary', 'Accept-Encoding')
+        if encoding:
+            self.send_header('Content-Encoding', encoding)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def stream_json(self, cached, etag, gzip_stream):
+        """
+        大きいJSONを少しずつ送信する (HTTP/1.1 ならチャンク転送)
+        レスポンス全体をメモリに作らないため、コレクションの大きさに関わらずメモリ使用量は一定
+        """
+        chunked = self.request_version == 'HTTP/1.1'
+        if chunked:
+            # このレスポンスだけ HTTP/1.1 で返す (接続は終了後に閉じる)
+            self.protocol_version = 'HTTP/1.1'
+        self.send_response(200)
+        self.send_header('Content-type', 'application/json')
+        self.send_header('ETag', etag)
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Vary', 'Accept-Encoding')
+        if gzip_stream:
+            self.send_header('Content-Encoding', 'gzip')
+        if chunked:
+            self.send_header('Transfer-Encoding', 'chunked')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if gzip_stream else None
+
+        def send_chunk(data):
+            if not data:
+                return
+            if chunked:
+                self.wfile.write(b'%x\r\n' % len(data) + data + b'\r\n')
+            else:
+                self.wfile.write(data)
+
+        buffer = []
+        buffered = 0
+        for piece in cached.iter_pieces():
+            buffer.append(piece)
+            buffered += len(piece)
+            if buffered >= STREAM_CHUNK_SIZE:
+                data = b''.join(buffer)
+                send_chunk(compressor.compress(data) if compressor else data)
+                buffer = []
+                buffered = 0
+        data = b''.join(buffer)
+        send_chunk(compressor.compress(data) if compressor else data)
+        if compressor:
+            send_chunk(compressor.flush())
+        if chunked:
+            self.wfile.write(b'0\r\n\r\n')
+
+    def relay_chat_stream(self, payload, route, finish, parse_json=False):
+        """
+        OpenAI のストリーミング応答を Server-Sent Events としてブラウザへ中継する
+        event: delta (本文の差分) / partial (JSONの途中結果) / done (最終結果) / error
+        上流への接続エラーはヘッダー送信前に発生するため、呼び出し元で通常のエラーレスポンスになる
+        """
+        key = llm_cache_key(route, payload)
+        bypass = self.llm_cache_bypass()
+        if LLM_CACHE.enabled and not bypass:
+            cached, tier = LLM_CACHE.get(key)
+            if cached is not None:
+                # キャッシュ済みなら全文を1回で送る
+                METRICS.inc('task_dashboard_llm_cache_requests_total', result='hit', tier=tier)
+                self.start_event_stream('hit')
+                self.send_event('delta', {"content": cached})
+                partial = PartialJSON().feed(cached) if parse_json else None
+                if partial is not None:
+                    self.send_event('partial', partial)
+                self.send_event('done', finish(cached))
+                return
+        cache_result = 'bypass' if bypass else 'miss'
+        if LLM_CACHE.enabled:
+            METRICS.inc('task_dashboard_llm_cache_requests_total', result=cache_result, tier='none')
+
+        start = time.perf_counter()
+        with METRICS.timer('task_dashboard_upstream_request_duration_seconds', endpoint='chat/completions', route=route), \
+                send_chat_completion(route, payload, timeout=60) as response:
+            self.start_event_stream(cache_result)
+
+            assembler = PartialJSON() if parse_json else None
+            content = []
+            try:
+                for delta in iter_chat_stream(response):
+                    if not content:
+                        METRICS.observe('task_dashboard_upstream_first_token_seconds', time.perf_counter() - start, route=route)
+                    content.append(delta)
+                    self.send_event('delta', {"content": delta})
+                    partial = assembler.feed(delta) if assembler else None
+                    if partial is not None:
+                        self.send_event('partial', partial)
+                content = ''.join(content)
+                self.send_event('done', finish(content))
+                if LLM_CACHE.enabled:
+                    LLM_CACHE.put(key, content)
+            except (BrokenPipeError, ConnectionResetError):
+                # ブラウザ側が中断した場合は上流の読み込みもやめる
+                return
+            except Exception as e:
+                self.send_event('error', {"error": str(e)})
+
+    def start_event_stream(self, cache_result):
+        """Server-Sent Events のレスポンスヘッダーを送信"""
+        self.send_response(200)
+        self.send_header('Content-type', 'text/event-stream; charset=utf-8')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('X-Accel-Buffering', 'no')
+        self.send_header(LLM_CACHE_HEADER, cache_result)
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+
+    def check_upload_headers(self):
+        """
+        /api/transcribe のアップロードを本文を読む前に確認し、(Content-Length, boundary) を返す
+        受け付けられない場合は MultipartError を送出する
+        """
+        content_type = self.headers.get('Content-Type', '')
+        if 'multipart/form-data' not in content_type:
+            raise MultipartError(400, "Content-Type must be multipart/form-data")
+        if self.headers.get('Content-Length') is None:
+            raise MultipartError(411, "Content-Length is required")
+        try:
+            content_length = int(self.headers['Content-Length'])
+        except ValueError:
+            raise MultipartError(400, "Invalid Content-Length")
+        if content_length > MAX_UPLOAD_SIZE:
+            raise MultipartError(413, f"ファイルが大きすぎます（最大{MAX_UPLOAD_SIZE // 1024 // 1024}MB）")
+
+        api_key = os.environ.get('OPENAI_API_KEY')
+        if not api_key or api_key == 'your-api-key-here':
+            raise MultipartError(500, "OpenAI API Key is missing")
+
+        # Parse boundary (handle quotes and extra params)
+        boundary = next((param.strip()[len('boundary='):].strip('"') for param in content_type.split(';')
+                         if param.strip().startswith('boundary=')), '')
+        if not boundary:
+            raise MultipartError(400, "Could not find boundary in Content-Type")
+        return content_length, boundary.encode()
+
+    def handle_expect_100(self):
+        # Expect: 100-continue 付きのアップロードは、受け付けられなければ本文を送らせる前に断る
+        if self.command == 'POST' and urllib.parse.urlsplit(self.path).path == '/api/transcribe':
+            try:
+                self.check_upload_headers()
+            except MultipartError as e:
+                self.close_connection = True
+                self.send_error_response(e.code, str(e))
+                return False
+        return super().handle_expect_100()
+
+    def receive_live_segment(self, session_id, seq):
+        """
+        PUT /api/live/<id>/segments/<seq>: 本文の音声を一時ファイルに保存し、セッションに登録する
+        本文は multipart ではなく音声そのもの (Content-Type は音声の形式)
+        """
+        tmp_path = None
+        try:
+            if not seq.isdigit():
+                raise LiveSessionError(404, "Endpoint not found")
+            if self.headers.get('Content-Length') is None:
+                raise LiveSessionError(411, "Content-Length is required")
+            try:
+                content_length = int(self.headers['Content-Length'])
+            except ValueError:
+                raise LiveSessionError(400, "Invalid Content-Length")
+            if content_length > WHISPER_MAX_SIZE:
+                raise LiveSessionError(413, f"区間が大きすぎます（最大{WHISPER_MAX_SIZE // 1024 // 1024}MB）")
+            ext, needs_conversion = audio_upload_extension(self.headers.get('Content-Type'), '')
+            if ext is None:
+                raise LiveSessionError(415, f"音声・動画ファイルではありません（{self.headers.get('Content-Type')}）")
+            with LIVE.uploading(session_id):
+                with tempfile.NamedTemporaryFile(suffix=ext, delete=False) as tmp:
+                    tmp_path = tmp.name
+                    remaining = content_length
+                    while remaining > 0:
+                        chunk = self.rfile.read(min(MULTIPART_CHUNK_SIZE, remaining))
+                        if not chunk:
+                            raise LiveSessionError(400, "Upload ended before Content-Length bytes")
+                        tmp.write(chunk)
+                        remaining -= len(chunk)
+
+                # 以降の一時ファイルの削除はセッションが行う
+                path, tmp_path = tmp_path, None
+                state = LIVE.add_segment(session_id, int(seq), path, ext, needs_conversion)
+            self.send_json(state)
+        except LiveSessionError as e:
+            # 本文を読み残している可能性があるので接続は使い回さない
+            self.close_connection = True
+            self.send_error_response(e.code, str(e))
+        except Exception as e:
+            print(f"❌ Live segment upload error: {e}")
+            self.close_connection = True
+            self.send_error_response(500, str(e))
+        finally:
+            if tmp_path and Path(tmp_path).exists():
+                Path(tmp_path).unlink()
+
+    def llm_cache_bypass(self):
+        """X-LLM-Cache: bypass が指定されていればキャッシュを使わない"""
+        return self.headers.get(LLM_CACHE_HEADER, '').strip().lower() == 'bypass'
+
+    def wants_async(self):
+        """Prefer: respond-async が指定されていればジョブとして受け付ける"""
+        return 'respond-async' in self.headers.get('Prefer', '')
+
+    def send_job_accepted(self, job):
+        """ジョブ受付のレスポンス (202 Accepted)"""
+        body = json.dumps(job, ensure_ascii=False).encode('utf-8')
+        self.send_response(202)
+        self.send_header('Content-type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Location', f"/api/jobs/{job['id']}")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def stream_job(self, job):
+        """ジョブの状態が変わるたびに Server-Sent Events で送信し、完了したら終了する"""
+        self.stream_updates(job, lambda job: JOBS.wait(job['id'], job['version'], timeout=15),
+                            lambda job: job['status'] in JobQueue.TERMINAL)
+
+    def stream_updates(self, state, wait, finished):
+        """
+        状態を Server-Sent Events で送信し、wait(state) で次の状態を待って送ることを繰り返す
+        finished(state) が真になるか、wait が None を返したら終了する
+        同時接続数は STREAM_SLOTS で制限し、超えた場合は 503 を返す
+        """
+        if not STREAM_SLOTS.acquire(blocking=False):
+            self.send_busy_response("Too many event streams. Poll the status URL instead.")
+            return
+        try:
+            self._stream_updates(state, wait, finished)
+        finally:
+            STREAM_SLOTS.release()
+
+    def _stream_updates(self, state, wait, finished):
+        self.send_response(200)
+        self.send_header('Content-type', 'text/event-stream; charset=utf-8')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('X-Accel-Buffering', 'no')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+        try:
+            while state is not None:
+                self.send_event('message', state)
+                if finished(state):
+                    return
+                # 変化がなくても定期的に送って接続を維持する
+                state = wait(state)
+        except (BrokenPipeError, ConnectionResetError):
+            return
+
+    def send_event(self, event, data):
+        """Server-Sent Events のイベントを1件送信"""
+        self.wfile.write(f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n".encode('utf-8'))
+        self.wfile.flush()
+
+    def send_busy_response(self, message, retry_after=5):
+        """同時実行数の上限に達しているときの 503 (Retry-After 付き)"""
+        body = json.dumps({"error": message}).encode('utf-8')
+        self.send_response(503)
+        self.send_header('Content-type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Retry-After', str(retry_after))
+        self.end_headers()
+        self.wfile.write(body)
+
     def send_error_response(self, code, message):
+        if self._headers_sent:
+            # ストリーミング中などヘッダー送信後の失敗は、本文に別のレスポンスを混ぜず接続を閉じて終える
+            print(f"⚠️ Response aborted after headers were sent: {message}")
+            self.close_connection = True
+            return
         self.send_response(code)
         self.send_header('Content-type', 'application/json')
         self.end_headers()
@@ -899,34 +4756,70 @@ class ProxyHandler(http.server.SimpleHTTPRequestHandler):
         # カスタムログ形式
         print(f"[{datetime.now().strftime('%H:%M:%S')}] {args[0]}")
 
-print("=" * 50)
-print("🚀 Task Command Center - PWA Server")
-print("=" * 50)
-print(f"📍 Server running at: http://localhost:{PORT}")
-print(f"📍 API Endpoints:")
-print(f"   - /api/generate    (AI Task Planning)")
-print(f"   - /api/summarize   (Meeting Summarization)")
-print(f"   - /api/transcribe  (Whisper Speech-to-Text)")
-print(f"   - /api/data        (Data Storage - GET/POST)")
-print("")
-print(f"💾 Data Storage:")
-print(f"   - {DATA_DIR}/")
-print(f"   - tasks.json, memos.json, projects.json")
-print("")
-
-api_key = os.environ.get('OPENAI_API_KEY', '')
-if api_key and api_key != 'your-api-key-here':
-    print(f"✅ API Key loaded (ends with: ...{api_key[-4:]})")
-else:
-    print("⚠️  WARNING: OPENAI_API_KEY not set in .env file!")
-    print("   Create a .env file with: OPENAI_API_KEY=your-key-here")
-
-print("")
-print("Press Ctrl+C to stop the server")
-print("=" * 50)
-
-with socketserver.TCPServer(("", PORT), ProxyHandler) as httpd:
-    try:
-        httpd.serve_forever()
-    except KeyboardInterrupt:
-        print("\n👋 Server stopped")
+def handle_sigterm(signum, frame):
+    """SIGTERMでもCtrl+Cと同様に後処理してから終了する"""
+    raise KeyboardInterrupt
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Task Command Center - PWA Server')
+    parser.add_argument('--migrate-to-sqlite', action='store_true',
+                        help='data/*.json の内容をSQLiteデータベースに取り込んで終了')
+    parser.add_argument('--export-json', action='store_true',
+                        help='SQLiteデータベースの内容を data/*.json に書き出して終了')
+    args = parser.parse_args()
+
+    if args.migrate_to_sqlite or args.export_json:
+        sqlite_storage = STORAGE if isinstance(STORAGE, SqliteStorage) else SqliteStorage(SQLITE_PATH, COLLECTIONS)
+        if args.migrate_to_sqlite:
+            migrate_json_to_sqlite(sqlite_storage, COLLECTIONS)
+        else:
+            export_sqlite_to_json(sqlite_storage, COLLECTIONS)
+        print(f"✅ Done ({SQLITE_PATH})")
+        return
+
+    signal.signal(signal.SIGTERM, handle_sigterm)
+    print("=" * 50)
+    print("🚀 Task Command Center - PWA Server")
+    print("=" * 50)
+    print(f"📍 Server running at: http://localhost:{PORT}")
+    print(f"📍 API Endpoints:")
+    print(f"   - /api/generate    (AI Task Planning)")
+    print(f"   - /api/summarize   (Meeting Summarization)")
+    print(f"   - /api/transcribe  (Whisper Speech-to-Text)")
+    print(f"   - /api/data        (Data Storage - GET/POST)")
+    print(f"⚙️  Workers: {MAX_WORKERS} (AI/変換処理の同時実行: 最大{MAX_HEAVY_REQUESTS})")
+    print("")
+    print(f"💾 Data Storage:")
+    if STORAGE.name == 'sqlite':
+        print(f"   - {SQLITE_PATH} (SQLite)")
+    elif STORAGE.name == 'journal':
+        print(f"   - {DATA_DIR}/ (journal: {JOURNAL_PATH.name})")
+    else:
+        print(f"   - {DATA_DIR}/")
+        print(f"   - tasks.json, memos.json, projects.json")
+    print("")
+
+    api_key = os.environ.get('OPENAI_API_KEY', '')
+    if api_key and api_key != 'your-api-key-here':
+        print(f"✅ API Key loaded (ends with: ...{api_key[-4:]})")
+    else:
+        print("⚠️  WARNING: OPENAI_API_KEY not set in .env file!")
+        print("   Create a .env file with: OPENAI_API_KEY=your-key-here")
+
+    print("")
+    print("Press Ctrl+C to stop the server")
+    print("=" * 50)
+
+    with PooledHTTPServer(("", PORT), ProxyHandler) as httpd:
+        try:
+            httpd.serve_forever()
+        except KeyboardInterrupt:
+            print("\n👋 Server stopped")
+        finally:
+            # 書き込み待ちのデータを保存してから終了
+            STORAGE.flush()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,36 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('TASK_DASHBOARD_DATA_DIR', tempfile.mkdtemp())
+
+from server import JournalStorage  # noqa: E402
+
+
+def open_storage(tmp_path):
+    collections = {'memos': (tmp_path / 'memos.json', list)}
+    return JournalStorage(collections, tmp_path / 'journal.log', compact_interval=3600, max_bytes=1 << 30, fsync=False)
+
+
+def test_append_after_torn_tail_survives_reload(tmp_path):
+    m1, m2, m3 = ({'id': f'm{i}'} for i in (1, 2, 3))
+    storage = open_storage(tmp_path)
+    storage.save('memos', [m1])
+    storage.apply_ops('memos', [{'op': 'put', 'record': m2}], [m1, m2])
+    storage.compact()
+    storage._file.close()
+
+    # 追記の途中でプロセスが落ちた状態 (改行のない書きかけの行だけが残る)
+    with open(tmp_path / 'journal.log', 'ab') as f:
+        f.write(b'{"seq":3,"ts":1,"collection":"memos","type":"ops","ops":[{"op":"put","rec')
+
+    storage = open_storage(tmp_path)
+    assert storage.load('memos')[1] == [m1, m2]
+    storage.apply_ops('memos', [{'op': 'put', 'record': m3}], [m1, m2, m3])
+    storage._file.close()
+
+    storage = open_storage(tmp_path)
+    assert storage.load('memos')[1] == [m1, m2, m3]
+    storage._file.close()